@@ -12,4 +12,7 @@ from .compare import (
     greater_than_or_equal_to, ge,
 )
 
+from .analyze import Profile, analyze, explain_analyze
+from .evaluate import Operation, evaluate_with
+from .schedule import evaluate_async, evaluate_concurrently
 from .visualize import resolve
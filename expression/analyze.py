@@ -0,0 +1,186 @@
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Iterator, Optional
+
+from .binary import InfixBinaryOperation
+from .expression import Expression
+from .unary import PrefixUnaryOperation
+from .visualize import print_tree
+
+
+Size = Callable[[Any], Optional[int]]
+
+def get_len(value: Any) -> Optional[int]:
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def format_bytes(n: int) -> str:
+    value = float(n)
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.4g}{unit}"
+        value /= 1024
+    return f"{value:.4g}GiB"
+
+
+class Profile:
+    """
+    What it cost to evaluate one node of an expression, along with the
+    profiles of its children.
+
+    seconds and peak_bytes only cover the node's own operator, not its
+    children: the time it took, and the most memory it held at once beyond
+    what was already allocated when it started (None if memory was not
+    traced). rows is the size of its value, if it has one.
+    A node whose value was already known, such as a subtree that appears
+    twice, is marked as cached and costs nothing.
+    """
+    name: str
+    seconds: float
+    peak_bytes: Optional[int]
+    rows: Optional[int]
+    cached: bool
+    children: tuple["Profile", ...]
+
+    def __init__(
+            self,
+            name: str,
+            seconds: float = 0.0,
+            peak_bytes: Optional[int] = None,
+            rows: Optional[int] = None,
+            cached: bool = False,
+            children: tuple["Profile", ...] = (),
+    ):
+        self.name = name
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.rows = rows
+        self.cached = cached
+        self.children = children
+
+    @property
+    def input_rows(self) -> tuple[Optional[int], ...]:
+        return tuple(child.rows for child in self.children)
+
+    @property
+    def selectivity(self) -> Optional[float]:
+        """
+        The fraction of the inputs kept by the node, counting every pair of
+        inputs for a binary node (like the selectivity of a join).
+        """
+        if self.rows is None or len(self.children) == 0:
+            return None
+        pairs = 1
+        for rows in self.input_rows:
+            if rows is None:
+                return None
+            pairs *= rows
+        return self.rows / pairs if pairs > 0 else None
+
+    @property
+    def total_seconds(self) -> float:
+        return self.seconds + sum(child.total_seconds for child in self.children)
+
+    def walk(self) -> Iterator["Profile"]:
+        """
+        Yields every profile in the tree, children before their parent.
+        """
+        for child in self.children:
+            yield from child.walk()
+        yield self
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "total_seconds": self.total_seconds,
+            "peak_bytes": self.peak_bytes,
+            "rows": self.rows,
+            "input_rows": list(self.input_rows),
+            "selectivity": self.selectivity,
+            "cached": self.cached,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def __str__(self) -> str:
+        fields: list[str] = []
+        if len(self.children) > 0:
+            fields.append("cached" if self.cached else f"time={self.seconds * 1000:.3g}ms")
+        if self.rows is not None:
+            fields.append(f"rows={self.rows}")
+        selectivity = self.selectivity
+        if selectivity is not None:
+            fields.append(f"selectivity={selectivity:.3g}")
+        if self.peak_bytes is not None and not self.cached:
+            fields.append(f"peak={format_bytes(self.peak_bytes)}")
+        return " ".join(fields)
+
+
+def analyze(
+        x: Expression[Any],
+        size: Size = get_len,
+        trace_memory: bool = True,
+) -> Profile:
+    """
+    Evaluates the expression like get() would, timing each operation and
+    measuring the size of its value with size (len by default).
+
+    Sizes are measured as part of the operation that produced them, so the
+    cost of a lazy value is charged to the node that produces it rather than
+    to the one that first consumes it.
+    Tracing memory slows evaluation down, so the times are only comparable
+    across nodes of the same analysis.
+    """
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        return _analyze(x, size, trace_memory)
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+def _analyze(x: Expression[Any], size: Size, trace_memory: bool) -> Profile:
+    if not isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation)):
+        return Profile(x.rootname, rows=size(x.get()))
+
+    children = tuple(_analyze(child, size, trace_memory) for child in x.children)
+    if x.is_evaluated:
+        return Profile(x.rootname, rows=size(x.get()), cached=True, children=children)
+
+    values = [child.get() for child in x.children]
+    current = 0
+    if trace_memory:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    start = perf_counter()
+    value = x.f(*values)
+    rows = size(value)
+    seconds = perf_counter() - start
+    peak_bytes = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes = peak - current
+
+    x.set_value(value)
+    return Profile(x.rootname, seconds, peak_bytes, rows, children=children)
+
+
+def explain_analyze(
+        x: Expression[Any],
+        size: Size = get_len,
+        trace_memory: bool = True,
+        prefix: str = "",
+        indent: str = " ",
+) -> Profile:
+    """
+    Analyzes the expression and prints its tree like resolve, annotating each
+    node with its profile instead of its value.
+    """
+    profile = analyze(x, size=size, trace_memory=trace_memory)
+    profiles = profile.walk()
+    print_tree(x, lambda _: [str(next(profiles))], prefix=prefix, indent=indent)
+    return profile
@@ -1,7 +1,7 @@
-from typing import Callable, Generic, TypeVar
+from typing import Any, Callable, ClassVar, Generic, TypeVar
 from functools import cached_property
 
-from .expression import Expression, as_expression, Value
+from .expression import Expression, as_expression, find_global, Value
 
 L = TypeVar("L", contravariant=True)
 R = TypeVar("R", contravariant=True)
@@ -44,6 +44,32 @@ class InfixBinaryOperation(Expression[T], Generic[L, R, T]):
     def _value(self) -> T:
         return self.f(self.left_child.get(), self.right_child.get())
 
+    @property
+    def is_evaluated(self) -> bool:
+        return "_value" in self.__dict__
+
+    def set_value(self, value: Any) -> None:
+        """
+        Keeps a value computed elsewhere, such as by an executor, as if get()
+        had computed it.
+        """
+        self._value = value
+
+    def __getstate__(self) -> dict[str, Any]:
+        # a decorated function is pickled through its operator, which took its name
+        state = dict(vars(self))
+        operator = InfixBinaryOperator.decorated.get(self.f)
+        if operator is not None:
+            del state["f"]
+            state["operator"] = operator
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        operator = state.pop("operator", None)
+        if operator is not None:
+            state["f"] = operator.f
+        vars(self).update(state)
+
 
 class LeftPartialInfixBinaryOperator(Generic[L, R, T]):
     def __init__(
@@ -84,6 +110,9 @@ class RightPartialInfixBinaryOperator(Generic[L, R, T]):
         )
 
 class InfixBinaryOperator(Generic[L, R, T]):
+    # the operator that each decorated function was turned into
+    decorated: ClassVar[dict[Callable[..., Any], "InfixBinaryOperator[Any, Any, Any]"]] = {}
+
     def __init__(
             self,
             f: Callable[[L, R], T],
@@ -113,9 +142,19 @@ class InfixBinaryOperator(Generic[L, R, T]):
             right_child=right_child,
         )
 
+    def __reduce__(self) -> tuple[Any, ...]:
+        if InfixBinaryOperator.decorated.get(self.f) is not self:
+            return type(self), (self.f, self.name)
+        # a decorated operator is bound to the name of its function instead
+        return find_global, (self.f.__module__, self.f.__qualname__)
+
     @classmethod
     def decorate(cls, name: str) -> Callable[
         [Callable[[L, R], T]],
         "InfixBinaryOperator[L, R, T]",
     ]:
-        return lambda f: cls(f, name=name)
+        def decorator(f: Callable[[L, R], T]) -> InfixBinaryOperator[L, R, T]:
+            operator = cls(f, name=name)
+            cls.decorated[f] = operator
+            return operator
+        return decorator
@@ -0,0 +1,35 @@
+from typing import Any, Callable, Optional, TypeVar, Union
+
+from .binary import InfixBinaryOperation
+from .expression import Expression
+from .unary import PrefixUnaryOperation
+
+
+T = TypeVar("T")
+
+Operation = Union[PrefixUnaryOperation[Any, Any], InfixBinaryOperation[Any, Any, Any]]
+
+def evaluate_with(
+        x: Expression[T],
+        apply: Callable[[Operation, list[Any]], Any],
+        reuse: Optional[Callable[[Operation], None]] = None,
+) -> T:
+    """
+    Evaluates the expression bottom-up like get() would, except that the
+    value of each operation is computed by apply(operation, values of its
+    children). Values are kept on the operations, so an operation that has
+    been evaluated before, or appears twice, is not computed again.
+
+    reuse, if given, sees each operation before its children are evaluated,
+    and may give it a value with set_value to skip its whole subtree.
+    """
+    if not isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation)) or x.is_evaluated:
+        return x.get()
+    if reuse is not None:
+        reuse(x)
+        if x.is_evaluated:
+            return x.get()
+    values = [evaluate_with(child, apply, reuse) for child in x.children]
+    value = apply(x, values)
+    x.set_value(value)
+    return value
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from functools import cached_property
+from functools import cached_property, reduce
+from importlib import import_module
 from typing import Any, Generic, Optional, TypeVar, Union
 
 L = TypeVar("L", contravariant=True)
@@ -71,3 +72,11 @@ def as_expression(value: Value[T]) -> Expression[T]:
         # no good way to avoid T
         return value # type: ignore
     return Constant(value)
+
+
+def find_global(module: str, qualname: str) -> Any:
+    """
+    Returns the object with the given qualified name in the given module, for
+    pickle to find an object by the name it is bound to.
+    """
+    return reduce(getattr, qualname.split("."), import_module(module))
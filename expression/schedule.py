@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional, TypeVar
+
+from .binary import InfixBinaryOperation, InfixBinaryOperator
+from .expression import Expression
+from .unary import PrefixUnaryOperation, PrefixUnaryOperator
+
+
+T = TypeVar("T")
+
+def apply_operator(operator: Any, *values: Any) -> Any:
+    # sent to the executor instead of a decorated function, which only
+    # pickles through the operator that took its name
+    return operator.f(*values)
+
+async def evaluate_async(x: Expression[T], executor: Optional[Executor] = None) -> T:
+    """
+    Evaluates the expression, running each operation on the executor as soon
+    as its children are ready, so that independent subtrees run concurrently.
+    For example, in (A + B) × (C + D) both sums run at the same time.
+
+    The executor defaults to the event loop's thread pool. With a process
+    pool, the operators and their values must be picklable.
+    An expression that appears several times in the tree is only evaluated
+    once, and every evaluated operation keeps its value like get() would.
+    """
+    loop = asyncio.get_running_loop()
+    tasks: dict[int, "asyncio.Future[Any]"] = {}
+
+    def schedule(node: Expression[Any]) -> "asyncio.Future[Any]":
+        if id(node) not in tasks:
+            tasks[id(node)] = asyncio.ensure_future(run(node))
+        return tasks[id(node)]
+
+    async def run(node: Expression[Any]) -> Any:
+        if not isinstance(node, (PrefixUnaryOperation, InfixBinaryOperation)):
+            return node.get()
+        if node.is_evaluated:
+            return node.get()
+        values = await asyncio.gather(*(schedule(child) for child in node.children))
+        f: Callable[..., Any] = node.f
+        if isinstance(node, PrefixUnaryOperation):
+            operator = PrefixUnaryOperator.decorated.get(f)
+        else:
+            operator = InfixBinaryOperator.decorated.get(f)
+        if operator is None:
+            value = await loop.run_in_executor(executor, f, *values)
+        else:
+            value = await loop.run_in_executor(executor, apply_operator, operator, *values)
+        node.set_value(value)
+        return value
+
+    return await schedule(x)
+
+def evaluate_concurrently(x: Expression[T], executor: Optional[Executor] = None) -> T:
+    """
+    Runs evaluate_async to completion from synchronous code.
+    """
+    return asyncio.run(evaluate_async(x, executor))
@@ -1,7 +1,7 @@
-from typing import Callable, Generic, TypeVar
+from typing import Any, Callable, ClassVar, Generic, TypeVar
 from functools import cached_property
 
-from .expression import Expression, as_expression, Value
+from .expression import Expression, as_expression, find_global, Value
 
 R = TypeVar("R", contravariant=True)
 T = TypeVar("T", covariant=True)
@@ -37,8 +37,37 @@ class PrefixUnaryOperation(Expression[T], Generic[R, T]):
     def _value(self) -> T:
         return self.f(self.right_child.get())
 
+    @property
+    def is_evaluated(self) -> bool:
+        return "_value" in self.__dict__
+
+    def set_value(self, value: Any) -> None:
+        """
+        Keeps a value computed elsewhere, such as by an executor, as if get()
+        had computed it.
+        """
+        self._value = value
+
+    def __getstate__(self) -> dict[str, Any]:
+        # a decorated function is pickled through its operator, which took its name
+        state = dict(vars(self))
+        operator = PrefixUnaryOperator.decorated.get(self.f)
+        if operator is not None:
+            del state["f"]
+            state["operator"] = operator
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        operator = state.pop("operator", None)
+        if operator is not None:
+            state["f"] = operator.f
+        vars(self).update(state)
+
 
 class PrefixUnaryOperator(Generic[R, T]):
+    # the operator that each decorated function was turned into
+    decorated: ClassVar[dict[Callable[..., Any], "PrefixUnaryOperator[Any, Any]"]] = {}
+
     def __init__(self, f: Callable[[R], T], name: str):
         self.f = f
         self.name = name
@@ -53,9 +82,19 @@ class PrefixUnaryOperator(Generic[R, T]):
     def __or__(self, right_child: Value[R]) -> PrefixUnaryOperation[R, T]:
         return self(right_child)
 
+    def __reduce__(self) -> tuple[Any, ...]:
+        if PrefixUnaryOperator.decorated.get(self.f) is not self:
+            return type(self), (self.f, self.name)
+        # a decorated operator is bound to the name of its function instead
+        return find_global, (self.f.__module__, self.f.__qualname__)
+
     @classmethod
     def decorate(cls, name: str) -> Callable[
         [Callable[[R], T]],
         "PrefixUnaryOperator[R, T]",
     ]:
-        return lambda f: cls(f, name=name)
+        def decorator(f: Callable[[R], T]) -> PrefixUnaryOperator[R, T]:
+            operator = cls(f, name=name)
+            cls.decorated[f] = operator
+            return operator
+        return decorator
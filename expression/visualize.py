@@ -1,4 +1,4 @@
-from typing import Any, Optional, TypeVar
+from typing import Any, Callable, Optional, TypeVar
 
 from .expression import Expression
 
@@ -16,12 +16,17 @@ def get_print_width(x: Expression[Any], indent: int) -> int:
         )
     return len(x.rootname)
 
-def resolve(
-        x: Expression[T],
+def print_tree(
+        x: Expression[Any],
+        describe: Callable[[Expression[Any]], list[str]],
         prefix: str = "",
         indent: str = " ",
         width: Optional[int] = None,
-) -> T:
+) -> None:
+    """
+    Prints the expression tree, with the lines given by describe for each
+    node next to its name. Children are described before their parent.
+    """
     if width is None:
         width = len(prefix) + get_print_width(x, indent=1+len(indent))
 
@@ -31,8 +36,9 @@ def resolve(
     if len(x.left_children) > 0:
         child_prefix = prefix + ("\u2524" if x.is_infix else "\u2502") + indent
         for child in x.left_children:
-            resolve(
+            print_tree(
                 child,
+                describe,
                 prefix=child_prefix,
                 indent=indent,
                 width=width,
@@ -44,8 +50,9 @@ def resolve(
     if len(x.right_children) > 0:
         child_prefix = prefix + ("\u251c" if x.is_infix else "\u2502") + indent
         for child in x.right_children:
-            resolve(
+            print_tree(
                 child,
+                describe,
                 prefix=child_prefix,
                 indent=indent,
                 width=width,
@@ -55,11 +62,23 @@ def resolve(
         print(prefix + "\u251c\u2500")
 
     try:
-        lines = repr(x.get()).splitlines()
-        print(f"{(prefix + x.rootname).ljust(width)}  = {lines[0]}")
+        lines = describe(x)
+        print(f"{(prefix + x.rootname).ljust(width)}  {lines[0]}")
         for line in lines[1:]:
             print(f"{prefix.ljust(width + 4)}{line}")
     except Exception as e:
         print(f"{(prefix + x.rootname).ljust(width)}  ERROR: {e}")
         raise
+
+def describe_value(x: Expression[Any]) -> list[str]:
+    lines = repr(x.get()).splitlines()
+    return [f"= {lines[0]}", *lines[1:]]
+
+def resolve(
+        x: Expression[T],
+        prefix: str = "",
+        indent: str = " ",
+        width: Optional[int] = None,
+) -> T:
+    print_tree(x, describe_value, prefix=prefix, indent=indent, width=width)
     return x.get()
@@ -1,9 +1,23 @@
-from .relation import Attribute, ConstantRelation, Element, Relation
+from .relation import Attribute, ConstantParameter, ConstantRelation, Element, LazyRelation, Parameter, Relation
+from .columnar import ColumnarRelation
+from .cache import ResultCache
 
 from .difference import difference, subtract, minus
 from .elimination import eliminate, elim, distinct, unique
+from .explain import analyze, explain_analyze
+from .external import ExternalExecutor
+from .incremental import MaterializedView
+from .indexes import create_hash_index, create_sorted_index
 from .join import join
+from .loaders import iter_arrow, iter_csv, iter_parquet, read_arrow, read_csv, read_parquet
+from .optimize import estimate, optimize
+from .parallel import ParallelExecutor
+from .prepared import PreparedPlan, prepare
 from .product import product, prod, X, x
 from .projection import project, proj, pi
 from .selection import select, sigma
+from .semijoin import antijoin, semijoin
+from .sqlite import SQLiteExecutor
+from .statistics import get_statistics
+from .storage import load, save
 from .union import union, U, u
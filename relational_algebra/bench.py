@@ -0,0 +1,218 @@
+"""
+Benchmarks every operator on synthetic relations shaped like the PERSON and
+STUDENT relations of the README, printing one JSON object per measurement:
+
+    python -m relational_algebra.bench --sizes 1000 10000 100000
+
+PERSON has one element per person, with uniformly distributed ages.
+STUDENT has as many elements, each pairing a random student with a guardian
+whose id follows a power law with exponent --skew (0 is uniform), so that
+joins on the guardian id see skewed keys.
+Selections keep the people younger than the age that leaves a fraction
+--selectivity of PERSON.
+"""
+import argparse
+import json
+import platform
+import random
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Optional, cast
+
+from expression import Expression, eq, gt, lt
+from .columnar import HAS_NUMPY, ColumnarRelation
+from .difference import difference
+from .elimination import eliminate
+from .join import join
+from .optimize import optimize
+from .product import product
+from .projection import project
+from .relation import Attribute, ConstantRelation, Relation
+from .selection import select
+from .union import union
+
+
+student_id = Attribute("sid")
+guardian_id = Attribute("gid")
+person_id = Attribute("pid") | student_id | guardian_id
+name = Attribute("name")
+age = Attribute("age")
+
+MAX_AGE = 100
+
+
+def generate_person(size: int, rng: random.Random) -> Relation:
+    return Relation(
+        attributes=(person_id, name, age),
+        elements=[(i, f"P_{i}", rng.randrange(MAX_AGE)) for i in range(1, size+1)],
+    )
+
+def generate_student(size: int, skew: float, rng: random.Random) -> Relation:
+    ids = range(1, size+1)
+    weights = [1 / i**skew for i in ids]
+    guardians = rng.choices(ids, weights=weights, k=size)
+    return Relation(
+        attributes=(student_id, guardian_id),
+        elements=[(rng.randrange(1, size+1), g) for g in guardians],
+    )
+
+
+class Workload:
+    """
+    The base relations of one benchmark run, and the queries over them.
+    Each query is built from scratch, so that no result is reused.
+    """
+    person: Relation
+    student: Relation
+    other_student: Relation
+    threshold: ConstantRelation
+
+    def __init__(self, size: int, skew: float, selectivity: float, seed: int, engine: str):
+        rng = random.Random(seed)
+        person = generate_person(size, rng)
+        student = generate_student(size, skew, rng)
+        other_student = generate_student(size, skew, rng)
+        if engine != "rows":
+            columnar_person = ColumnarRelation.from_relation(person)
+            person = columnar_person.encode() if engine == "encoded" else columnar_person
+            student = ColumnarRelation.from_relation(student)
+            other_student = ColumnarRelation.from_relation(other_student)
+        self.person = person
+        self.student = student
+        self.other_student = other_student
+        self.threshold = ConstantRelation(age, round(selectivity * MAX_AGE))
+
+    def select(self) -> Expression[Relation]:
+        return select[3 |lt| self.threshold](self.person)
+
+    def project(self) -> Expression[Relation]:
+        return project[2, 3](self.person)
+
+    def join(self) -> Expression[Relation]:
+        return self.student |join[1 |eq| -2]| self.person
+
+    def product(self) -> Expression[Relation]:
+        return self.student |product| self.person
+
+    def union(self) -> Expression[Relation]:
+        return self.student |union| self.other_student
+
+    def difference(self) -> Expression[Relation]:
+        return self.student |difference| self.other_student
+
+    def eliminate(self) -> Expression[Relation]:
+        return eliminate(project[2](self.student))
+
+    def query_1(self) -> Expression[Relation]:
+        return eliminate(project[1](
+            self.student |join[1 |eq| -2]| select[3 |lt| self.threshold](self.person)
+        ))
+
+    def query_2(self) -> Expression[Relation]:
+        return eliminate(project[5](
+            select[1 |gt| 4, 2 |eq| 6](self.threshold |product| self.person |product| self.student)
+        ))
+
+
+BENCHMARKS = (
+    "select", "project", "join", "product", "product_count",
+    "union", "difference", "eliminate", "query_1", "query_2",
+)
+# the benchmarks that pair up every element of PERSON and STUDENT
+QUADRATIC = ("product", "query_2")
+# the benchmarks that count the elements of another one's result without
+# building them, which a factorized product does from the sizes of its factors
+COUNTED = {"product_count": "product"}
+
+
+def measure(
+        build: Callable[[], Expression[Relation]],
+        repeat: int,
+        optimized: bool,
+        consumed: bool = True,
+) -> dict[str, Any]:
+    """
+    Returns the best time over repeat runs, and the peak memory allocated
+    during a separate run, since tracing allocations slows evaluation down.
+    Every element of the result is built, unless it is not consumed, in which
+    case its elements are only counted.
+    """
+    def run() -> int:
+        x = build()
+        if optimized:
+            x = optimize(x)
+        if consumed:
+            return sum(1 for _ in x.get())
+        return x.get().num_elements
+
+    assert repeat > 0
+    seconds: list[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        run()
+        seconds.append(perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        rows = run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"rows": rows, "seconds": min(seconds), "peak_bytes": peak}
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m relational_algebra.bench",
+        description="Time every relational algebra operator on synthetic relations.",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="numbers of elements in PERSON and STUDENT")
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="power law exponent of the guardian ids (0 is uniform)")
+    parser.add_argument("--selectivity", type=float, default=0.2,
+                        help="fraction of PERSON kept by selections")
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-pairs", type=int, default=10**7,
+                        help="skip products and query (2) beyond this many pairs of elements")
+    parser.add_argument("--engine", choices=("rows", "columnar", "encoded"), default="rows",
+                        help="encoded is the columnar engine with the names dictionary-encoded")
+    parser.add_argument("--optimize", action="store_true",
+                        help="optimize each query before evaluating it")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.engine != "rows" and not HAS_NUMPY:
+        parser.error(f"the {args.engine} engine requires numpy")
+
+    for size in args.sizes:
+        workload = Workload(size, args.skew, args.selectivity, args.seed, args.engine)
+        for benchmark in cast(list[str], args.benchmarks):
+            record: dict[str, Any] = {
+                "benchmark": benchmark,
+                "size": size,
+                "skew": args.skew,
+                "selectivity": args.selectivity,
+                "engine": args.engine,
+                "optimize": args.optimize,
+                "python": platform.python_version(),
+            }
+            built = COUNTED.get(benchmark, benchmark)
+            if built in QUADRATIC and size * size > args.max_pairs:
+                record["skipped"] = True
+            else:
+                record.update(measure(
+                    getattr(workload, built),
+                    repeat=args.repeat,
+                    optimized=args.optimize,
+                    consumed=benchmark not in COUNTED,
+                ))
+            print(json.dumps(record), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from expression import (
+    Constant,
+    Expression,
+    InfixBinaryOperation,
+    Operation,
+    PrefixUnaryOperation,
+    evaluate_with,
+)
+from .filter import Condition, ConditionArgument
+from .join import ThetaJoin
+from .projection import Projection
+from .relation import ConstantRelation, Relation
+from .selection import Selection
+from .semijoin import SemiJoin
+
+
+class Identity:
+    """
+    A key that is only equal to the key of the very same object.
+    It also keeps the object alive, so that its id cannot be reused by a
+    different object while the key is in use.
+    """
+    value: Any
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __hash__(self) -> int:
+        return id(self.value)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Identity) and other.value is self.value
+
+
+def get_argument_key(argument: ConditionArgument) -> Hashable:
+    if isinstance(argument, ConstantRelation):
+        return (argument.attribute, type(argument.value), argument.value)
+    return argument
+
+def get_condition_key(condition: Condition) -> Hashable:
+    return (
+        condition.f,
+        condition.operator_name,
+        get_argument_key(condition.left_child.get()),
+        get_argument_key(condition.right_child.get()),
+    )
+
+def get_operator_key(f: Callable[..., Any]) -> Hashable:
+    if isinstance(f, Selection):
+        return ("select", *(get_condition_key(c) for c in f.conditions))
+    if isinstance(f, Projection):
+        return ("project", *f.indices)
+    if isinstance(f, ThetaJoin):
+        return ("join", *(get_condition_key(c) for c in f.conditions))
+    if isinstance(f, SemiJoin):
+        return ("antijoin" if f.anti else "semijoin", *(get_condition_key(c) for c in f.conditions))
+    return f
+
+
+class ResultCache:
+    """
+    A least-recently-used cache of the results of relational algebra
+    subtrees, shared across every expression evaluated through it.
+
+    Subtrees are keyed by their structure rather than by object, so two
+    separately built copies of the same subtree share one result. The key
+    of a subtree is made of its operators and their conditions or indices,
+    the values of its constant relations, and the identities of its other
+    base relations.
+
+    The cache holds at most capacity results, and at most budget values
+    (elements times attributes) across all of them if a budget is given.
+    Results are materialized when they are stored.
+    """
+    capacity: int
+    budget: Optional[int]
+    hits: int
+    misses: int
+    size: int
+    _results: "OrderedDict[Hashable, Relation]"
+
+    def __init__(self, capacity: int = 128, budget: Optional[int] = None):
+        assert capacity > 0
+        assert budget is None or budget > 0
+        self.capacity = capacity
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._results = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self.size = 0
+
+    def get_key(
+            self,
+            x: Expression[Any],
+            keys: Optional[dict[int, Optional[Hashable]]] = None,
+    ) -> Optional[Hashable]:
+        """
+        Returns the structural key of the subtree, or None if it has a part
+        that cannot be keyed, such as an unhashable constant.
+        The keys of every node in the subtree are also recorded in keys.
+        """
+        if keys is None:
+            keys = {}
+        if id(x) in keys:
+            return keys[id(x)]
+
+        key: Optional[Hashable] = None
+        if isinstance(x, Constant):
+            value = x.get()
+            if isinstance(value, ConstantRelation):
+                key = ("constant", get_argument_key(value))
+            else:
+                key = Identity(value)
+        elif isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation)):
+            child_keys = [self.get_key(child, keys) for child in x.children]
+            if all(child_key is not None for child_key in child_keys):
+                key = (get_operator_key(x.f), *child_keys)
+        try:
+            hash(key)
+        except TypeError:
+            key = None
+        keys[id(x)] = key
+        return key
+
+    def evaluate(self, x: Expression[Relation]) -> Relation:
+        """
+        Evaluates the expression, reusing the cached result of any subtree
+        that has been evaluated before, and caching the rest.
+        """
+        keys: dict[int, Optional[Hashable]] = {}
+        self.get_key(x, keys)
+
+        def reuse(operation: Operation) -> None:
+            key = keys[id(operation)]
+            if key is not None and key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                # share the result with the expression itself, e.g. for resolve
+                operation.set_value(self._results[key])
+
+        def apply(operation: Operation, children: list[Relation]) -> Relation:
+            self.misses += 1
+            result = operation.f(*children)
+            key = keys[id(operation)]
+            if key is not None:
+                self._store(key, result)
+            return result
+
+        return evaluate_with(x, apply, reuse)
+
+    def _store(self, key: Hashable, result: Relation) -> None:
+        size = result.num_elements * result.num_attributes
+        if self.budget is not None and size > self.budget:
+            return
+        self._results[key] = result
+        self.size += size
+        while len(self._results) > self.capacity or (
+            self.budget is not None and self.size > self.budget
+        ):
+            _, evicted = self._results.popitem(last=False)
+            self.size -= evicted.num_elements * evicted.num_attributes
@@ -0,0 +1,563 @@
+from functools import cache, cached_property
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional, Sequence, TypeAlias
+
+if TYPE_CHECKING:
+    import numpy as np
+    HAS_NUMPY = True
+else:
+    try:
+        import numpy as np
+        HAS_NUMPY = True
+    except ImportError: # numpy is optional, but needed to build a ColumnarRelation
+        np = None
+        HAS_NUMPY = False
+
+from expression.compare import (
+    equals,
+    not_equals,
+    less_than,
+    greater_than,
+    less_than_or_equal_to,
+    greater_than_or_equal_to,
+)
+from .filter import (
+    CONVERSES,
+    FLIPPED,
+    INEQUALITIES,
+    OPERATORS,
+    Condition,
+    ConditionArgument,
+    order_by_selectivity,
+)
+from .relation import Attribute, ConstantRelation, Element, Relation, intern_schema
+
+
+Column: TypeAlias = Any # a one-dimensional numpy array
+
+# the sorted distinct values of an encoded column, whose codes are the
+# positions of its values in it, so that codes compare like their values
+Dictionary: TypeAlias = Column
+
+UFUNCS: dict[Callable[[Any, Any], bool], Any] = {} if not HAS_NUMPY else {
+    equals.f: np.equal,
+    not_equals.f: np.not_equal,
+    less_than.f: np.less,
+    greater_than.f: np.greater,
+    less_than_or_equal_to.f: np.less_equal,
+    greater_than_or_equal_to.f: np.greater_equal,
+}
+
+
+def to_column(values: Sequence[Any]) -> Column:
+    """
+    Packs the values into an array, keeping them as Python objects unless they
+    all share a type that NumPy stores natively.
+    """
+    types = {type(value) for value in values}
+    if len(types) == 1 and types <= {bool, int, float, str}:
+        try:
+            return np.array(values)
+        except OverflowError:
+            pass
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def is_strings(column: Column) -> bool:
+    if column.dtype.kind == "U":
+        return True
+    return column.dtype == object and all(type(value) is str for value in column.tolist())
+
+def is_comparable(left: Column, right: Column) -> bool:
+    """
+    Whether NumPy sorts the values of two arrays together like Python does,
+    rather than converting those of one to the type of the other.
+    """
+    kinds = {left.dtype.kind, right.dtype.kind}
+    return len(kinds) == 1 or kinds <= set("biuf")
+
+def encode_column(column: Column) -> tuple[Column, Dictionary]:
+    """
+    Replaces the values of a column with codes into its dictionary.
+    """
+    dictionary, codes = np.unique(column, return_inverse=True)
+    return codes.astype(np.int32 if len(dictionary) < 2**31 else np.int64), dictionary
+
+def align_codes(left: Dictionary, right: Dictionary) -> Optional[tuple[Column, Column]]:
+    """
+    Maps the codes of two dictionaries onto the codes of their merged
+    dictionary, so that columns encoded separately can be compared, or
+    returns None if their values cannot be sorted together.
+    """
+    if not is_comparable(left, right):
+        return None
+    try:
+        merged = np.union1d(left, right)
+    except TypeError:
+        return None
+    return np.searchsorted(merged, left), np.searchsorted(merged, right)
+
+def group_rows(columns: Sequence[Column]) -> tuple[Column, Column]:
+    """
+    Sorts the rows of integer columns, returning the order of the rows and
+    the mask of the sorted positions that start a run of equal rows.
+    Equal rows keep their order, so each run starts with its first row.
+    """
+    order = np.lexsort(columns[::-1])
+    starts = np.zeros(len(order), dtype=bool)
+    starts[:1] = True
+    for column in columns:
+        values = column[order]
+        starts[1:] |= values[1:] != values[:-1]
+    return order, starts
+
+
+def compare(
+        f: Callable[[Any, Any], bool],
+        lhs: Any,
+        rhs: Any,
+        n: int,
+) -> Column:
+    """
+    Returns the mask of the n positions where f holds, where each side is
+    either a column or a single value.
+    Standard comparisons run vectorized; anything else, including values that
+    NumPy cannot compare, runs element by element exactly like the row engine.
+    """
+    ufunc = UFUNCS.get(f)
+    if ufunc is not None:
+        try:
+            mask = ufunc(lhs, rhs)
+            if isinstance(mask, np.ndarray) and mask.dtype == bool and mask.shape == (n,):
+                return mask
+        except (TypeError, OverflowError):
+            pass
+    lhs_values = lhs if isinstance(lhs, np.ndarray) else repeat(lhs)
+    rhs_values = rhs if isinstance(rhs, np.ndarray) else repeat(rhs)
+    return np.fromiter(
+        (f(a, b) for a, b, _ in zip(lhs_values, rhs_values, range(n))),
+        dtype=bool,
+        count=n,
+    )
+
+
+class ColumnarRelation(Relation):
+    """
+    A relation stored as one NumPy array per attribute rather than as a tuple
+    of elements.
+
+    Selections on the standard comparisons run as vectorized masks,
+    projections share the arrays of their input, and products and joins
+    gather both sides through index arrays.
+    A column may be dictionary-encoded, in which case its array holds codes
+    into the sorted array of its distinct values, and comparisons, joins,
+    eliminations and differences work on the codes.
+    The elements are only converted to tuples, and the codes decoded, when
+    they are accessed.
+    """
+    columns: Sequence[Column]
+    dictionaries: Sequence[Optional[Dictionary]]
+
+    def __init__(
+            self,
+            attributes: tuple[Attribute, ...],
+            columns: Sequence[Column],
+            dictionaries: Optional[Sequence[Optional[Dictionary]]] = None,
+    ):
+        assert HAS_NUMPY, "ColumnarRelation requires numpy"
+        assert len(columns) == len(attributes)
+        assert len({len(column) for column in columns}) == 1
+        self.attributes = intern_schema(attributes)
+        self.columns = tuple(columns)
+        self.dictionaries = (None,) * len(columns) if dictionaries is None else tuple(dictionaries)
+        assert len(self.dictionaries) == len(columns)
+        self.indexes = []
+        self.statistics = {}
+
+    @classmethod
+    def from_relation(cls, relation: Relation) -> "ColumnarRelation":
+        if isinstance(relation, ColumnarRelation):
+            return relation
+        elements = relation.elements
+        return cls(
+            attributes=relation.attributes,
+            columns=[
+                to_column([element[i] for element in elements])
+                for i in range(relation.num_attributes)
+            ],
+        )
+
+    def encode(self, columns: Optional[Sequence[int]] = None) -> "ColumnarRelation":
+        """
+        Returns the relation with the given columns (numbered from 1, like #1)
+        dictionary-encoded, by default every column of strings.
+        """
+        if columns is None:
+            columns = [
+                i + 1 for i, column in enumerate(self.columns)
+                if self.dictionaries[i] is None and is_strings(column)
+            ]
+        encoded = list(self.columns)
+        dictionaries = list(self.dictionaries)
+        for c in columns:
+            assert 0 < c <= self.num_attributes, f"{self} has no column #{c}"
+            if dictionaries[c-1] is not None:
+                continue
+            try:
+                encoded[c-1], dictionaries[c-1] = encode_column(self.columns[c-1])
+            except TypeError:
+                assert False, f"{self} : the values of #{c} cannot be sorted"
+        return ColumnarRelation(self.attributes, encoded, dictionaries)
+
+    def decode(self, i: int) -> Column:
+        """
+        Returns the values of the column at the given (zero-based) index.
+        """
+        dictionary = self.dictionaries[i]
+        column = self.columns[i]
+        return column if dictionary is None else dictionary[column]
+
+    @cached_property
+    def elements(self) -> tuple[Element, ...]: # type: ignore
+        return tuple(zip(*(self.decode(i).tolist() for i in range(self.num_attributes))))
+
+    def __iter__(self) -> Iterator[Element]:
+        if "elements" in self.__dict__:
+            return iter(self.elements)
+        return zip(*(self.decode(i).tolist() for i in range(self.num_attributes)))
+
+    @property
+    def num_elements(self) -> int:
+        return len(self.columns[0])
+
+    def replace_attribute(self, index: int, attribute: Attribute) -> "ColumnarRelation":
+        attributes = (*self.attributes[:index], attribute, *self.attributes[index+1:])
+        relation = ColumnarRelation(attributes, self.columns, self.dictionaries)
+        relation.statistics = self.statistics
+        return relation
+
+    def take(self, indices: Column) -> "ColumnarRelation":
+        """
+        Returns the relation made of the elements at the given indices, which
+        may also be a boolean mask.
+        """
+        return ColumnarRelation(
+            attributes=self.attributes,
+            columns=[column[indices] for column in self.columns],
+            dictionaries=self.dictionaries,
+        )
+
+    def project_columns(self, indices: Sequence[int]) -> "ColumnarRelation":
+        """
+        Returns the relation made of the columns at the given (zero-based)
+        indices, sharing their arrays instead of copying them.
+        """
+        return ColumnarRelation(
+            attributes=tuple(self.attributes[i] for i in indices),
+            columns=[self.columns[i] for i in indices],
+            dictionaries=[self.dictionaries[i] for i in indices],
+        )
+
+    def get_codes(self, i: int) -> Optional[Column]:
+        """
+        Returns integers that compare for equality like the values of the
+        column at the given (zero-based) index, if there are any.
+        """
+        if self.dictionaries[i] is not None or self.columns[i].dtype.kind in "biu":
+            return self.columns[i]
+        return None
+
+    def compare_codes(
+            self,
+            f: Callable[[Any, Any], bool],
+            left: ConditionArgument,
+            right: ConditionArgument,
+    ) -> Optional[Column]:
+        """
+        Returns the mask of a standard comparison that involves an encoded
+        column, computed on its codes, or None if it cannot be.
+        """
+        if f not in OPERATORS:
+            return None
+        if isinstance(left, ConstantRelation):
+            left, right, f = right, left, CONVERSES[f].f
+        op = OPERATORS[f]
+        if isinstance(left, ConstantRelation):
+            return None
+        dictionary = self.dictionaries[left-1]
+        if dictionary is None:
+            return None
+        codes = self.columns[left-1]
+        n = self.num_elements
+        if not isinstance(right, ConstantRelation):
+            other = self.dictionaries[right-1]
+            if other is None:
+                return None
+            if other is dictionary:
+                return compare(f, codes, self.columns[right-1], n)
+            aligned = align_codes(dictionary, other)
+            if aligned is None:
+                return None
+            left_codes, right_codes = aligned
+            return compare(f, left_codes[codes], right_codes[self.columns[right-1]], n)
+
+        # the values equal to the constant, if any, sit in dictionary[lo:hi]
+        value = right.value
+        try:
+            # NumPy would convert a value of another type rather than fail
+            sorted([*dictionary[:1].tolist(), value])
+            lo = int(np.searchsorted(dictionary, value, side="left"))
+            hi = int(np.searchsorted(dictionary, value, side="right"))
+        except TypeError:
+            return None
+        if op == "==":
+            return codes == lo if hi > lo else np.zeros(n, dtype=bool)
+        if op == "!=":
+            return codes != lo if hi > lo else np.ones(n, dtype=bool)
+        if op == "<":
+            return codes < lo
+        if op == "<=":
+            return codes < hi
+        if op == ">":
+            return codes >= hi
+        return codes >= lo
+
+    def filter_condition(
+            self,
+            f: Callable[[Any, Any], bool],
+            left: ConditionArgument,
+            right: ConditionArgument,
+    ) -> "ColumnarRelation":
+        """
+        Keeps the elements where f holds between the two selection arguments.
+        Only the elements that are left are compared, so a comparison between
+        values of incompatible types does not fail if there are none, just as
+        the row engine never reaches a condition that an earlier one rejects.
+        """
+        mask = self.compare_codes(f, left, right)
+        if mask is not None:
+            return self.take(mask)
+        def operand(argument: ConditionArgument) -> Any:
+            if isinstance(argument, ConstantRelation):
+                return argument.value
+            assert argument > 0
+            return self.decode(argument-1)
+        return self.take(compare(f, operand(left), operand(right), self.num_elements))
+
+
+def gather(
+        left_relation: ColumnarRelation,
+        left_indices: Column,
+        right_relation: ColumnarRelation,
+        right_indices: Column,
+) -> ColumnarRelation:
+    return ColumnarRelation(
+        attributes=left_relation.attributes + right_relation.attributes,
+        columns=[
+            *(column[left_indices] for column in left_relation.columns),
+            *(column[right_indices] for column in right_relation.columns),
+        ],
+        dictionaries=(*left_relation.dictionaries, *right_relation.dictionaries),
+    )
+
+
+def columnar_product(
+        left_relation: ColumnarRelation,
+        right_relation: ColumnarRelation,
+) -> ColumnarRelation:
+    n = left_relation.num_elements
+    m = right_relation.num_elements
+    return gather(
+        left_relation, np.repeat(np.arange(n), m),
+        right_relation, np.tile(np.arange(m), n),
+    )
+
+
+def expand(lo: Column, hi: Column, order: Column) -> tuple[Column, Column]:
+    """
+    Turns the range [lo[i], hi[i]) of sorted positions found for each probe i
+    into a pair of index arrays (probe index, original index).
+    """
+    counts = np.maximum(hi - lo, 0)
+    probe_indices = np.repeat(np.arange(len(lo)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return probe_indices, order[starts + np.arange(counts.sum())]
+
+
+def columnar_join(
+        left_relation: ColumnarRelation,
+        right_relation: ColumnarRelation,
+        keys: Sequence[tuple[int, int]],
+        bounds: Sequence[tuple[int, str, int]],
+        conditions: Sequence[Condition],
+) -> ColumnarRelation:
+    """
+    Joins two columnar relations with index arrays instead of element pairs.
+
+    The candidate pairs come from a sorted search on the first key, or on the
+    shared column of the bounds, and are then narrowed by every key, bound
+    and residual condition in turn. The output is in the same order as a nested loop
+    join.
+    As in the row engine, a condition is only compared on the pairs that the
+    ones before it kept, so a comparison between values of incompatible types
+    only fails if some pair gets that far.
+    """
+    n = left_relation.num_elements
+    m = right_relation.num_elements
+
+    def comparable(l: int, r: int) -> tuple[Column, Column]:
+        """
+        Returns the left and right columns in a form that compares like their
+        values: codes in the same dictionary if both are encoded, or else the
+        values themselves.
+        """
+        left_dictionary = left_relation.dictionaries[l]
+        right_dictionary = right_relation.dictionaries[r]
+        left_codes = left_relation.columns[l]
+        right_codes = right_relation.columns[r]
+        if left_dictionary is not None and left_dictionary is right_dictionary:
+            return left_codes, right_codes
+        aligned = None
+        if left_dictionary is not None and right_dictionary is not None:
+            aligned = align_codes(left_dictionary, right_dictionary)
+        if aligned is None:
+            return left_relation.decode(l), right_relation.decode(r)
+        left_map, right_map = aligned
+        return left_map[left_codes], right_map[right_codes]
+    key_columns = [comparable(l, r) for l, r in keys]
+    # the other conditions compare values, decoded once if they are needed
+    left_column = cache(left_relation.decode)
+    right_column = cache(right_relation.decode)
+
+    def search(
+            sorted_column: Column,
+            probes: Sequence[tuple[str, Column]],
+    ) -> tuple[Column, Column]:
+        """
+        Finds, for each probe element, the range of sorted positions whose
+        value v satisfies "v op probe value" for every (op, column) in probes.
+        """
+        order = np.argsort(sorted_column, kind="stable")
+        values = sorted_column[order]
+        k = len(probes[0][1])
+        lo = np.zeros(k, dtype=np.intp)
+        hi = np.full(k, len(values), dtype=np.intp)
+        for op, probe in probes:
+            if not is_comparable(values, probe):
+                raise TypeError
+            if op == "<":
+                hi = np.minimum(hi, np.searchsorted(values, probe, side="left"))
+            elif op == "\u2264":
+                hi = np.minimum(hi, np.searchsorted(values, probe, side="right"))
+            elif op == ">":
+                lo = np.maximum(lo, np.searchsorted(values, probe, side="right"))
+            else:
+                assert op == "\u2265"
+                lo = np.maximum(lo, np.searchsorted(values, probe, side="left"))
+        return expand(lo, hi, order)
+
+    left_indices: Column = None
+    right_indices: Column = None
+    try:
+        if len(keys) > 0:
+            left_keys, right_keys = key_columns[0]
+            left_indices, right_indices = search(
+                right_keys, [("\u2264", left_keys), ("\u2265", left_keys)],
+            )
+        elif len(bounds) > 0 and len({l for l, _, _ in bounds}) == 1:
+            right_indices, left_indices = search(
+                left_column(bounds[0][0]), [(op, right_column(r)) for _, op, r in bounds],
+            )
+        elif len(bounds) > 0:
+            left_indices, right_indices = search(
+                right_column(bounds[0][2]), [(FLIPPED[op], left_column(l)) for l, op, _ in bounds],
+            )
+    except TypeError:
+        # the column values cannot be sorted
+        left_indices = right_indices = None
+    if left_indices is None:
+        # nothing to search on, so every pair is a candidate
+        left_indices = np.repeat(np.arange(n), m)
+        right_indices = np.tile(np.arange(m), n)
+
+    # each condition only sees the pairs that the ones before it kept, in the
+    # order that the row engine checks them
+    for left_keys, right_keys in key_columns:
+        mask = compare(equals.f, left_keys[left_indices], right_keys[right_indices], len(left_indices))
+        left_indices, right_indices = left_indices[mask], right_indices[mask]
+    for l, op, r in bounds:
+        mask = compare(
+            INEQUALITIES[op],
+            left_column(l)[left_indices],
+            right_column(r)[right_indices],
+            len(left_indices),
+        )
+        left_indices, right_indices = left_indices[mask], right_indices[mask]
+
+    def operand(argument: ConditionArgument) -> Any:
+        if isinstance(argument, ConstantRelation):
+            return argument.value
+        if argument < 0:
+            return left_column(-argument-1)[left_indices]
+        return right_column(argument-1)[right_indices]
+    for condition in order_by_selectivity(conditions):
+        mask = compare(
+            condition.f,
+            operand(condition.left_child.get()),
+            operand(condition.right_child.get()),
+            len(left_indices),
+        )
+        left_indices, right_indices = left_indices[mask], right_indices[mask]
+
+    order = np.lexsort((right_indices, left_indices))
+    return gather(left_relation, left_indices[order], right_relation, right_indices[order])
+
+
+def columnar_eliminate(relation: ColumnarRelation) -> Optional[ColumnarRelation]:
+    """
+    Keeps the first of each run of equal elements, in their order, by sorting
+    the codes of the columns, or returns None if a column has no codes.
+    """
+    columns = [relation.get_codes(i) for i in range(relation.num_attributes)]
+    if any(column is None for column in columns):
+        return None
+    order, starts = group_rows(columns)
+    return relation.take(np.sort(order[starts]))
+
+
+def columnar_difference(
+        left_relation: ColumnarRelation,
+        right_relation: ColumnarRelation,
+) -> Optional[ColumnarRelation]:
+    """
+    Keeps the left elements equal to no right element, in their order, by
+    sorting the codes of both sides together, or returns None if a column
+    has no codes on either side.
+    """
+    n = left_relation.num_elements
+    if n == 0 or right_relation.num_elements == 0:
+        return left_relation
+    columns: list[Column] = []
+    for i in range(left_relation.num_attributes):
+        left_dictionary = left_relation.dictionaries[i]
+        right_dictionary = right_relation.dictionaries[i]
+        left_codes = left_relation.get_codes(i)
+        right_codes = right_relation.get_codes(i)
+        if left_codes is None or right_codes is None or (left_dictionary is None) != (right_dictionary is None):
+            return None
+        if left_dictionary is not None and left_dictionary is not right_dictionary:
+            aligned = align_codes(left_dictionary, right_dictionary)
+            if aligned is None:
+                return None
+            left_map, right_map = aligned
+            left_codes, right_codes = left_map[left_codes], right_map[right_codes]
+        column = np.concatenate([left_codes, right_codes])
+        if column.dtype.kind not in "biu":
+            return None # e.g. unsigned and signed integers that only fit in floats
+        columns.append(column)
+    order, starts = group_rows(columns)
+    # a run of equal elements is removed if any of them is on the right
+    runs = np.logical_or.reduceat(order >= n, np.flatnonzero(starts))
+    removed = np.empty(len(order), dtype=bool)
+    removed[order] = runs[np.cumsum(starts) - 1]
+    return left_relation.take(~removed[:n])
@@ -1,5 +1,8 @@
+from typing import Iterator
+
 from expression import InfixBinaryOperator
-from .relation import Relation
+from .columnar import ColumnarRelation, columnar_difference
+from .relation import Element, LazyRelation, Relation
 
 
 @InfixBinaryOperator.decorate(name="\u2212")
@@ -11,14 +14,22 @@ def difference(left_relation: Relation, right_relation: Relation) -> Relation:
     assert lA == rA, \
         f"{name} : relations have different arities ({lA} versus {rA})"
 
-    for i, (la, ra) in enumerate(zip(left_relation.attributes, right_relation.attributes)):
-        assert len(la & ra) > 0, \
-            f"{name} : incompatible types at index {i+1}: {la} versus {ra}"
+    if left_relation.attributes is not right_relation.attributes:
+        for i, (la, ra) in enumerate(zip(left_relation.attributes, right_relation.attributes)):
+            assert len(la & ra) > 0, \
+                f"{name} : incompatible types at index {i+1}: {la} versus {ra}"
+
+    if isinstance(left_relation, ColumnarRelation) and isinstance(right_relation, ColumnarRelation):
+        result = columnar_difference(left_relation, right_relation)
+        if result is not None:
+            return result
 
-    exclude = set(right_relation.elements)
-    elements = left_relation.filter_elements(lambda element: element not in exclude).elements
+    def generate() -> Iterator[Element]:
+        # the right elements have to be buffered, the left elements stream through
+        exclude = set(right_relation)
+        return (element for element in left_relation if element not in exclude)
 
-    return Relation(attributes=left_relation.attributes, elements=elements)
+    return LazyRelation(attributes=left_relation.attributes, generate=generate)
 
 subtract = difference
 minus = difference
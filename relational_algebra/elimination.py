@@ -1,18 +1,26 @@
+from typing import Iterator
+
 from expression import PrefixUnaryOperator
-from .relation import Element, Relation
+from .columnar import ColumnarRelation, columnar_eliminate
+from .relation import Element, LazyRelation, Relation
 
 
 @PrefixUnaryOperator.decorate(name="elim")
 def eliminate(relation: Relation) -> Relation:
-    # we do it this way to preserve order
-    elements: list[Element] = []
-    seen: set[Element] = set()
-    for element in relation.elements:
-        if element in seen:
-            continue
-        elements.append(element)
-        seen.add(element)
-    return Relation(attributes=relation.attributes, elements=elements)
+    if isinstance(relation, ColumnarRelation):
+        result = columnar_eliminate(relation)
+        if result is not None:
+            return result
+
+    def generate() -> Iterator[Element]:
+        # we do it this way to preserve order
+        seen: set[Element] = set()
+        for element in relation:
+            if element in seen:
+                continue
+            yield element
+            seen.add(element)
+    return LazyRelation(attributes=relation.attributes, generate=generate)
 
 elim = eliminate
 distinct = eliminate
@@ -0,0 +1,25 @@
+from typing import Any, Optional
+
+from expression import Expression
+from expression.analyze import Profile
+from expression.analyze import analyze as analyze_expression
+from expression.analyze import explain_analyze as explain_expression
+from .relation import Relation
+
+
+def count_elements(value: Any) -> Optional[int]:
+    return value.num_elements if isinstance(value, Relation) else None
+
+def analyze(x: Expression[Relation], trace_memory: bool = True) -> Profile:
+    """
+    Evaluates the query, recording the time, output elements, selectivity
+    and peak memory of each operator. See expression.analyze.
+    """
+    return analyze_expression(x, size=count_elements, trace_memory=trace_memory)
+
+def explain_analyze(x: Expression[Relation], trace_memory: bool = True) -> Profile:
+    """
+    Evaluates the query and prints its plan tree like resolve, with the cost
+    of each operator in place of its elements.
+    """
+    return explain_expression(x, size=count_elements, trace_memory=trace_memory)
@@ -0,0 +1,285 @@
+import pickle
+import tempfile
+from itertools import chain, islice
+from math import inf
+from operator import itemgetter
+from typing import IO, Any, Callable, Iterable, Iterator, Optional
+
+from expression import Expression, Operation, evaluate_with
+from .columnar import ColumnarRelation
+from .difference import difference
+from .elimination import eliminate
+from .filter import compile_predicate
+from .join import Predicate, ThetaJoin
+from .product import product
+from .relation import Element, LazyRelation, Relation
+
+
+# how many elements are pickled together when written to a temporary file
+SPILL_BATCH = 1024
+
+# partitions are split again at most this many times, in case their hashes
+# collide too often to ever fit in the budget
+MAX_DEPTH = 8
+
+Key = Callable[[Element], Any]
+
+
+class Spill:
+    """
+    Elements written to a temporary file in pickled batches, which can be
+    read back in the same order any number of times.
+    The file is deleted once the spill is garbage collected.
+    """
+    file: IO[bytes]
+
+    def __init__(self, directory: Optional[str] = None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+
+    def write(self, batch: list[Any]) -> None:
+        self.file.seek(0, 2)
+        pickle.dump(batch, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def extend(self, elements: Iterable[Any]) -> None:
+        elements = iter(elements)
+        while batch := list(islice(elements, SPILL_BATCH)):
+            self.write(batch)
+
+    def __iter__(self) -> Iterator[Any]:
+        self.file.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self.file)
+            except EOFError:
+                return
+            yield from batch
+
+
+def identity(element: Element) -> Element:
+    return element
+
+def get_key(columns: list[int]) -> Key:
+    if len(columns) == 0:
+        return lambda element: ()
+    return itemgetter(*columns)
+
+
+class ExternalExecutor:
+    """
+    Evaluates expressions within a memory budget, spilling to temporary
+    files whenever an elimination, difference, join or product would need
+    to hold more than budget values (elements times attributes) at once.
+
+    Each of them streams its inputs, and starts out in memory exactly like
+    the serial operator, with the same results in the same order. Once the
+    elements it holds (the distinct elements of an elimination, or the
+    elements of the right side of a difference or equality join) exceed the
+    budget, both sides are split into partitions on disk by hash, and each
+    pair of partitions is processed in turn, splitting it again with a
+    different hash if it is still too large. Products and joins without
+    equalities instead read the right side in blocks that fit the budget,
+    and scan the left side from disk once per block.
+    The elements of spilled results come out in a different order.
+
+    Everything else, and operators over columnar relations, run as usual.
+    The elements must be picklable.
+    """
+    budget: int
+    partitions: int
+    directory: Optional[str]
+    spills: int
+
+    def __init__(self, budget: int = 10_000_000, partitions: int = 16, directory: Optional[str] = None):
+        assert budget > 0
+        assert partitions > 1
+        self.budget = budget
+        self.partitions = partitions
+        self.directory = directory
+        self.spills = 0
+
+    def evaluate(self, x: Expression[Relation]) -> Relation:
+        """
+        Evaluates the expression, spilling to disk where the budget requires.
+        """
+        return evaluate_with(x, self.apply)
+
+    def apply(self, x: Operation, children: list[Relation]) -> Relation:
+        if any(isinstance(child, ColumnarRelation) for child in children):
+            return x.f(*children)
+        if x.f is eliminate.f:
+            return self.eliminate(*children)
+        if x.f is difference.f:
+            return self.difference(*children)
+        if isinstance(x.f, ThetaJoin):
+            return self.join(x.f, *children)
+        if x.f is product.f:
+            return self.product(*children)
+        return x.f(*children)
+
+    def partition(self, elements: Iterable[Element], key: Key, depth: int) -> list[Spill]:
+        """
+        Writes the elements to one temporary file per partition, by the hash
+        of their key, salted with the depth so that every level splits the
+        elements differently.
+        """
+        self.spills += 1
+        P = self.partitions
+        spills = [Spill(self.directory) for _ in range(P)]
+        buffers: list[list[Element]] = [[] for _ in range(P)]
+        for element in elements:
+            i = hash((depth, key(element))) % P
+            buffer = buffers[i]
+            buffer.append(element)
+            if len(buffer) >= SPILL_BATCH:
+                spills[i].write(buffer)
+                buffers[i] = []
+        for spill, buffer in zip(spills, buffers):
+            if len(buffer) > 0:
+                spill.write(buffer)
+        return spills
+
+    def get_limit(self, width: int, depth: int) -> float:
+        """
+        The number of elements of the given width that fit in the budget,
+        which is unlimited once partitions cannot be split any further.
+        """
+        return self.budget // width if depth < MAX_DEPTH else inf
+
+    def eliminate(self, relation: Relation) -> Relation:
+        def distinct(seen: set[Element], elements: Iterable[Element], depth: int) -> Iterator[Element]:
+            # the elements already seen were output before, and only stop
+            # later copies of them from being output
+            limit = self.get_limit(relation.num_attributes, depth)
+            elements = iter(elements)
+            for element in elements:
+                if element not in seen:
+                    yield element
+                    seen.add(element)
+                    if len(seen) > limit:
+                        break
+            else:
+                return
+            seen_partitions = self.partition(seen, identity, depth)
+            seen.clear()
+            partitions = self.partition(elements, identity, depth)
+            for seen_partition, partition in zip(seen_partitions, partitions):
+                yield from distinct(set(seen_partition), partition, depth + 1)
+
+        return LazyRelation(
+            attributes=relation.attributes,
+            generate=lambda: distinct(set(), relation, 0),
+        )
+
+    def difference(self, left_relation: Relation, right_relation: Relation) -> Relation:
+        # the serial operator checks the arities and types
+        result = difference.f(left_relation, right_relation)
+
+        def subtract(left: Iterable[Element], right: Iterable[Element], depth: int) -> Iterator[Element]:
+            limit = self.get_limit(right_relation.num_attributes, depth)
+            exclude: set[Element] = set()
+            right = iter(right)
+            for element in right:
+                exclude.add(element)
+                if len(exclude) > limit:
+                    break
+            else:
+                yield from (element for element in left if element not in exclude)
+                return
+            right_partitions = self.partition(chain(exclude, right), identity, depth)
+            exclude.clear()
+            left_partitions = self.partition(left, identity, depth)
+            for left_partition, right_partition in zip(left_partitions, right_partitions):
+                yield from subtract(left_partition, right_partition, depth + 1)
+
+        return LazyRelation(
+            attributes=result.attributes,
+            generate=lambda: subtract(left_relation, right_relation, 0),
+        )
+
+    def hash_join(
+            self,
+            left: Iterable[Element],
+            right: Iterable[Element],
+            left_key: Key,
+            right_key: Key,
+            predicate: Predicate,
+            width: int,
+            depth: int,
+    ) -> Iterator[Element]:
+        limit = self.get_limit(width, depth)
+        table: dict[Any, list[Element]] = {}
+        count = 0
+        right = iter(right)
+        for right_element in right:
+            table.setdefault(right_key(right_element), []).append(right_element)
+            count += 1
+            if count > limit:
+                break
+        else:
+            for left_element in left:
+                for right_element in table.get(left_key(left_element), ()):
+                    if predicate(left_element, right_element):
+                        yield left_element + right_element
+            return
+        kept = chain.from_iterable(table.values())
+        right_partitions = self.partition(chain(kept, right), right_key, depth)
+        table.clear()
+        left_partitions = self.partition(left, left_key, depth)
+        for left_partition, right_partition in zip(left_partitions, right_partitions):
+            yield from self.hash_join(
+                left_partition, right_partition, left_key, right_key, predicate, width, depth + 1,
+            )
+
+    def block_join(
+            self,
+            left: Iterable[Element],
+            right: Iterable[Element],
+            predicate: Predicate,
+            width: int,
+    ) -> Iterator[Element]:
+        block_size = max(1, self.budget // width)
+        right = iter(right)
+        block = list(islice(right, block_size))
+        rest = list(islice(right, 1))
+        if len(rest) == 0:
+            for left_element in left:
+                for right_element in block:
+                    if predicate(left_element, right_element):
+                        yield left_element + right_element
+            return
+        # the left side is read once per block of the right side
+        self.spills += 1
+        left_spill = Spill(self.directory)
+        left_spill.extend(left)
+        right_spill = Spill(self.directory)
+        right_spill.extend(chain(rest, right))
+        remaining = iter(right_spill)
+        while len(block) > 0:
+            for left_element in left_spill:
+                for right_element in block:
+                    if predicate(left_element, right_element):
+                        yield left_element + right_element
+            block = list(islice(remaining, block_size))
+
+    def join(self, theta_join: ThetaJoin, left_relation: Relation, right_relation: Relation) -> Relation:
+        left_relation, right_relation, keys, _, _ = theta_join.plan(left_relation, right_relation)
+        predicate = compile_predicate(theta_join.conditions)
+        width = right_relation.num_attributes
+
+        def generate() -> Iterator[Element]:
+            if len(keys) == 0:
+                return self.block_join(left_relation, right_relation, predicate, width)
+            left_key = get_key([l for l, _ in keys])
+            right_key = get_key([r for _, r in keys])
+            return self.hash_join(left_relation, right_relation, left_key, right_key, predicate, width, 0)
+
+        attributes = left_relation.attributes + right_relation.attributes
+        return LazyRelation(attributes=attributes, generate=generate)
+
+    def product(self, left_relation: Relation, right_relation: Relation) -> Relation:
+        width = right_relation.num_attributes
+        attributes = left_relation.attributes + right_relation.attributes
+        return LazyRelation(
+            attributes=attributes,
+            generate=lambda: self.block_join(left_relation, right_relation, lambda l, r: True, width),
+        )
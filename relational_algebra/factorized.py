@@ -0,0 +1,144 @@
+from itertools import product as cartesian_product
+from math import prod
+from typing import Any, Callable, Iterator, Sequence, cast
+
+from .filter import Condition, ConditionArgument, compile_source, replace_arguments
+from .relation import Attribute, ConstantRelation, Element, LazyRelation, Relation
+
+
+# the factor that holds a column, and the column's (zero-based) index in it
+FactorColumn = tuple[int, int]
+
+
+def compile_getter(columns: Sequence[FactorColumn]) -> Callable[[tuple[Element, ...]], Element]:
+    """
+    Compiles the gathering of the columns from one element of each factor,
+    e.g. lambda c: (c[0][1], c[1][0],) for [(0, 1), (1, 0)].
+    """
+    values = [f"c[{f}][{i}]" for f, i in columns]
+    source = (f"lambda c: ({', '.join(values)},)", {})
+    return cast(Callable[[tuple[Element, ...]], Element], compile_source(source))
+
+
+class FactorizedRelation(LazyRelation):
+    """
+    The product of its factors, kept as the factors themselves rather than as
+    the concatenations of their elements.
+
+    Each column is a column of one of the factors, so projections only pick
+    other columns, selections that only look at one factor only filter that
+    factor, and selections that only look at two neighbouring factors join
+    them into one. The number of elements is the product of the numbers of
+    elements of the factors. The elements are only built when the relation
+    is iterated over or its elements are accessed, in the same order as a
+    product of the factors.
+    """
+    factors: tuple[Relation, ...]
+    columns: tuple[FactorColumn, ...]
+
+    def __init__(
+            self,
+            attributes: tuple[Attribute, ...],
+            factors: tuple[Relation, ...],
+            columns: tuple[FactorColumn, ...],
+    ):
+        assert len(columns) == len(attributes)
+        super().__init__(attributes=attributes, generate=self.generate_elements)
+        self.factors = factors
+        self.columns = columns
+
+    @classmethod
+    def of(cls, left_relation: Relation, right_relation: Relation) -> "FactorizedRelation":
+        """
+        Returns the product of the relations, with the factors of any of them
+        that is already factorized.
+        """
+        factors: list[Relation] = []
+        columns: list[FactorColumn] = []
+        for relation in (left_relation, right_relation):
+            if isinstance(relation, FactorizedRelation) and not relation.is_materialized:
+                columns.extend((len(factors) + f, i) for f, i in relation.columns)
+                factors.extend(relation.factors)
+            else:
+                columns.extend((len(factors), i) for i in range(relation.num_attributes))
+                factors.append(relation)
+        attributes = left_relation.attributes + right_relation.attributes
+        return cls(attributes, tuple(factors), tuple(columns))
+
+    def generate_elements(self) -> Iterator[Element]:
+        # each factor is only read once, like the right side of a product
+        factors = [factor.elements for factor in self.factors]
+        return map(compile_getter(self.columns), cartesian_product(*factors))
+
+    @property
+    def num_elements(self) -> int:
+        return prod(factor.num_elements for factor in self.factors)
+
+    def replace_attribute(self, index: int, attribute: Attribute) -> "FactorizedRelation":
+        attributes = (*self.attributes[:index], attribute, *self.attributes[index+1:])
+        return FactorizedRelation(attributes, self.factors, self.columns)
+
+    def replace_factors(self, factors: dict[int, Relation]) -> "FactorizedRelation":
+        return FactorizedRelation(
+            self.attributes,
+            tuple(factors.get(f, factor) for f, factor in enumerate(self.factors)),
+            self.columns,
+        )
+
+    def project_columns(self, indices: Sequence[int]) -> "FactorizedRelation":
+        """
+        Returns the relation made of the columns at the given (zero-based)
+        indices, over the same factors.
+        """
+        return FactorizedRelation(
+            attributes=tuple(self.attributes[i] for i in indices),
+            factors=self.factors,
+            columns=tuple(self.columns[i] for i in indices),
+        )
+
+    def get_factors(self, condition: Condition) -> set[int]:
+        """
+        Returns the factors that hold the columns the condition looks at.
+        """
+        return {
+            self.columns[argument-1][0]
+            for argument in (condition.left_child.get(), condition.right_child.get())
+            if isinstance(argument, int)
+        }
+
+    def localize(self, condition: Condition, factor: int) -> Condition:
+        """
+        Moves a condition onto the factor's own columns, and the columns of
+        the factor before it, as the left side of a join with it.
+        """
+        def replace(argument: ConditionArgument) -> ConditionArgument:
+            if isinstance(argument, ConstantRelation):
+                return argument
+            f, i = self.columns[argument-1]
+            assert f in (factor - 1, factor)
+            return i + 1 if f == factor else -(i + 1)
+        return replace_arguments(condition, replace)
+
+    def merge_factors(self, factor: int, relation: Relation) -> "FactorizedRelation":
+        """
+        Replaces the factor and the one before it with a single relation,
+        made of the columns of the one before it followed by its own, such as
+        their join.
+        """
+        width = self.factors[factor-1].num_attributes
+        def move(column: FactorColumn) -> FactorColumn:
+            f, i = column
+            if f < factor:
+                return column
+            if f == factor:
+                return factor - 1, width + i
+            return f - 1, i
+        return FactorizedRelation(
+            self.attributes,
+            (*self.factors[:factor-1], relation, *self.factors[factor+1:]),
+            tuple(map(move, self.columns)),
+        )
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # the factors are pickled rather than their product
+        return FactorizedRelation, (self.attributes, self.factors, self.columns)
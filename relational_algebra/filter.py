@@ -1,13 +1,21 @@
-from typing import Any, Callable, Optional, TypeAlias, Union
+from typing import Any, Callable, Iterable, Optional, Sequence, TypeAlias, Union
 
-from expression import InfixBinaryOperation
+from expression import InfixBinaryOperation, InfixBinaryOperator
+from expression.compare import (
+    equals,
+    not_equals,
+    less_than,
+    greater_than,
+    less_than_or_equal_to,
+    greater_than_or_equal_to,
+)
 from .relation import Attribute, ConstantRelation, Element, Relation
 
 
 ConditionArgument: TypeAlias = Union[int, ConstantRelation]
 def get_argument_name(argument: ConditionArgument) -> str:
     if isinstance(argument, ConstantRelation):
-        return argument.value
+        return str(argument)
     assert isinstance(argument, int)
     if argument < 0:
         return f"#{-argument}\u2113"
@@ -26,6 +34,54 @@ def get_condition_name(condition: Condition) -> str:
     return f"{left_name}{condition.operator_name}{right_name}"
 
 
+def replace_arguments(
+        condition: Condition,
+        replace: Callable[[ConditionArgument], ConditionArgument],
+) -> Condition:
+    """
+    Returns a copy of the condition with each argument passed through replace.
+    Generally useful for moving a condition onto a different relation.
+    """
+    return InfixBinaryOperation(
+        condition.f,
+        operator_name=condition.operator_name,
+        left_child=replace(condition.left_child.get()),
+        right_child=replace(condition.right_child.get()),
+    )
+
+
+# the comparison that holds with its arguments swapped, e.g. a < b iff b > a
+CONVERSES: dict[Callable[[Any, Any], bool], InfixBinaryOperator[Any, Any, bool]] = {
+    equals.f: equals,
+    not_equals.f: not_equals,
+    less_than.f: greater_than,
+    greater_than.f: less_than,
+    less_than_or_equal_to.f: greater_than_or_equal_to,
+    greater_than_or_equal_to.f: less_than_or_equal_to,
+}
+# the standard ordering comparisons by name, and the name of each one's converse
+INEQUALITIES: dict[str, Callable[[Any, Any], bool]] = {
+    op.name: op.f
+    for op in (less_than, greater_than, less_than_or_equal_to, greater_than_or_equal_to)
+}
+FLIPPED = {"<": ">", ">": "<", "\u2264": "\u2265", "\u2265": "\u2264"}
+
+def get_converse(condition: Condition) -> Optional[Condition]:
+    """
+    Returns the equivalent condition with its arguments swapped, if the
+    comparison is one of the standard ones.
+    """
+    if condition.f not in CONVERSES:
+        return None
+    converse = CONVERSES[condition.f]
+    return InfixBinaryOperation(
+        converse.f,
+        operator_name=converse.name,
+        left_child=condition.right_child,
+        right_child=condition.left_child,
+    )
+
+
 def resolve_argument(
         argument: ConditionArgument,
         left_relation: Optional[Relation] = None,
@@ -59,3 +115,167 @@ def resolve_argument(
         attribute = relation.attributes[index]
 
     return resolve, attribute
+
+
+class ColumnTypes:
+    """
+    Type inference over the columns of the relations in a selection or join,
+    which only looks at their attributes and never at their elements.
+
+    If a condition is of the form A = B, then we know that the only remaining
+    values in columns A and B belong to the type intersection A & B. Later, if
+    there is another condition B = C, then we can also transitively deduce
+    that A = C. The columns linked by equalities are kept as disjoint sets,
+    each holding the intersection of the types of its members, so the narrowed
+    types are known after a single pass over the conditions.
+    Columns use the same numbering as condition arguments.
+    """
+    parents: dict[int, int]
+    types: dict[int, Attribute]
+
+    def __init__(
+            self,
+            left_attributes: tuple[Attribute, ...] = (),
+            right_attributes: tuple[Attribute, ...] = (),
+    ):
+        self.parents = {}
+        self.types = {
+            **{-(i+1): a for i, a in enumerate(left_attributes)},
+            **{i+1: a for i, a in enumerate(right_attributes)},
+        }
+
+    def find(self, column: int) -> int:
+        parent = self.parents.get(column, column)
+        while parent != column:
+            grandparent = self.parents.get(parent, parent)
+            self.parents[column] = grandparent
+            column, parent = parent, grandparent
+        return column
+
+    def get(self, argument: ConditionArgument) -> Attribute:
+        if isinstance(argument, ConstantRelation):
+            return argument.attribute
+        return self.types[self.find(argument)]
+
+    def unify(self, left: ConditionArgument, right: ConditionArgument) -> Attribute:
+        """
+        Records that the two arguments are equal, returning their narrowed type.
+        Constants narrow the columns they are compared to, but do not link them.
+        """
+        a = self.get(left) & self.get(right)
+        roots = {
+            self.find(argument)
+            for argument in (left, right)
+            if not isinstance(argument, ConstantRelation)
+        }
+        root = min(roots, key=abs)
+        for other in roots - {root}:
+            self.parents[other] = root
+        self.types[root] = a
+        return a
+
+    def narrow(self, relation: Relation, is_left: bool = False) -> Relation:
+        """
+        Returns the relation with the narrowed type of each of its columns.
+        """
+        for i, attribute in enumerate(relation.attributes):
+            a = self.get(-(i+1) if is_left else i+1)
+            if len(a) < len(attribute):
+                relation = relation.replace_attribute(index=i, attribute=a)
+        return relation
+
+
+# rough fraction of elements kept by each kind of condition
+SELECTIVITY = {"=": 0.1, "\u2260": 0.9}
+RANGE_SELECTIVITY = 1 / 3
+
+def get_selectivity(condition: Condition) -> float:
+    return SELECTIVITY.get(condition.operator_name, RANGE_SELECTIVITY)
+
+def order_by_selectivity(conditions: Iterable[Condition]) -> list[Condition]:
+    """
+    Sorts the conditions so that the ones expected to reject the most elements
+    are checked first.
+    """
+    return sorted(conditions, key=get_selectivity)
+
+
+# the Python operator for each standard comparison, inlined by compiled predicates
+OPERATORS: dict[Callable[[Any, Any], bool], str] = {
+    equals.f: "==",
+    not_equals.f: "!=",
+    less_than.f: "<",
+    greater_than.f: ">",
+    less_than_or_equal_to.f: "<=",
+    greater_than_or_equal_to.f: ">=",
+}
+
+# the source of a fused predicate, and the names it refers to
+PredicateSource: TypeAlias = tuple[str, dict[str, Any]]
+
+def get_predicate_source(conditions: Sequence[Condition], joined: bool) -> PredicateSource:
+    """
+    Fuses the conditions into the source of a single lambda.
+    For example, (#1ℓ>#4, #2=#6) becomes
+
+        lambda l, r: r[1] == r[5] and l[0] > r[3]
+
+    so that every condition is checked in one call, short-circuiting on the
+    first one that fails. Standard comparisons are inlined, while constants
+    and any other comparison functions are bound by name.
+    Unlike the compiled lambda, the source can be pickled as long as those
+    constants and functions can.
+    """
+    namespace: dict[str, Any] = {}
+
+    def operand(argument: ConditionArgument) -> str:
+        if isinstance(argument, ConstantRelation):
+            name = f"c{len(namespace)}"
+            namespace[name] = argument.value
+            return name
+        assert isinstance(argument, int)
+        if argument < 0:
+            assert joined
+            return f"l[{-argument-1}]"
+        assert argument > 0
+        return f"r[{argument-1}]"
+
+    clauses: list[str] = []
+    for condition in order_by_selectivity(conditions):
+        lhs = operand(condition.left_child.get())
+        rhs = operand(condition.right_child.get())
+        op = OPERATORS.get(condition.f)
+        if op is None:
+            name = f"f{len(namespace)}"
+            # a decorated function is bound through its operator, which pickles by name
+            operator = InfixBinaryOperator.decorated.get(condition.f)
+            if operator is None:
+                namespace[name] = condition.f
+            else:
+                namespace[name] = operator
+                name = f"{name}.f"
+            clauses.append(f"{name}({lhs}, {rhs})")
+        else:
+            clauses.append(f"{lhs} {op} {rhs}")
+    parameters = "l, r" if joined else "r"
+    body = " and ".join(clauses) if len(clauses) > 0 else "True"
+    return f"lambda {parameters}: {body}", namespace
+
+def compile_source(source: PredicateSource) -> Callable[..., bool]:
+    code, namespace = source
+    return eval(code, dict(namespace))
+
+def compile_conditions(conditions: Sequence[Condition], joined: bool) -> Callable[..., bool]:
+    return compile_source(get_predicate_source(conditions, joined))
+
+def compile_filter(conditions: Sequence[Condition]) -> Callable[[Element], bool]:
+    """
+    Compiles selection conditions into a predicate on a single element.
+    """
+    return compile_conditions(conditions, joined=False)
+
+def compile_predicate(conditions: Sequence[Condition]) -> Callable[[Element, Element], bool]:
+    """
+    Compiles join conditions into a predicate on a (left, right) element pair.
+    """
+    return compile_conditions(conditions, joined=True)
@@ -0,0 +1,255 @@
+from itertools import chain, repeat
+from operator import itemgetter
+from typing import Any, Callable, Iterable, TypeAlias
+
+from expression import Constant, Expression, InfixBinaryOperation, PrefixUnaryOperation
+from .filter import compile_predicate
+from .optimize import (
+    get_projection,
+    get_selection,
+    get_theta_join,
+    is_difference,
+    is_elimination,
+    is_product,
+    is_union,
+)
+from .relation import Attribute, Element, Relation
+
+
+# the change to a bag of elements: how many copies of each element were
+# added, or removed if negative
+Delta: TypeAlias = dict[Element, int]
+
+
+def accumulate(delta: Delta, element: Element, n: int) -> None:
+    delta[element] = delta.get(element, 0) + n
+
+def add(counts: Delta, element: Element, n: int) -> None:
+    count = counts.get(element, 0) + n
+    assert count >= 0, f"cannot delete {element}, which is not there"
+    if count == 0:
+        del counts[element]
+    else:
+        counts[element] = count
+
+def add_all(counts: Delta, delta: Delta) -> None:
+    for element, n in delta.items():
+        add(counts, element, n)
+
+def get_elements(counts: Delta) -> tuple[Element, ...]:
+    return tuple(chain.from_iterable(repeat(element, n) for element, n in counts.items()))
+
+def get_counts(elements: Iterable[Element]) -> Delta:
+    counts: Delta = {}
+    for element in elements:
+        counts[element] = counts.get(element, 0) + 1
+    return counts
+
+def get_key(columns: list[int]) -> Callable[[Element], Any]:
+    if len(columns) == 0:
+        # a product, or a join without equalities, puts every element in one bucket
+        return lambda element: ()
+    return itemgetter(*columns)
+
+def always(l: Element, r: Element) -> bool:
+    # a product pairs up every element of one side with every one of the other
+    return True
+
+
+class MaterializedView:
+    """
+    The result of an expression, kept up to date as elements are inserted
+    into and deleted from its base relations, in time proportional to the
+    change rather than to the size of the relations.
+
+    Each change flows up the tree as a delta. Selections, projections and
+    unions pass their deltas through. Joins and products keep the elements
+    of both sides, bucketed by their hash keys, and join each delta only
+    against the matching bucket of the other side. Eliminations keep the
+    count of each element below them, and differences keep the counts of
+    both sides, so that an element only changes once its count crosses
+    zero. Any other operator is evaluated again from the counts of its
+    children.
+
+    The base relations themselves are left as they are.
+    """
+    expression: Expression[Relation]
+    counts: Delta
+    _nodes: list[Expression[Relation]]
+    _schemas: dict[int, Relation]
+    _states: dict[int, list[Any]]
+
+    def __init__(self, x: Expression[Relation]):
+        self.expression = x
+        self.counts = {}
+        self._nodes = []
+        self._schemas = {}
+        self._states = {}
+        self.visit(x)
+        for leaf in self._nodes:
+            if isinstance(leaf, Constant):
+                self.propagate({id(leaf): get_counts(leaf.value)})
+
+    @property
+    def attributes(self) -> tuple[Attribute, ...]:
+        return self._schemas[id(self.expression)].attributes
+
+    @property
+    def result(self) -> Relation:
+        return Relation.unchecked(self.attributes, get_elements(self.counts))
+
+    def visit(self, x: Expression[Relation]) -> Relation:
+        """
+        Orders the nodes of the tree so that children come before their
+        parents, checking each operator on empty relations to find the
+        attributes of its result, and sets up the state of each operator.
+        """
+        if id(x) in self._schemas:
+            return self._schemas[id(x)]
+        empty = [self.visit(child) for child in x.children]
+        if isinstance(x, Constant):
+            assert isinstance(x.value, Relation)
+            schema = Relation(x.value.attributes, ())
+        else:
+            assert isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation))
+            schema = x.f(*empty)
+        theta_join = get_theta_join(x)
+        if theta_join is not None:
+            *_, keys, _, _ = theta_join.plan(*empty)
+            self._states[id(x)] = [
+                {}, {},
+                get_key([l for l, _ in keys]), get_key([r for _, r in keys]),
+                compile_predicate(theta_join.conditions),
+            ]
+        elif is_product(x):
+            self._states[id(x)] = [{}, {}, get_key([]), get_key([]), always]
+        elif is_elimination(x):
+            self._states[id(x)] = [{}]
+        elif is_difference(x):
+            self._states[id(x)] = [{}, {}]
+        elif not (
+            isinstance(x, Constant)
+            or get_selection(x) is not None
+            or get_projection(x) is not None
+            or is_union(x)
+        ):
+            # the counts of each child, and of the result
+            self._states[id(x)] = [*({} for _ in x.children), {}]
+        self._schemas[id(x)] = schema
+        self._nodes.append(x)
+        return schema
+
+    def propagate(self, deltas: dict[int, Delta]) -> Delta:
+        for x in self._nodes:
+            if isinstance(x, Constant):
+                continue
+            inputs = [deltas.get(id(child)) for child in x.children]
+            if all(delta is None or len(delta) == 0 for delta in inputs):
+                continue
+            deltas[id(x)] = self.apply(x, [delta or {} for delta in inputs])
+        delta = deltas.get(id(self.expression), {})
+        add_all(self.counts, delta)
+        return delta
+
+    def apply(self, x: Expression[Relation], inputs: list[Delta]) -> Delta:
+        """
+        Returns the change to the result of the operator, given the changes
+        to the results of its children.
+        """
+        output: Delta = {}
+        selection = get_selection(x)
+        projection = get_projection(x)
+        if selection is not None:
+            predicate = selection.predicate
+            for element, n in inputs[0].items():
+                if predicate(element):
+                    accumulate(output, element, n)
+        elif projection is not None:
+            indices = [i-1 for i in projection.indices]
+            for element, n in inputs[0].items():
+                accumulate(output, tuple(element[i] for i in indices), n)
+        elif is_union(x):
+            for delta in inputs:
+                for element, n in delta.items():
+                    accumulate(output, element, n)
+        elif get_theta_join(x) is not None or is_product(x):
+            left_buckets, right_buckets, left_key, right_key, predicate = self._states[id(x)]
+            left_delta, right_delta = inputs
+            # the change on the left meets the old right side, and then the
+            # change on the right meets the new left side
+            for left_element, n in left_delta.items():
+                for right_element, m in right_buckets.get(left_key(left_element), {}).items():
+                    if predicate(left_element, right_element):
+                        accumulate(output, left_element + right_element, n * m)
+            for left_element, n in left_delta.items():
+                add(left_buckets.setdefault(left_key(left_element), {}), left_element, n)
+            for right_element, m in right_delta.items():
+                for left_element, n in left_buckets.get(right_key(right_element), {}).items():
+                    if predicate(left_element, right_element):
+                        accumulate(output, left_element + right_element, n * m)
+            for right_element, m in right_delta.items():
+                add(right_buckets.setdefault(right_key(right_element), {}), right_element, m)
+        elif is_elimination(x):
+            (counts,) = self._states[id(x)]
+            for element, n in inputs[0].items():
+                before = element in counts
+                add(counts, element, n)
+                after = element in counts
+                if before != after:
+                    output[element] = 1 if after else -1
+        elif is_difference(x):
+            # an element is in the result as often as on the left, unless it
+            # is on the right at all
+            left_counts, right_counts = self._states[id(x)]
+            def count(element: Element) -> int:
+                return 0 if element in right_counts else left_counts.get(element, 0)
+            changed = set(chain(*inputs))
+            before = {element: count(element) for element in changed}
+            add_all(left_counts, inputs[0])
+            add_all(right_counts, inputs[1])
+            for element in changed:
+                output[element] = count(element) - before[element]
+        else:
+            assert isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation))
+            *children_counts, counts = self._states[id(x)]
+            for child_counts, delta in zip(children_counts, inputs):
+                add_all(child_counts, delta)
+            relations = [
+                Relation.unchecked(self._schemas[id(child)].attributes, get_elements(child_counts))
+                for child, child_counts in zip(x.children, children_counts)
+            ]
+            result = get_counts(x.f(*relations))
+            for element in set(result) | set(counts):
+                output[element] = result.get(element, 0) - counts.get(element, 0)
+            self._states[id(x)][-1] = result
+        return {element: n for element, n in output.items() if n != 0}
+
+    def update(
+            self,
+            relation: Relation,
+            inserted: Iterable[Element] = (),
+            deleted: Iterable[Element] = (),
+    ) -> Delta:
+        """
+        Brings the view up to date after the elements were inserted into and
+        deleted from a base relation, returning the change to the result.
+        """
+        delta = get_counts(inserted)
+        A = relation.num_attributes
+        for element in deleted:
+            delta[element] = delta.get(element, 0) - 1
+        for element in delta:
+            assert len(element) == A, f"{element} does not have {A} values"
+        leaves = [
+            leaf for leaf in self._nodes
+            if isinstance(leaf, Constant) and leaf.value is relation
+        ]
+        assert len(leaves) > 0, f"{relation} is not in the view"
+        return self.propagate({id(leaf): delta for leaf in leaves})
+
+    def insert(self, relation: Relation, elements: Iterable[Element]) -> Delta:
+        return self.update(relation, inserted=elements)
+
+    def delete(self, relation: Relation, elements: Iterable[Element]) -> Delta:
+        return self.update(relation, deleted=elements)
+
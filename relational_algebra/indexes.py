@@ -0,0 +1,153 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, Optional, Sequence, TypeAlias, Union
+
+from expression.compare import equals
+from .filter import FLIPPED, INEQUALITIES, Condition, order_by_selectivity
+from .relation import ConstantRelation, Relation
+
+
+def search_sorted(keys: Sequence[Any], probes: Iterable[tuple[str, Any]]) -> tuple[int, int]:
+    """
+    Returns the range [lo, hi) of the sorted keys whose value v satisfies
+    "v op value" for every (op, value) in probes.
+    """
+    lo, hi = 0, len(keys)
+    for op, value in probes:
+        if op == "<":
+            hi = min(hi, bisect_left(keys, value))
+        elif op == "\u2264":
+            hi = min(hi, bisect_right(keys, value))
+        elif op == ">":
+            lo = max(lo, bisect_right(keys, value))
+        else:
+            assert op == "\u2265"
+            lo = max(lo, bisect_left(keys, value))
+    return lo, hi
+
+
+class HashIndex:
+    """
+    Maps each value in a column of a relation to the positions of the
+    elements that hold it.
+    """
+    column: int
+    positions: dict[Any, list[int]]
+
+    def __init__(self, relation: Relation, column: int):
+        A = relation.num_attributes
+        assert 0 < column <= A, f"index #{column} out of bounds (max {A})"
+        self.column = column
+        self.positions = {}
+        for i, element in enumerate(relation.elements):
+            self.positions.setdefault(element[column-1], []).append(i)
+
+    def lookup(self, value: Any) -> Sequence[int]:
+        """
+        Returns the positions of the elements whose value in the column is
+        equal to the given value, in order.
+        """
+        return self.positions.get(value, ())
+
+
+class SortedIndex:
+    """
+    Keeps the positions of the elements of a relation sorted by their value
+    in a column, so that equalities and ranges can be found by binary search.
+    """
+    column: int
+    order: list[int]
+    keys: list[Any]
+
+    def __init__(self, relation: Relation, column: int):
+        A = relation.num_attributes
+        assert 0 < column <= A, f"index #{column} out of bounds (max {A})"
+        elements = relation.elements
+        self.column = column
+        self.order = sorted(range(len(elements)), key=lambda i: elements[i][column-1])
+        self.keys = [elements[i][column-1] for i in self.order]
+
+    def scan(self, probes: Iterable[tuple[str, Any]]) -> list[int]:
+        """
+        Returns the positions of the elements whose value v in the column
+        satisfies "v op value" for every (op, value) in probes, in order.
+        """
+        lo, hi = search_sorted(self.keys, probes)
+        return sorted(self.order[lo:hi])
+
+
+Index: TypeAlias = Union[HashIndex, SortedIndex]
+
+
+def create_hash_index(relation: Relation, column: int) -> HashIndex:
+    """
+    Builds a hash index on a column (numbered from 1, like #1) of the
+    relation and attaches it to the relation. Selections of the form #i = c
+    and joins on #i = #jℓ then look elements up in it instead of scanning.
+    """
+    index = HashIndex(relation, column)
+    relation.indexes.append(index)
+    return index
+
+def create_sorted_index(relation: Relation, column: int) -> SortedIndex:
+    """
+    Builds a sorted index on a column (numbered from 1, like #1) of the
+    relation and attaches it to the relation. Selections comparing #i with a
+    constant and band joins on #i then search it instead of scanning.
+    """
+    index = SortedIndex(relation, column)
+    relation.indexes.append(index)
+    return index
+
+
+def get_hash_index(relation: Relation, column: int) -> Optional[HashIndex]:
+    for index in relation.indexes:
+        if isinstance(index, HashIndex) and index.column == column:
+            return index
+    return None
+
+def get_sorted_index(relation: Relation, column: int) -> Optional[SortedIndex]:
+    for index in relation.indexes:
+        if isinstance(index, SortedIndex) and index.column == column:
+            return index
+    return None
+
+
+def search_indexes(relation: Relation, conditions: Sequence[Condition]) -> Optional[Sequence[int]]:
+    """
+    Finds the positions of the elements that may satisfy the selection
+    conditions, using the indexes of the relation on the most selective
+    condition that compares an indexed column with a constant.
+    Returns None if no index applies, in which case the relation is scanned.
+    """
+    if len(relation.indexes) == 0:
+        return None
+    for condition in order_by_selectivity(conditions):
+        if condition.f is equals.f:
+            op = "="
+        elif INEQUALITIES.get(condition.operator_name) is condition.f:
+            op = condition.operator_name
+        else:
+            continue
+        l = condition.left_child.get()
+        r = condition.right_child.get()
+        if isinstance(l, int) and isinstance(r, ConstantRelation):
+            column, value = l, r.value
+        elif isinstance(r, int) and isinstance(l, ConstantRelation):
+            column, value = r, l.value
+            op = FLIPPED.get(op, op)
+        else:
+            continue
+
+        try:
+            hash_index = get_hash_index(relation, column)
+            if op == "=" and hash_index is not None:
+                return hash_index.lookup(value)
+            sorted_index = get_sorted_index(relation, column)
+            if op == "=" and sorted_index is not None:
+                return sorted_index.scan((("\u2264", value), ("\u2265", value)))
+            if sorted_index is not None:
+                return sorted_index.scan(((op, value),))
+        except TypeError:
+            # the constant cannot be hashed or compared with the column
+            continue
+    return None
@@ -1,8 +1,338 @@
-from typing import Union
+from collections import Counter
+from functools import cached_property
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence, Union
 
 from expression import InfixBinaryOperator
-from .filter import Condition, get_condition_name, resolve_argument
-from .relation import Relation
+from expression.compare import equals
+from .columnar import ColumnarRelation, columnar_join
+from .filter import (
+    FLIPPED,
+    INEQUALITIES,
+    ColumnTypes,
+    Condition,
+    compile_predicate,
+    get_condition_name,
+    resolve_argument,
+)
+from .indexes import HashIndex, SortedIndex, get_hash_index, get_sorted_index, search_sorted
+from .relation import Element, LazyRelation, Relation
+
+
+Predicate = Callable[[Element, Element], bool]
+
+# (left index, operator name, right index), read as "left operator right"
+Bound = tuple[int, str, int]
+
+# the narrowed relations, hash keys, band bounds and residual conditions of a join
+JoinPlan = tuple[Relation, Relation, list[tuple[int, int]], list[Bound], list[Condition]]
+
+
+def nested_loop_join(
+        left_elements: Iterable[Element],
+        right_elements: Sequence[Element],
+        predicate: Predicate,
+) -> Iterator[Element]:
+    """
+    Compares every pair of elements, keeping the concatenation of each pair
+    that satisfies the predicate.
+    """
+    return (
+        left_element + right_element
+        for left_element in left_elements
+        for right_element in right_elements
+        if predicate(left_element, right_element)
+    )
+
+
+def hash_join(
+        left_elements: Iterable[Element],
+        right_elements: Sequence[Element],
+        keys: Sequence[tuple[int, int]],
+        predicate: Predicate,
+) -> Iterator[Element]:
+    """
+    Joins on the equality of each (left index, right index) pair in keys,
+    keeping only the pairs that also satisfy the residual predicate.
+
+    The hash table is built on the right side and probed with the left side
+    as it streams through, unless the left side is already materialized and
+    smaller. Either way, the output is in the same order as a nested loop join.
+    """
+    left_key: Callable[[Element], Any] = itemgetter(*(l for l, _ in keys))
+    right_key: Callable[[Element], Any] = itemgetter(*(r for _, r in keys))
+
+    if not isinstance(left_elements, Sequence) or len(right_elements) <= len(left_elements):
+        table: dict[Any, list[Element]] = {}
+        for right_element in right_elements:
+            table.setdefault(right_key(right_element), []).append(right_element)
+        for left_element in left_elements:
+            for right_element in table.get(left_key(left_element), ()):
+                if predicate(left_element, right_element):
+                    yield left_element + right_element
+    else:
+        positions: dict[Any, list[int]] = {}
+        for i, left_element in enumerate(left_elements):
+            positions.setdefault(left_key(left_element), []).append(i)
+        # collect matches per left element to preserve the nested loop order
+        matches: list[list[Element]] = [[] for _ in left_elements]
+        for right_element in right_elements:
+            for i in positions.get(right_key(right_element), ()):
+                if predicate(left_elements[i], right_element):
+                    matches[i].append(right_element)
+        for left_element, right_matches in zip(left_elements, matches):
+            for right_element in right_matches:
+                yield left_element + right_element
+
+
+def index_join(
+        left_elements: Iterable[Element],
+        right_elements: Sequence[Element],
+        keys: Sequence[tuple[int, int]],
+        hash_index: HashIndex,
+        predicate: Predicate,
+) -> Iterator[Element]:
+    """
+    Joins on the equality of each (left index, right index) pair in keys,
+    looking each left element up in an existing hash index on the right
+    column of the first key instead of building a hash table.
+    The output is in the same order as a nested loop join.
+    """
+    (l, r), *others = keys
+    assert hash_index.column == r + 1
+    for left_element in left_elements:
+        for position in hash_index.lookup(left_element[l]):
+            right_element = right_elements[position]
+            if all(left_element[i] == right_element[j] for i, j in others) \
+                    and predicate(left_element, right_element):
+                yield left_element + right_element
+
+
+def band_join(
+        left_elements: Iterable[Element],
+        right_elements: Sequence[Element],
+        bounds: Sequence[Bound],
+        predicate: Predicate,
+        sorted_index: Optional[SortedIndex] = None,
+) -> Iterator[Element]:
+    """
+    Joins on the inequalities in bounds, which must all share either the same
+    left index or the same right index, keeping only the pairs that also
+    satisfy the residual predicate.
+
+    The side with the shared column is sorted on it, and each element on the
+    other side looks up its matching range with binary search. For example,
+    #1ℓ ≤ #2 together with #1ℓ > #3 scans the left elements whose first value
+    lies in the band (#3, #2] of each right element.
+    If the right elements already have a sorted index on the shared column,
+    it is searched instead.
+    Either way, the output is in the same order as a nested loop join.
+    """
+    left_indices = {l for l, _, _ in bounds}
+    right_indices = {r for _, _, r in bounds}
+    sort_left = sorted_index is None and len(left_indices) == 1 and (
+        len(right_indices) > 1
+        or isinstance(left_elements, Sequence) and len(left_elements) <= len(right_elements)
+    )
+    if sort_left:
+        left_elements = tuple(left_elements)
+        sorted_elements = left_elements
+        (index,) = left_indices
+        probes = [(op, r) for _, op, r in bounds]
+    else:
+        sorted_elements = right_elements
+        (index,) = right_indices
+        probes = [(FLIPPED[op], l) for l, op, _ in bounds]
+
+    if sorted_index is not None:
+        assert sorted_index.column == index + 1
+        order, keys = sorted_index.order, sorted_index.keys
+    else:
+        try:
+            order = sorted(range(len(sorted_elements)), key=lambda i: sorted_elements[i][index])
+        except TypeError:
+            # the column values cannot be sorted, so compare every pair
+            def satisfies(left_element: Element, right_element: Element) -> bool:
+                return all(
+                    INEQUALITIES[op](left_element[l], right_element[r])
+                    for l, op, r in bounds
+                ) and predicate(left_element, right_element)
+            return nested_loop_join(left_elements, right_elements, satisfies)
+        keys = [sorted_elements[i][index] for i in order]
+
+    def scan(probe_element: Element) -> list[int]:
+        lo, hi = search_sorted(keys, ((op, probe_element[i]) for op, i in probes))
+        return order[lo:hi]
+
+    def generate_sorted_left(left_elements: Sequence[Element]) -> Iterator[Element]:
+        # collect matches per left element to preserve the nested loop order
+        matches: list[list[Element]] = [[] for _ in left_elements]
+        for right_element in right_elements:
+            for i in scan(right_element):
+                if predicate(left_elements[i], right_element):
+                    matches[i].append(right_element)
+        for left_element, right_matches in zip(left_elements, matches):
+            for right_element in right_matches:
+                yield left_element + right_element
+
+    def generate_sorted_right() -> Iterator[Element]:
+        for left_element in left_elements:
+            for i in sorted(scan(left_element)):
+                right_element = right_elements[i]
+                if predicate(left_element, right_element):
+                    yield left_element + right_element
+
+    if sort_left:
+        return generate_sorted_left(sorted_elements)
+    return generate_sorted_right()
+
+
+class ThetaJoin:
+    conditions: tuple[Condition, ...]
+    name: str
+
+    def __init__(self, conditions: tuple[Condition, ...]):
+        self.conditions = conditions
+        self.name = f"\u00d7 \u03c3[{','.join(get_condition_name(c) for c in conditions)}]"
+
+    @cached_property
+    def predicates(self) -> dict[tuple[int, ...], Predicate]:
+        return {}
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the compiled predicates cannot be pickled, but can be compiled again
+        state = self.__dict__.copy()
+        state.pop("predicates", None)
+        return state
+
+    def get_predicate(self, conditions: Sequence[Condition]) -> Predicate:
+        """
+        Compiles some of the conditions into a predicate, only once for each
+        set of them, so that a join that is evaluated again reuses it.
+        """
+        key = tuple(id(condition) for condition in conditions)
+        predicate = self.predicates.get(key)
+        if predicate is None:
+            predicate = self.predicates[key] = compile_predicate(conditions)
+        return predicate
+
+    def plan(self, left_relation: Relation, right_relation: Relation) -> JoinPlan:
+        """
+        Checks the conditions against the relations and narrows their types,
+        then sorts the conditions into hash keys, band bounds and residuals.
+        """
+        call_name = f"{left_relation} {self.name} {right_relation}"
+
+        keys: list[tuple[int, int]] = []
+        ranges: list[tuple[Bound, Condition]] = []
+        residuals: list[Condition] = []
+
+        types = ColumnTypes(left_relation.attributes, right_relation.attributes)
+        for c, condition in enumerate(self.conditions):
+            condition_name = f"{call_name} condition #{c+1} ({get_condition_name(condition)})"
+            l = condition.left_child.get()
+            r = condition.right_child.get()
+            assert isinstance(l, int) or isinstance(r, int)
+
+            try:
+                resolve_argument(l, left_relation, right_relation)
+                resolve_argument(r, left_relation, right_relation)
+            except Exception as e:
+                e.args = (f"{condition_name}:", *e.args)
+                raise
+
+            if condition.operator_name == "=":
+                la, ra = types.get(l), types.get(r)
+                a = types.unify(l, r)
+                assert len(a) > 0, \
+                    f"{condition_name}: incompatible types {la} versus {ra}"
+
+                # an equality between one column on each side is a hash key
+                if (
+                    condition.f is equals.f
+                    and isinstance(l, int) and isinstance(r, int) and (l < 0) != (r < 0)
+                ):
+                    keys.append((-l-1, r-1) if l < 0 else (-r-1, l-1))
+                    continue
+
+            # an inequality between one column on each side is a band bound
+            if (
+                INEQUALITIES.get(condition.operator_name) is condition.f
+                and isinstance(l, int) and isinstance(r, int) and (l < 0) != (r < 0)
+            ):
+                op = condition.operator_name
+                bound = (-l-1, op, r-1) if l < 0 else (-r-1, FLIPPED[op], l-1)
+                ranges.append((bound, condition))
+                continue
+
+            residuals.append(condition)
+
+        # type inference only looks at the attributes, so the elements are
+        # left alone until the join itself
+        left_relation = types.narrow(left_relation, is_left=True)
+        right_relation = types.narrow(right_relation)
+
+        bounds: list[Bound] = []
+        if len(keys) == 0 and len(ranges) > 0:
+            # range scan on the column with the most bounds, filter on the rest
+            columns = Counter(
+                column
+                for (l, _, r), _ in ranges
+                for column in ((True, l), (False, r))
+            )
+            (is_left, index), _ = columns.most_common(1)[0]
+            for bound, residual in ranges:
+                if bound[0 if is_left else 2] == index:
+                    bounds.append(bound)
+                else:
+                    residuals.append(residual)
+        else:
+            residuals.extend(residual for _, residual in ranges)
+
+        return left_relation, right_relation, keys, bounds, residuals
+
+    def __call__(self, left_relation: Relation, right_relation: Relation) -> Relation:
+        return self.run(self.plan(left_relation, right_relation))
+
+    def run(self, plan: JoinPlan) -> Relation:
+        """
+        Joins the relations of a plan made by plan().
+        """
+        left_relation, right_relation, keys, bounds, residuals = plan
+        predicate = self.get_predicate(residuals)
+
+        if isinstance(left_relation, ColumnarRelation) and isinstance(right_relation, ColumnarRelation):
+            return columnar_join(
+                left_relation,
+                right_relation,
+                keys,
+                bounds,
+                residuals,
+            )
+
+        def generate() -> Iterator[Element]:
+            # the right elements are kept, the left elements stream through
+            left_elements: Iterable[Element] = (
+                left_relation.elements if left_relation.is_materialized else left_relation
+            )
+            right_elements = right_relation.elements
+            if len(keys) > 0:
+                for k, (_, r) in enumerate(keys):
+                    hash_index = get_hash_index(right_relation, r+1)
+                    if hash_index is not None:
+                        # probe the existing index with the left elements
+                        keys_first = [keys[k], *keys[:k], *keys[k+1:]]
+                        return index_join(left_elements, right_elements, keys_first, hash_index, predicate)
+                return hash_join(left_elements, right_elements, keys, predicate)
+            if len(bounds) > 0:
+                sorted_index = None
+                if len({r for _, _, r in bounds}) == 1:
+                    sorted_index = get_sorted_index(right_relation, bounds[0][2]+1)
+                return band_join(left_elements, right_elements, bounds, predicate, sorted_index)
+            return nested_loop_join(left_elements, right_elements, predicate)
+
+        attributes = left_relation.attributes + right_relation.attributes
+        return LazyRelation(attributes=attributes, generate=generate)
 
 
 class Join:
@@ -10,63 +340,8 @@ class Join:
             self,
             cond: Union[Condition, tuple[Condition, ...]],
     ) -> InfixBinaryOperator[Relation, Relation, Relation]:
-        conditions = list(cond) if isinstance(cond, tuple) else [cond]
-        name = f"\u00d7 \u03c3[{','.join(get_condition_name(c) for c in conditions)}]"
-
-        def _join(left_relation: Relation, right_relation: Relation) -> Relation:
-            call_name = f"{left_relation} {name} {right_relation}"
-            element_pairs = [
-                (left_element, right_element)
-                for left_element in left_relation.elements
-                for right_element in right_relation.elements
-            ]
-
-            converged: bool = False
-            while not converged:
-                converged = True
-                for c, condition in enumerate(conditions):
-                    condition_name = f"{call_name} condition #{c+1} ({get_condition_name(condition)})"
-                    l = condition.left_child.get()
-                    r = condition.right_child.get()
-                    assert isinstance(l, int) or isinstance(r, int)
-
-                    try:
-                        lhs, la = resolve_argument(l, left_relation, right_relation)
-                        rhs, ra = resolve_argument(r, left_relation, right_relation)
-                    except Exception as e:
-                        e.args = (f"{condition_name}:", *e.args)
-                        raise
-
-                    if condition.operator_name == "=":
-                        a = la & ra
-                        assert len(a) > 0, \
-                            f"{condition_name}: incompatible types {la} versus {ra}"
-                        if len(a) < len(la) and isinstance(l, int):
-                            converged = False
-                            if l < 0:
-                                left_relation = left_relation.replace_attribute(index=-l-1, attribute=a)
-                            else:
-                                assert l > 0
-                                right_relation = right_relation.replace_attribute(index=l-1, attribute=a)
-                        if len(a) < len(ra) and isinstance(r, int):
-                            converged = False
-                            if r < 0:
-                                left_relation = left_relation.replace_attribute(index=-r-1, attribute=a)
-                            else:
-                                assert r > 0
-                                right_relation = right_relation.replace_attribute(index=r-1, attribute=a)
-
-                    element_pairs = list(filter(
-                        lambda pair: condition.f(lhs(*pair), rhs(*pair)),
-                        element_pairs,
-                    ))
-
-            attributes = left_relation.attributes + right_relation.attributes
-            return Relation(attributes=attributes, elements=[
-                left_element + right_element
-                for left_element, right_element in element_pairs
-            ])
-
-        return InfixBinaryOperator(_join, name=name)
+        conditions = cond if isinstance(cond, tuple) else (cond,)
+        theta_join = ThetaJoin(conditions)
+        return InfixBinaryOperator(theta_join, name=theta_join.name)
 
 join = Join()
@@ -0,0 +1,333 @@
+import csv
+import gc
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterable, Iterator, Optional, Sequence, TypeAlias, cast
+
+if TYPE_CHECKING:
+    # pyarrow has no type stubs, so its objects are only known as Any
+    pa: Any
+    HAS_PYARROW: bool
+else:
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+        HAS_PYARROW = True
+    except ImportError: # pyarrow is optional, but needed to read Parquet and Arrow files
+        pa = None
+        HAS_PYARROW = False
+
+from .columnar import HAS_NUMPY, Column, ColumnarRelation, np, to_column
+from .filter import compile_source
+from .relation import Attribute, Element, Relation
+
+
+# how many elements to read at a time
+BATCH_SIZE = 65536
+
+Converter: TypeAlias = Callable[[str], Any]
+
+
+@contextmanager
+def paused_gc() -> Generator[None, None, None]:
+    """
+    Pauses the cyclic garbage collector, which would otherwise keep scanning
+    every tuple built so far, even though none of them can be in a cycle.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def infer_converter(values: Sequence[str]) -> Converter:
+    """
+    Picks the first of int, float and str that can parse every value, e.g.
+
+        >>> infer_converter(["30"]), infer_converter(["1", "2.5"])
+        (<class 'int'>, <class 'float'>)
+        >>> infer_converter(["alice"]), infer_converter(["x", "7"])
+        (<class 'str'>, <class 'str'>)
+
+    Each converter is tried on all of the values, so they must be a sequence
+    rather than an iterator.
+    """
+    for converter in (int, float):
+        try:
+            for value in values:
+                converter(value)
+        except ValueError:
+            continue
+        return converter
+    return str
+
+def compile_converter(converters: Sequence[Converter]) -> Callable[[Sequence[str]], Element]:
+    """
+    Compiles the conversion of a row of strings into an element, e.g.
+
+        lambda r: (c0(r[0]), r[1], c2(r[2]),)
+
+    for (int, str, int), so that each row takes a single call.
+    """
+    namespace: dict[str, Any] = {}
+    values: list[str] = []
+    for i, converter in enumerate(converters):
+        if converter is str:
+            values.append(f"r[{i}]")
+        else:
+            namespace[f"c{i}"] = converter
+            values.append(f"c{i}(r[{i}])")
+    source = (f"lambda r: ({', '.join(values)},)", namespace)
+    return cast(Callable[[Sequence[str]], Element], compile_source(source))
+
+
+def to_columns(columns: Sequence[Any]) -> list[Column]:
+    return [c if isinstance(c, np.ndarray) else to_column(c) for c in columns]
+
+def collect(batches: Iterator[Relation], columnar: bool) -> Relation:
+    """
+    Gathers every batch into a single relation. The first batch is always
+    there, and holds the attributes even if it has no elements.
+    """
+    with paused_gc():
+        first = next(batches)
+        if columnar:
+            assert isinstance(first, ColumnarRelation)
+            parts = [[first.decode(i)] for i in range(first.num_attributes)]
+            for batch in batches:
+                assert isinstance(batch, ColumnarRelation)
+                for i, part in enumerate(parts):
+                    part.append(batch.decode(i))
+            return ColumnarRelation(
+                attributes=first.attributes,
+                columns=[
+                    np.concatenate([c for c in part if len(c) > 0] or part[:1])
+                    for part in parts
+                ],
+            )
+        elements = list(first.elements)
+        for batch in batches:
+            elements.extend(batch.elements)
+        return Relation.unchecked(first.attributes, tuple(elements))
+
+def split(batches: Iterator[Relation]) -> Iterator[Relation]:
+    return (batch for batch in batches if batch.num_elements > 0)
+
+
+def csv_batches(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]],
+        types: Optional[Sequence[Converter]],
+        delimiter: str,
+        header: bool,
+        batch_size: int,
+        columnar: bool,
+        encoding: str,
+) -> Iterator[Relation]:
+    assert batch_size > 0
+    assert not columnar or HAS_NUMPY, "ColumnarRelation requires numpy"
+    with open(path, newline="", encoding=encoding) as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        names = next(reader, None) if header else None
+        if attributes is None:
+            assert names is not None, f"{path}: the attributes must be given without a header"
+            attributes = tuple(Attribute(name) for name in names)
+        A = len(attributes)
+        assert types is None or len(types) == A, f"{path}: expected {A} types"
+
+        converters = None if types is None else list(types)
+        convert = None if converters is None else compile_converter(converters)
+        first = True
+        while True:
+            rows = list(islice(reader, batch_size))
+            if len(rows) == 0 and not first:
+                return
+            first = False
+            assert set(map(len, rows)) <= {A}, f"{path}: every row must have {A} values"
+            with paused_gc():
+                if converters is None:
+                    # the types are inferred once, from the first batch
+                    converters = [infer_converter([row[i] for row in rows]) for i in range(A)]
+                    convert = compile_converter(converters)
+                assert convert is not None
+                if columnar:
+                    batch: Relation = ColumnarRelation(attributes, to_columns([
+                        list(map(itemgetter(i), rows)) if f is str else list(map(f, map(itemgetter(i), rows)))
+                        for i, f in enumerate(converters)
+                    ]))
+                else:
+                    batch = Relation.unchecked(attributes, tuple(map(convert, rows)))
+            yield batch
+
+
+def read_csv(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]] = None,
+        types: Optional[Sequence[Converter]] = None,
+        delimiter: str = ",",
+        header: bool = True,
+        batch_size: int = BATCH_SIZE,
+        columnar: bool = False,
+        encoding: str = "utf-8",
+) -> Relation:
+    """
+    Reads a CSV file into a relation, batch_size rows at a time.
+
+    The attributes default to one per column of the header, named after it.
+    The types are functions that parse the values of each column, such as
+    int; by default each column gets the first of int, float and str that
+    parses all of its values in the first batch.
+    With columnar, the columns go straight into a ColumnarRelation without
+    ever building the elements.
+    """
+    batches = csv_batches(path, attributes, types, delimiter, header, batch_size, columnar, encoding)
+    return collect(batches, columnar)
+
+def iter_csv(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]] = None,
+        types: Optional[Sequence[Converter]] = None,
+        delimiter: str = ",",
+        header: bool = True,
+        batch_size: int = BATCH_SIZE,
+        columnar: bool = False,
+        encoding: str = "utf-8",
+) -> Iterator[Relation]:
+    """
+    Reads a CSV file like read_csv, but as a relation per batch, so that only
+    one batch is held in memory at a time.
+    """
+    return split(csv_batches(path, attributes, types, delimiter, header, batch_size, columnar, encoding))
+
+
+def arrow_batches(
+        schema: Any,
+        record_batches: Iterable[Any],
+        attributes: Optional[tuple[Attribute, ...]],
+        columnar: bool,
+) -> Iterator[Relation]:
+    assert not columnar or HAS_NUMPY, "ColumnarRelation requires numpy"
+    if attributes is None:
+        attributes = tuple(Attribute(name) for name in schema.names)
+    assert len(attributes) == len(schema.names), f"expected {len(schema.names)} attributes"
+
+    def convert(array: Any) -> Any:
+        # numbers without nulls are the only arrays NumPy can share as they are
+        if columnar and array.null_count == 0 and (
+            pa.types.is_integer(array.type)
+            or pa.types.is_floating(array.type)
+            or pa.types.is_boolean(array.type)
+        ):
+            return array.to_numpy(zero_copy_only=False)
+        return array.to_pylist()
+
+    def make_batch(columns: Sequence[Any]) -> Relation:
+        if columnar:
+            return ColumnarRelation(attributes, to_columns(columns))
+        # the columns of a record batch all have the same length
+        return Relation.unchecked(attributes, tuple(zip(*columns)))
+
+    yield make_batch([[] for _ in attributes])
+    for record_batch in record_batches:
+        if record_batch.num_rows > 0:
+            with paused_gc():
+                batch = make_batch([convert(array) for array in record_batch.columns])
+            yield batch
+
+def parquet_batches(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]],
+        columns: Optional[Sequence[str]],
+        batch_size: int,
+        columnar: bool,
+) -> Iterator[Relation]:
+    assert HAS_PYARROW, "reading Parquet requires pyarrow"
+    file = pa.parquet.ParquetFile(path)
+    schema = file.schema_arrow
+    if columns is not None:
+        schema = pa.schema([schema.field(name) for name in columns])
+    record_batches = file.iter_batches(
+        batch_size=batch_size,
+        columns=None if columns is None else list(columns),
+    )
+    return arrow_batches(schema, record_batches, attributes, columnar)
+
+def ipc_batches(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]],
+        columnar: bool,
+) -> Iterator[Relation]:
+    assert HAS_PYARROW, "reading Arrow requires pyarrow"
+    source = pa.memory_map(path)
+    try:
+        file_reader = pa.ipc.open_file(source)
+        schema = file_reader.schema
+        record_batches: Iterable[Any] = (
+            file_reader.get_batch(i) for i in range(file_reader.num_record_batches)
+        )
+    except pa.ArrowInvalid:
+        # not the file format, so try the streaming format
+        source.seek(0)
+        stream_reader = pa.ipc.open_stream(source)
+        schema = stream_reader.schema
+        record_batches = stream_reader
+    return arrow_batches(schema, record_batches, attributes, columnar)
+
+
+def read_parquet(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]] = None,
+        columns: Optional[Sequence[str]] = None,
+        batch_size: int = BATCH_SIZE,
+        columnar: bool = False,
+) -> Relation:
+    """
+    Reads the given columns (all of them by default) of a Parquet file into a
+    relation, batch_size rows at a time. Requires pyarrow.
+
+    The attributes default to one per column, named after it, and the values
+    keep the Python type of their column type, e.g. int for int64.
+    The elements are built straight from the columns, which already have the
+    same length, so they are not checked one by one.
+    With columnar, the columns go into a ColumnarRelation instead.
+    """
+    return collect(parquet_batches(path, attributes, columns, batch_size, columnar), columnar)
+
+def iter_parquet(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]] = None,
+        columns: Optional[Sequence[str]] = None,
+        batch_size: int = BATCH_SIZE,
+        columnar: bool = False,
+) -> Iterator[Relation]:
+    """
+    Reads a Parquet file like read_parquet, but as a relation per batch.
+    """
+    return split(parquet_batches(path, attributes, columns, batch_size, columnar))
+
+def read_arrow(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]] = None,
+        columnar: bool = False,
+) -> Relation:
+    """
+    Reads an Arrow IPC file, in either the file or the streaming format, into
+    a relation like read_parquet. The file is memory-mapped and read one
+    record batch at a time. Requires pyarrow.
+    """
+    return collect(ipc_batches(path, attributes, columnar), columnar)
+
+def iter_arrow(
+        path: str,
+        attributes: Optional[tuple[Attribute, ...]] = None,
+        columnar: bool = False,
+) -> Iterator[Relation]:
+    """
+    Reads an Arrow IPC file like read_arrow, but as a relation per record batch.
+    """
+    return split(ipc_batches(path, attributes, columnar))
@@ -0,0 +1,767 @@
+from math import inf, prod
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from expression import Constant, Expression, InfixBinaryOperation, PrefixUnaryOperation
+from .difference import difference
+from .elimination import eliminate
+from .filter import (
+    Condition,
+    ConditionArgument,
+    get_converse,
+    replace_arguments,
+)
+from .join import ThetaJoin
+from .ordering import JoinOrder, get_cost, order_joins
+from .product import product
+from .projection import Projection, project
+from .relation import ConstantRelation, Parameter, Relation, Schema
+from .selection import Selection, select
+from .semijoin import SemiJoin
+from .statistics import ColumnStatistics, estimate_conditions, estimate_selectivity, get_statistics
+from .union import union
+
+
+def get_base(x: Expression[Any]) -> Optional[Relation]:
+    if isinstance(x, Constant) and isinstance(x.value, Relation):
+        return x.value
+    return None
+
+def get_selection(x: Expression[Any]) -> Optional[Selection]:
+    if isinstance(x, PrefixUnaryOperation) and isinstance(x.f, Selection):
+        return x.f
+    return None
+
+def get_projection(x: Expression[Any]) -> Optional[Projection]:
+    if isinstance(x, PrefixUnaryOperation) and isinstance(x.f, Projection):
+        return x.f
+    return None
+
+def get_theta_join(x: Expression[Any]) -> Optional[ThetaJoin]:
+    if isinstance(x, InfixBinaryOperation) and isinstance(x.f, ThetaJoin):
+        return x.f
+    return None
+
+def get_semijoin(x: Expression[Any]) -> Optional[SemiJoin]:
+    if isinstance(x, InfixBinaryOperation) and isinstance(x.f, SemiJoin):
+        return x.f
+    return None
+
+def is_product(x: Expression[Any]) -> bool:
+    return isinstance(x, InfixBinaryOperation) and x.f is product.f
+
+def is_elimination(x: Expression[Any]) -> bool:
+    return isinstance(x, PrefixUnaryOperation) and x.f is eliminate.f
+
+def is_union(x: Expression[Any]) -> bool:
+    return isinstance(x, InfixBinaryOperation) and x.f is union.f
+
+def is_difference(x: Expression[Any]) -> bool:
+    return isinstance(x, InfixBinaryOperation) and x.f is difference.f
+
+
+def is_join_chain(x: Expression[Any]) -> bool:
+    if get_theta_join(x) is not None or is_product(x):
+        return True
+    return get_projection(x) is not None and is_join_chain(x.children[0])
+
+
+def make_join(
+        conditions: Sequence[Condition],
+        left_child: Expression[Relation],
+        right_child: Expression[Relation],
+) -> Expression[Relation]:
+    """
+    Joins the children on the conditions, or takes their product if there are
+    no conditions.
+    """
+    if len(conditions) == 0:
+        return InfixBinaryOperation(product.f, product.name, left_child, right_child)
+    theta_join = ThetaJoin(tuple(conditions))
+    return InfixBinaryOperation(theta_join, theta_join.name, left_child, right_child)
+
+def make_semijoin(
+        conditions: Sequence[Condition],
+        left_child: Expression[Relation],
+        right_child: Expression[Relation],
+        anti: bool = False,
+) -> Expression[Relation]:
+    semi_join = SemiJoin(tuple(conditions), anti=anti)
+    return InfixBinaryOperation(semi_join, semi_join.name, left_child, right_child)
+
+def is_same(x: Expression[Any], y: Expression[Any]) -> bool:
+    """
+    Whether both evaluate to the very same relation, which is certain when
+    they are the same subtree or wrap the same base relation.
+    """
+    base = get_base(x)
+    return x is y or (base is not None and base is get_base(y))
+
+def with_children(x: Expression[Any], children: Sequence[Expression[Any]]) -> Expression[Any]:
+    if all(a is b for a, b in zip(x.children, children)):
+        return x
+    if isinstance(x, PrefixUnaryOperation):
+        (right_child,) = children
+        return PrefixUnaryOperation(x.f, x.operator_name, right_child)
+    if isinstance(x, InfixBinaryOperation):
+        left_child, right_child = children
+        return InfixBinaryOperation(x.f, x.operator_name, left_child, right_child)
+    return x
+
+
+def get_indices(condition: Condition) -> list[int]:
+    return [
+        argument
+        for argument in (condition.left_child.get(), condition.right_child.get())
+        if isinstance(argument, int)
+    ]
+
+def remap(condition: Condition, index: Callable[[int], int]) -> Condition:
+    def replace(argument: ConditionArgument) -> ConditionArgument:
+        return index(argument) if isinstance(argument, int) else argument
+    return replace_arguments(condition, replace)
+
+def canonicalize(condition: Condition) -> Condition:
+    """
+    Puts the index before the constant, e.g. 18 > #3 becomes #3 < 18.
+    """
+    if isinstance(condition.left_child.get(), int):
+        return condition
+    converse = get_converse(condition)
+    return condition if converse is None else converse
+
+
+class JoinChain:
+    """
+    A tree of joins and products seen as the list of its inputs, where the
+    columns of all the inputs are numbered one after the other from 1, and
+    the conditions of every join refer to those numbers.
+    """
+    inputs: list[Expression[Relation]]
+    offsets: list[int] # the number of columns before each input
+    owners: list[int] # the input of each column
+    conditions: list[Condition]
+    joins: list[int] # the inputs of each join in the tree, as a bit mask
+
+    def __init__(self):
+        self.inputs = []
+        self.offsets = []
+        self.owners = []
+        self.conditions = []
+        self.joins = []
+
+    def add_input(self, x: Expression[Relation], arity: int) -> list[int]:
+        offset = len(self.owners)
+        self.offsets.append(offset)
+        self.owners.extend([len(self.inputs)] * arity)
+        self.inputs.append(x)
+        return list(range(offset + 1, offset + arity + 1))
+
+    def get_mask(self, condition: Condition) -> int:
+        mask = 0
+        for column in get_indices(condition):
+            mask |= 1 << self.owners[column-1]
+        return mask
+
+
+class Optimizer:
+    """
+    Rewrites relational algebra expression trees into equivalent trees that
+    are cheaper to evaluate.
+
+    Every rewrite is checked against the attribute types of the node it
+    replaces by evaluating both on empty relations, since moving an equality
+    condition can change which columns its type intersection reaches.
+    """
+    _schemas: dict[int, Schema]
+    _estimates: dict[int, float]
+    _optimized: dict[int, Expression[Relation]]
+    _nodes: list[Expression[Any]]
+
+    def __init__(self):
+        self._schemas = {}
+        self._estimates = {}
+        self._optimized = {}
+        self._nodes = [] # keeps the ids used as keys alive
+
+    def schema(self, x: Expression[Any]) -> Schema:
+        """
+        Returns the attributes of the relation that x evaluates to, without
+        looking at any elements.
+        """
+        if id(x) not in self._schemas:
+            relation: Any
+            if isinstance(x, PrefixUnaryOperation):
+                relation = x.f(Relation(self.schema(x.right_child), ()))
+            elif isinstance(x, InfixBinaryOperation):
+                relation = x.f(
+                    Relation(self.schema(x.left_child), ()),
+                    Relation(self.schema(x.right_child), ()),
+                )
+            else:
+                relation = x.get()
+            assert isinstance(relation, Relation), f"{x} is not a relation"
+            self._nodes.append(x)
+            self._schemas[id(x)] = relation.attributes
+        return self._schemas[id(x)]
+
+    def arity(self, x: Expression[Any]) -> int:
+        return len(self.schema(x))
+
+    def statistics(self, x: Expression[Any], column: int) -> Optional[ColumnStatistics]:
+        """
+        Returns the statistics of the base relation column that a column of x
+        comes from, if it can be traced back to one.
+        They describe the whole base column, not just the part of it left in x.
+        """
+        base = get_base(x)
+        if base is not None:
+            return get_statistics(base, column)
+        if (
+            get_selection(x) is not None or is_elimination(x) or is_difference(x)
+            or get_semijoin(x) is not None
+        ):
+            return self.statistics(x.children[0], column)
+        projection = get_projection(x)
+        if projection is not None:
+            return self.statistics(x.children[0], projection.indices[column-1])
+        if get_theta_join(x) is not None or is_product(x):
+            left_child, right_child = x.children
+            lA = self.arity(left_child)
+            if column <= lA:
+                return self.statistics(left_child, column)
+            return self.statistics(right_child, column - lA)
+        return None
+
+    def estimate(self, x: Expression[Any]) -> float:
+        """
+        Returns an estimate of the number of elements that x evaluates to,
+        based on the statistics of the base relations.
+        """
+        if id(x) not in self._estimates:
+            self._nodes.append(x)
+            self._estimates[id(x)] = self._estimate(x)
+        return self._estimates[id(x)]
+
+    def _estimate(self, x: Expression[Any]) -> float:
+        base = get_base(x)
+        if base is not None:
+            return base.num_elements
+        selection = get_selection(x)
+        if selection is not None:
+            child = x.children[0]
+            selectivity = estimate_conditions(
+                selection.conditions,
+                lambda i: self.statistics(child, i),
+            )
+            return self.estimate(child) * selectivity
+        if get_projection(x) is not None:
+            return self.estimate(x.children[0])
+        if is_elimination(x):
+            # there are no more elements than combinations of distinct values
+            child = x.children[0]
+            statistics = [self.statistics(child, i+1) for i in range(self.arity(child))]
+            if any(s is None for s in statistics):
+                return self.estimate(child)
+            return min(self.estimate(child), prod(s.distinct for s in statistics if s is not None))
+        theta_join = get_theta_join(x)
+        if theta_join is not None or is_product(x):
+            conditions = () if theta_join is None else theta_join.conditions
+            left_child, right_child = x.children
+            selectivity = estimate_conditions(
+                conditions,
+                lambda i: self.statistics(left_child, -i) if i < 0 else self.statistics(right_child, i),
+            )
+            return self.estimate(left_child) * self.estimate(right_child) * selectivity
+        semi_join = get_semijoin(x)
+        if semi_join is not None:
+            left_child, right_child = x.children
+            if semi_join.anti:
+                return self.estimate(left_child)
+            selectivity = estimate_conditions(
+                semi_join.conditions,
+                lambda i: self.statistics(left_child, -i) if i < 0 else self.statistics(right_child, i),
+            )
+            # each left element is kept at most once
+            return self.estimate(left_child) * min(1, self.estimate(right_child) * selectivity)
+        if is_union(x):
+            return sum(self.estimate(child) for child in x.children)
+        if is_difference(x):
+            return self.estimate(x.children[0])
+        return inf
+
+    def optimize(self, x: Expression[Relation]) -> Expression[Relation]:
+        """
+        Rewrites the expression, keeping a rewrite only if its schema equals
+        that of the expression. Schemas are compared by value, since the
+        interned schemas may be forgotten in the meantime, e.g.
+
+            >>> from expression import Constant, lt
+            >>> from relational_algebra import Attribute, Relation, product, select
+            >>> from relational_algebra import relation
+            >>> R = Constant(Relation((Attribute("a"),), [(1,), (2,)]), "R")
+            >>> S = Constant(Relation((Attribute("b"),), [(2,)]), "S")
+            >>> capacity, relation.SCHEMA_CAPACITY = relation.SCHEMA_CAPACITY, 1
+            >>> print(Optimizer().optimize(select[1 |lt| 2](R |product| S)))
+            R × σ[#1ℓ<#1] S
+            >>> relation.SCHEMA_CAPACITY = capacity
+        """
+        if id(x) in self._optimized:
+            return self._optimized[id(x)]
+        try:
+            expected = self.schema(x)
+        except Exception:
+            # not a valid relational expression, so leave it for get() to report
+            return x
+
+        optimized = with_children(x, [self.optimize(child) for child in x.children])
+        for candidate in self.rewrite(optimized):
+            try:
+                valid = self.schema(candidate) == expected
+            except Exception:
+                valid = False
+            if valid:
+                optimized = self.optimize(candidate)
+                break
+
+        self._nodes.extend((x, optimized))
+        self._optimized[id(x)] = optimized
+        self._optimized[id(optimized)] = optimized
+        return optimized
+
+    def rewrite(self, x: Expression[Relation]) -> Iterator[Expression[Relation]]:
+        """
+        Yields equivalent replacements for x, most preferred first.
+        """
+        selection = get_selection(x)
+        if selection is not None:
+            yield from self.rewrite_selection(selection.conditions, x.children[0])
+        projection = get_projection(x)
+        if projection is not None:
+            yield from self.rewrite_projection(projection.indices, x.children[0])
+        theta_join = get_theta_join(x)
+        if theta_join is not None or is_product(x):
+            reordered = self.reorder_joins(x)
+            if reordered is not None:
+                yield reordered
+        if theta_join is not None:
+            left_child, right_child = x.children
+            yield from self.rewrite_join(theta_join.conditions, left_child, right_child)
+        if is_product(x):
+            left_child, right_child = x.children
+            yield from self.rewrite_join((), left_child, right_child)
+        semi_join = get_semijoin(x)
+        if semi_join is not None:
+            left_child, right_child = x.children
+            yield from self.rewrite_semijoin(semi_join, left_child, right_child)
+        if is_elimination(x):
+            yield from self.rewrite_elimination(x.children[0])
+        if is_difference(x):
+            left_child, right_child = x.children
+            yield from self.rewrite_difference(left_child, right_child)
+
+    def rewrite_selection(
+            self,
+            conditions: tuple[Condition, ...],
+            child: Expression[Relation],
+    ) -> Iterator[Expression[Relation]]:
+        canonical = tuple(canonicalize(c) for c in conditions)
+        if any(a is not b for a, b in zip(canonical, conditions)):
+            yield select[canonical](child)
+            return
+
+        inner_selection = get_selection(child)
+        if inner_selection is not None:
+            # σ[a](σ[b](X)) = σ[b,a](X)
+            yield select[(*inner_selection.conditions, *conditions)](child.children[0])
+
+        inner_projection = get_projection(child)
+        if inner_projection is not None:
+            # σ[a](π[i](X)) = π[i](σ[a'](X)), filtering before copying
+            indices = inner_projection.indices
+            pushed = tuple(remap(c, lambda i: indices[i-1]) for c in conditions)
+            yield project[indices](select[pushed](child.children[0]))
+
+        if is_elimination(child):
+            yield eliminate(select[conditions](child.children[0]))
+
+        theta_join = get_theta_join(child)
+        if theta_join is not None or is_product(child):
+            # σ[a](L × R) = L ⋈[a'] R, and σ[a](L ⋈[b] R) = L ⋈[b,a'] R
+            left_child, right_child = child.children
+            lA = self.arity(left_child)
+            merged = (
+                *(() if theta_join is None else theta_join.conditions),
+                *(remap(c, lambda i: -i if i <= lA else i - lA) for c in conditions),
+            )
+            yield make_join(merged, left_child, right_child)
+
+        semi_join = get_semijoin(child)
+        if semi_join is not None:
+            # σ[a](L ⋉ R) = σ[a](L) ⋉ R
+            left_child, right_child = child.children
+            yield make_semijoin(semi_join.conditions, select[conditions](left_child), right_child, semi_join.anti)
+
+        if is_union(child):
+            left_child, right_child = child.children
+            yield select[conditions](left_child) |union| select[conditions](right_child)
+
+        if is_difference(child):
+            left_child, right_child = child.children
+            yield select[conditions](left_child) |difference| right_child
+
+    def rewrite_projection(
+            self,
+            indices: tuple[int, ...],
+            child: Expression[Relation],
+    ) -> Iterator[Expression[Relation]]:
+        if indices == tuple(range(1, self.arity(child) + 1)):
+            yield child
+            return
+
+        inner_projection = get_projection(child)
+        if inner_projection is not None:
+            # π[i](π[j](X)) = π[j∘i](X)
+            inner_indices = inner_projection.indices
+            yield project[tuple(inner_indices[i-1] for i in indices)](child.children[0])
+
+        theta_join = get_theta_join(child)
+        if theta_join is not None or is_product(child):
+            left_child, right_child = child.children
+            conditions = () if theta_join is None else theta_join.conditions
+            pushed = self.push_projection(indices, conditions, left_child, right_child)
+            if pushed is not None:
+                yield pushed
+
+    def push_projection(
+            self,
+            indices: tuple[int, ...],
+            conditions: tuple[Condition, ...],
+            left_child: Expression[Relation],
+            right_child: Expression[Relation],
+    ) -> Optional[Expression[Relation]]:
+        """
+        Projects each side of a join onto the columns that are either kept or
+        compared, so that the join builds narrower elements.
+
+        A side with a single element that is neither kept nor compared does not
+        change the result at all, so it is dropped instead.
+        """
+        lA = self.arity(left_child)
+        rA = self.arity(right_child)
+
+        left_needed = {i for i in indices if i <= lA}
+        right_needed = {i - lA for i in indices if i > lA}
+        for condition in conditions:
+            for i in get_indices(condition):
+                if i < 0:
+                    left_needed.add(-i)
+                else:
+                    right_needed.add(i)
+
+        def is_single(x: Expression[Relation]) -> bool:
+            # a parameter only holds a sample of the relations bound to it
+            base = get_base(x)
+            return base is not None and not isinstance(base, Parameter) and base.num_elements == 1
+
+        drop_left = len(left_needed) == 0 and is_single(left_child)
+        drop_right = len(right_needed) == 0 and is_single(right_child)
+        if not drop_left and len(left_needed) == 0:
+            left_needed.add(1)
+        if not drop_right and len(right_needed) == 0:
+            right_needed.add(1)
+        if (
+            not drop_left and not drop_right
+            and len(left_needed) == lA and len(right_needed) == rA
+        ):
+            return None
+
+        left_columns = tuple(sorted(left_needed))
+        right_columns = tuple(sorted(right_needed))
+        left_position = {c: k+1 for k, c in enumerate(left_columns)}
+        right_position = {c: k+1 for k, c in enumerate(right_columns)}
+        if len(left_columns) < lA:
+            left_child = project[left_columns](left_child)
+        if len(right_columns) < rA:
+            right_child = project[right_columns](right_child)
+
+        if drop_left:
+            pushed = tuple(remap(c, lambda i: right_position[i]) for c in conditions)
+            child = right_child if len(pushed) == 0 else select[pushed](right_child)
+            return project[tuple(right_position[i - lA] for i in indices)](child)
+        if drop_right:
+            pushed = tuple(remap(c, lambda i: left_position[-i]) for c in conditions)
+            child = left_child if len(pushed) == 0 else select[pushed](left_child)
+            return project[tuple(left_position[i] for i in indices)](child)
+
+        pushed = tuple(
+            remap(c, lambda i: -left_position[-i] if i < 0 else right_position[i])
+            for c in conditions
+        )
+        return project[tuple(
+            left_position[i] if i <= lA else len(left_columns) + right_position[i - lA]
+            for i in indices
+        )](make_join(pushed, left_child, right_child))
+
+    def rewrite_join(
+            self,
+            conditions: tuple[Condition, ...],
+            left_child: Expression[Relation],
+            right_child: Expression[Relation],
+    ) -> Iterator[Expression[Relation]]:
+        canonical = tuple(canonicalize(c) for c in conditions)
+        if any(a is not b for a, b in zip(canonical, conditions)):
+            yield make_join(canonical, left_child, right_child)
+            return
+
+        constant = self.substitute_constant(conditions, left_child, right_child)
+        if constant is not None:
+            yield constant
+
+        # conditions that only look at one side filter that side beforehand
+        left_only = [c for c in conditions if all(i < 0 for i in get_indices(c))]
+        right_only = [c for c in conditions if all(i > 0 for i in get_indices(c))]
+        if len(left_only) + len(right_only) > 0:
+            def push(pushed: Sequence[Condition]) -> Expression[Relation]:
+                left_pushed = [remap(c, lambda i: -i) for c in left_only if c in pushed]
+                right_pushed = [c for c in right_only if c in pushed]
+                return make_join(
+                    [c for c in conditions if c not in pushed],
+                    left_child if len(left_pushed) == 0 else select[tuple(left_pushed)](left_child),
+                    right_child if len(right_pushed) == 0 else select[tuple(right_pushed)](right_child),
+                )
+            yield push(left_only + right_only)
+            # pushing an equality can stop its type intersection reaching the other side
+            inequalities = [c for c in left_only + right_only if c.operator_name != "="]
+            if len(inequalities) > 0:
+                yield push(inequalities)
+
+        # the larger side goes on the left, so equivalent joins look the same
+        if self.estimate(left_child) < self.estimate(right_child):
+            lA = self.arity(left_child)
+            rA = self.arity(right_child)
+            swapped = tuple(remap(c, lambda i: -i) for c in conditions)
+            yield project[(*range(rA + 1, rA + lA + 1), *range(1, rA + 1))](
+                make_join(swapped, right_child, left_child)
+            )
+
+    def split_semijoin(
+            self,
+            x: Expression[Relation],
+    ) -> Optional[tuple[tuple[int, ...], tuple[Condition, ...], Expression[Relation], Expression[Relation]]]:
+        """
+        Splits π[i](L ⋈[a] R), where every kept column comes from one side,
+        into the indices of the kept columns on that side, the conditions as
+        seen from that side, that side, and the other side, so that it can be
+        rewritten as π[i](L ⋉[a] R) wherever duplicates do not matter.
+        """
+        projection = get_projection(x)
+        if projection is None:
+            return None
+        theta_join = get_theta_join(x.children[0])
+        if theta_join is None:
+            return None
+        left_child, right_child = x.children[0].children
+        lA = self.arity(left_child)
+        indices = projection.indices
+        if all(i <= lA for i in indices):
+            return indices, theta_join.conditions, left_child, right_child
+        if all(i > lA for i in indices):
+            flipped = tuple(remap(c, lambda i: -i) for c in theta_join.conditions)
+            return tuple(i - lA for i in indices), flipped, right_child, left_child
+        return None
+
+    def rewrite_semijoin(
+            self,
+            semi_join: SemiJoin,
+            left_child: Expression[Relation],
+            right_child: Expression[Relation],
+    ) -> Iterator[Expression[Relation]]:
+        canonical = tuple(canonicalize(c) for c in semi_join.conditions)
+        if any(a is not b for a, b in zip(canonical, semi_join.conditions)):
+            yield make_semijoin(canonical, left_child, right_child, semi_join.anti)
+            return
+
+        inner_projection = get_projection(right_child)
+        if inner_projection is not None:
+            # L ⋉[a] π[i](R) = L ⋉[a'] R, since the right elements are never kept
+            indices = inner_projection.indices
+            pulled = tuple(remap(c, lambda i: i if i < 0 else indices[i-1]) for c in canonical)
+            yield make_semijoin(pulled, left_child, right_child.children[0], semi_join.anti)
+
+    def rewrite_elimination(self, child: Expression[Relation]) -> Iterator[Expression[Relation]]:
+        split = self.split_semijoin(child)
+        if split is not None:
+            # elim(π[i](L ⋈[a] R)) = elim(π[i](L ⋉[a] R)), which only looks
+            # for a match instead of building every matching pair
+            indices, conditions, side, other = split
+            semi_joined = make_semijoin(conditions, side, other)
+            if indices == tuple(range(1, self.arity(side) + 1)):
+                yield eliminate(semi_joined)
+            else:
+                yield eliminate(project[indices](semi_joined))
+
+    def rewrite_difference(
+            self,
+            left_child: Expression[Relation],
+            right_child: Expression[Relation],
+    ) -> Iterator[Expression[Relation]]:
+        if is_elimination(right_child):
+            # X − elim(Y) = X − Y, since only whether an element is in Y matters
+            yield left_child |difference| right_child.children[0]
+
+        split = self.split_semijoin(right_child)
+        if split is not None:
+            indices, conditions, side, other = split
+            if indices == tuple(range(1, self.arity(side) + 1)) and is_same(side, left_child):
+                # L − π[L](L ⋈[a] R) = L ▷[a] R
+                yield make_semijoin(conditions, left_child, other, anti=True)
+            # X − π[i](L ⋈[a] R) = X − π[i](L ⋉[a] R), for the same reason
+            yield left_child |difference| project[indices](make_semijoin(conditions, side, other))
+
+    def flatten(self, x: Expression[Relation], chain: JoinChain) -> list[int]:
+        """
+        Adds the inputs and join conditions of x to the chain, looking through
+        joins, products and projections of them, and returns the chain column
+        of each column of x.
+        """
+        theta_join = get_theta_join(x)
+        if theta_join is not None or is_product(x):
+            left_child, right_child = x.children
+            start = len(chain.inputs)
+            left_columns = self.flatten(left_child, chain)
+            right_columns = self.flatten(right_child, chain)
+            conditions = () if theta_join is None else theta_join.conditions
+            chain.conditions.extend(
+                remap(c, lambda i: left_columns[-i-1] if i < 0 else right_columns[i-1])
+                for c in conditions
+            )
+            chain.joins.append((1 << len(chain.inputs)) - (1 << start))
+            return left_columns + right_columns
+
+        projection = get_projection(x)
+        if projection is not None and is_join_chain(x.children[0]):
+            columns = self.flatten(x.children[0], chain)
+            return [columns[i-1] for i in projection.indices]
+
+        return chain.add_input(x, self.arity(x))
+
+    def reorder_joins(self, x: Expression[Relation]) -> Optional[Expression[Relation]]:
+        """
+        Rebuilds a tree of three or more joined inputs in the order expected
+        to produce the fewest intermediate elements, if that beats the current
+        order. Each condition joins the smallest subtree holding every column
+        it compares, and a final projection restores the order of the columns.
+        """
+        chain = JoinChain()
+        columns = self.flatten(x, chain)
+        n = len(chain.inputs)
+        if n < 3:
+            return None
+
+        def lookup(column: int) -> Optional[ColumnStatistics]:
+            owner = chain.owners[column-1]
+            return self.statistics(chain.inputs[owner], column - chain.offsets[owner])
+
+        sizes = [self.estimate(child) for child in chain.inputs]
+        conditions = [
+            (chain.get_mask(c), estimate_selectivity(c, lookup))
+            for c in chain.conditions
+        ]
+        estimates: dict[int, float] = {}
+        def estimate(mask: int) -> float:
+            if mask not in estimates:
+                estimates[mask] = prod(
+                    size for i, size in enumerate(sizes) if mask >> i & 1
+                ) * prod(
+                    selectivity for m, selectivity in conditions if m & ~mask == 0
+                )
+            return estimates[mask]
+
+        order = order_joins(n, estimate)
+        if get_cost(order, estimate) >= sum(estimate(mask) for mask in chain.joins) * (1 - 1e-9):
+            return None
+
+        pending = list(chain.conditions)
+        def build(order: JoinOrder) -> tuple[Expression[Relation], list[int], int]:
+            if isinstance(order, int):
+                child = chain.inputs[order]
+                offset = chain.offsets[order]
+                return child, list(range(offset + 1, offset + self.arity(child) + 1)), 1 << order
+            left_child, left_columns, left_mask = build(order[0])
+            right_child, right_columns, right_mask = build(order[1])
+            mask = left_mask | right_mask
+            position = {
+                **{c: -(k+1) for k, c in enumerate(left_columns)},
+                **{c: k+1 for k, c in enumerate(right_columns)},
+            }
+            joined = [c for c in pending if chain.get_mask(c) & ~mask == 0]
+            for c in joined:
+                pending.remove(c)
+            return (
+                make_join([remap(c, position.__getitem__) for c in joined], left_child, right_child),
+                left_columns + right_columns,
+                mask,
+            )
+
+        reordered, reordered_columns, _ = build(order)
+        position = {c: k+1 for k, c in enumerate(reordered_columns)}
+        indices = tuple(position[c] for c in columns)
+        if indices == tuple(range(1, len(reordered_columns) + 1)):
+            return reordered
+        return project[indices](reordered)
+
+    def substitute_constant(
+            self,
+            conditions: tuple[Condition, ...],
+            left_child: Expression[Relation],
+            right_child: Expression[Relation],
+    ) -> Optional[Expression[Relation]]:
+        """
+        Turns a join against a constant into a selection that compares with the
+        constant directly, e.g. 18 ⋈[#1ℓ>#3] PERSON = 18 × σ[#3<18](PERSON).
+        """
+        for side, child in ((-1, left_child), (1, right_child)):
+            constant = get_base(child)
+            if not isinstance(constant, ConstantRelation):
+                continue
+            if not any(i * side > 0 for c in conditions for i in get_indices(c)):
+                continue
+
+            # the comparisons may have narrowed the type of the constant
+            lA = self.arity(left_child)
+            attribute = self.schema(make_join(conditions, left_child, right_child))[
+                0 if side < 0 else lA
+            ]
+            if attribute != constant.attribute:
+                constant = ConstantRelation(attribute, constant.value)
+
+            def replace(argument: ConditionArgument) -> ConditionArgument:
+                if isinstance(argument, int):
+                    return constant if argument * side > 0 else abs(argument)
+                return argument
+            substituted = tuple(canonicalize(replace_arguments(c, replace)) for c in conditions)
+            if any(len(get_indices(c)) == 0 for c in substituted):
+                return None
+
+            if side < 0:
+                return make_join((), Constant(constant), select[substituted](right_child))
+            return make_join((), select[substituted](left_child), Constant(constant))
+        return None
+
+
+def optimize(expression: Expression[Relation]) -> Expression[Relation]:
+    """
+    Returns an equivalent expression tree that pushes selections and
+    projections down towards the base relations and turns selections over
+    products into joins. The result can be evaluated with get() or traced
+    with resolve() like any other expression.
+    """
+    return Optimizer().optimize(expression)
+
+def estimate(expression: Expression[Relation]) -> float:
+    """
+    Estimates the number of elements the expression evaluates to without
+    evaluating it, from the statistics of its base relations.
+    Useful for rejecting a query that would be too large before running it.
+    """
+    return Optimizer().estimate(expression)
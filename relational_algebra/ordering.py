@@ -0,0 +1,84 @@
+from typing import Callable, TypeAlias, Union
+
+
+# a join order over numbered inputs: either one input, or a pair of orders
+# whose results are joined, with the left one first
+JoinOrder: TypeAlias = Union[int, tuple["JoinOrder", "JoinOrder"]]
+
+# estimates the number of elements in the join of a set of inputs, given as
+# a bit mask where bit i stands for input i
+SizeEstimate: TypeAlias = Callable[[int], float]
+
+# chains of up to this many inputs are ordered exhaustively
+DYNAMIC_PROGRAMMING_LIMIT = 8
+
+
+def get_mask(order: JoinOrder) -> int:
+    if isinstance(order, int):
+        return 1 << order
+    left, right = order
+    return get_mask(left) | get_mask(right)
+
+def get_cost(order: JoinOrder, estimate: SizeEstimate) -> float:
+    """
+    The cost of a join order is the total estimated size of the results of
+    its joins, since each of them has to be built.
+    """
+    if isinstance(order, int):
+        return 0.0
+    left, right = order
+    return get_cost(left, estimate) + get_cost(right, estimate) + estimate(get_mask(order))
+
+def orient(left: JoinOrder, right: JoinOrder, estimate: SizeEstimate) -> JoinOrder:
+    # the larger side goes on the left, like the optimizer does for any join
+    if estimate(get_mask(left)) < estimate(get_mask(right)):
+        return right, left
+    return left, right
+
+
+def order_exhaustively(n: int, estimate: SizeEstimate) -> JoinOrder:
+    """
+    Finds the cheapest join order over n inputs by dynamic programming over
+    every subset of the inputs, considering bushy orders as well.
+    """
+    best: dict[int, tuple[float, JoinOrder]] = {1 << i: (0.0, i) for i in range(n)}
+    for mask in range(1, 1 << n):
+        if mask in best:
+            continue
+        lowest = mask & -mask
+        size = estimate(mask)
+        # each split is visited once, with the lowest input on the left
+        left = (mask - 1) & mask
+        while left > 0:
+            right = mask ^ left
+            if left & lowest and right > 0:
+                cost = best[left][0] + best[right][0] + size
+                if mask not in best or cost < best[mask][0]:
+                    best[mask] = (cost, orient(best[left][1], best[right][1], estimate))
+            left = (left - 1) & mask
+    return best[(1 << n) - 1][1]
+
+def order_greedily(n: int, estimate: SizeEstimate) -> JoinOrder:
+    """
+    Builds a join order over n inputs by repeatedly joining the two partial
+    results whose join is expected to be the smallest.
+    """
+    orders: list[JoinOrder] = list(range(n))
+    while len(orders) > 1:
+        _, i, j = min(
+            (estimate(get_mask(orders[i]) | get_mask(orders[j])), i, j)
+            for i in range(len(orders))
+            for j in range(i+1, len(orders))
+        )
+        joined = orient(orders[i], orders[j], estimate)
+        orders = [order for k, order in enumerate(orders) if k not in (i, j)] + [joined]
+    return orders[0]
+
+def order_joins(n: int, estimate: SizeEstimate) -> JoinOrder:
+    """
+    Returns a cheap join order over n > 0 inputs: the cheapest one for short
+    chains, and a greedy one for longer chains.
+    """
+    if n <= DYNAMIC_PROGRAMMING_LIMIT:
+        return order_exhaustively(n, estimate)
+    return order_greedily(n, estimate)
@@ -0,0 +1,185 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+
+from expression import Expression, Operation, evaluate_with
+from .columnar import ColumnarRelation
+from .filter import PredicateSource, compile_source, get_predicate_source
+from .join import Bound, ThetaJoin, band_join, hash_join, nested_loop_join
+from .product import product
+from .projection import Projection
+from .relation import Element, Relation
+from .selection import Selection
+
+
+# The tasks below run inside the worker processes. They only receive
+# picklable arguments, so predicates are rebuilt there from their source.
+
+def select_chunk(chunk: Sequence[Element], source: PredicateSource) -> list[Element]:
+    predicate = compile_source(source)
+    return [element for element in chunk if predicate(element)]
+
+def project_chunk(chunk: Sequence[Element], indices: Sequence[int]) -> list[Element]:
+    return [tuple(element[i] for i in indices) for element in chunk]
+
+def product_chunk(chunk: Sequence[Element], right_elements: Sequence[Element]) -> list[Element]:
+    return [
+        left_element + right_element
+        for left_element in chunk
+        for right_element in right_elements
+    ]
+
+def join_chunk(
+        chunk: Sequence[Element],
+        right_elements: Sequence[Element],
+        keys: Sequence[tuple[int, int]],
+        bounds: Sequence[Bound],
+        source: PredicateSource,
+) -> list[Element]:
+    predicate = compile_source(source)
+    if len(keys) > 0:
+        return list(hash_join(chunk, right_elements, keys, predicate))
+    if len(bounds) > 0:
+        return list(band_join(chunk, right_elements, bounds, predicate))
+    return list(nested_loop_join(chunk, right_elements, predicate))
+
+
+def is_picklable(value: Any) -> bool:
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+    return True
+
+
+class ParallelExecutor:
+    """
+    Evaluates expressions on a pool of worker processes.
+
+    The elements of a large relation are split into one chunk per task.
+    Selections and projections run on each chunk, while products and joins
+    pair each chunk of the left relation with the whole right relation.
+    The results of the chunks are concatenated back in the same order as a
+    serial evaluation.
+
+    Everything else runs serially, as do operators whose input is smaller
+    than threshold (elements, or pairs of elements for products and joins),
+    operators over columnar or indexed relations, and conditions with
+    constants or comparison functions that cannot be pickled.
+    The elements themselves must be picklable.
+    """
+    workers: int
+    threshold: int
+    _pool: Optional[ProcessPoolExecutor]
+
+    def __init__(self, workers: Optional[int] = None, threshold: int = 100_000):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        assert self.workers > 0
+        self.threshold = threshold
+        self._pool = None
+
+    def __enter__(self) -> "ParallelExecutor":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def split(self, elements: Sequence[Element]) -> list[Sequence[Element]]:
+        size = max(1, -(-len(elements) // self.workers))
+        return [elements[i:i+size] for i in range(0, len(elements), size)]
+
+    def gather(self, task: Callable[..., list[Element]], chunks: Sequence[Sequence[Element]], *args: Any) -> list[Element]:
+        futures = [self.pool.submit(task, chunk, *args) for chunk in chunks]
+        return [element for future in futures for element in future.result()]
+
+    def evaluate(self, x: Expression[Relation]) -> Relation:
+        """
+        Evaluates the expression, running the operators that are worth it in
+        parallel.
+        """
+        return evaluate_with(x, self.apply)
+
+    def apply(self, x: Operation, children: list[Relation]) -> Relation:
+        if isinstance(x.f, Selection):
+            return self.select(x.f, *children)
+        if isinstance(x.f, Projection):
+            return self.project(x.f, *children)
+        if isinstance(x.f, ThetaJoin):
+            return self.join(x.f, *children)
+        if x.f is product.f:
+            return self.product(*children)
+        return x.f(*children)
+
+    def is_serial(self, *relations: Relation) -> bool:
+        return any(
+            isinstance(relation, ColumnarRelation) or len(relation.indexes) > 0
+            for relation in relations
+        )
+
+    def select(self, selection: Selection, relation: Relation) -> Relation:
+        # the serial selection checks the conditions and narrows the types
+        result = selection(relation)
+        if self.is_serial(relation) or relation.num_elements < self.threshold:
+            return result
+        source = get_predicate_source(selection.conditions, joined=False)
+        if not is_picklable(source):
+            return result
+        elements = self.gather(select_chunk, self.split(relation.elements), source)
+        return Relation(attributes=result.attributes, elements=elements)
+
+    def project(self, projection: Projection, relation: Relation) -> Relation:
+        result = projection(relation)
+        if self.is_serial(relation) or relation.num_elements < self.threshold:
+            return result
+        indices = [i-1 for i in projection.indices]
+        elements = self.gather(project_chunk, self.split(relation.elements), indices)
+        return Relation(attributes=result.attributes, elements=elements)
+
+    def product(self, left_relation: Relation, right_relation: Relation) -> Relation:
+        result = product.f(left_relation, right_relation)
+        if (
+            self.is_serial(left_relation, right_relation)
+            or left_relation.num_elements * right_relation.num_elements < self.threshold
+        ):
+            return result
+        elements = self.gather(
+            product_chunk,
+            self.split(left_relation.elements),
+            right_relation.elements,
+        )
+        return Relation(attributes=result.attributes, elements=elements)
+
+    def join(self, theta_join: ThetaJoin, left_relation: Relation, right_relation: Relation) -> Relation:
+        plan = theta_join.plan(left_relation, right_relation)
+        left_relation, right_relation, keys, bounds, residuals = plan
+        if (
+            self.is_serial(left_relation, right_relation)
+            or left_relation.num_elements * right_relation.num_elements < self.threshold
+        ):
+            return theta_join.run(plan)
+        source = get_predicate_source(residuals, joined=True)
+        if not is_picklable(source):
+            return theta_join.run(plan)
+        # each chunk of the left relation is joined in order with the whole
+        # right relation, so the results of the chunks follow each other
+        elements = self.gather(
+            join_chunk,
+            self.split(left_relation.elements),
+            right_relation.elements,
+            keys,
+            bounds,
+            source,
+        )
+        return Relation(attributes=left_relation.attributes + right_relation.attributes, elements=elements)
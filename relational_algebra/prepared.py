@@ -0,0 +1,186 @@
+from typing import Any, Callable, Union
+
+from expression import Constant, Expression, InfixBinaryOperation, PrefixUnaryOperation
+from .filter import Condition, ConditionArgument, replace_arguments
+from .join import ThetaJoin
+from .optimize import Optimizer
+from .relation import ConstantParameter, ConstantRelation, Parameter, Relation, Schema
+from .selection import Selection
+from .semijoin import SemiJoin
+
+
+# the operators whose conditions may compare with constant parameters
+ConditionalOperator = Union[Selection, ThetaJoin, SemiJoin]
+
+def get_constants(x: Expression[Any]) -> list[ConstantParameter]:
+    """
+    Returns the constant parameters that the conditions of the operator of a
+    node compare with, in order.
+    """
+    if not isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation)):
+        return []
+    if not isinstance(x.f, (Selection, ThetaJoin, SemiJoin)):
+        return []
+    return [
+        argument
+        for condition in x.f.conditions
+        for argument in (condition.left_child.get(), condition.right_child.get())
+        if isinstance(argument, ConstantParameter)
+    ]
+
+def bind_operator(f: ConditionalOperator, values: dict[str, Any]) -> ConditionalOperator:
+    """
+    Returns the operator with the given values in place of the constant
+    parameters of its conditions.
+    """
+    def replace(argument: ConditionArgument) -> ConditionArgument:
+        if isinstance(argument, ConstantParameter):
+            return ConstantRelation(argument.attribute, values[argument.name])
+        return argument
+    conditions: tuple[Condition, ...] = tuple(replace_arguments(c, replace) for c in f.conditions)
+    if isinstance(f, Selection):
+        return Selection(conditions)
+    if isinstance(f, ThetaJoin):
+        return ThetaJoin(conditions)
+    return SemiJoin(conditions, anti=f.anti)
+
+
+class PreparedPlan:
+    """
+    An expression over parameters that is checked, and optimized, once, and
+    can then be executed again and again with different relations and
+    constants bound to its parameters.
+
+    Preparing the plan infers the attributes of every node, which checks
+    every operator against the attributes of the parameters, and a relation
+    bound to a parameter must have exactly the same attributes.
+    Since an operation keeps its result, each execution builds a fresh tree
+    of operations, but they share the operators of the plan, so selections
+    and joins only compile their predicates on the first execution.
+    An operator whose conditions compare with constant parameters is bound
+    to their values again whenever they change.
+    """
+    expression: Expression[Relation]
+    attributes: Schema
+    parameters: dict[str, Parameter]
+    constants: dict[str, ConstantParameter]
+    _constants: dict[int, tuple[str, ...]]
+    _bound: dict[int, tuple[tuple[Any, ...], ConditionalOperator]]
+
+    def __init__(self, expression: Expression[Relation], optimized: bool = True):
+        self.parameters = {}
+        self.constants = {}
+        self._constants = {}
+        self._bound = {}
+        self.find_parameters(expression, set())
+        shared = self.parameters.keys() & self.constants.keys()
+        assert len(shared) == 0, f"{', '.join(sorted(shared))} : two different parameters have this name"
+
+        # inferring the attributes of the result checks every operator
+        optimizer = Optimizer()
+        self.attributes = optimizer.schema(expression)
+        self.expression = optimizer.optimize(expression) if optimized else expression
+        self.find_constants(self.expression)
+
+    def find_parameters(self, x: Expression[Any], seen: set[int]) -> None:
+        if id(x) in seen:
+            return
+        seen.add(id(x))
+        if isinstance(x, Constant):
+            value = x.value
+            assert not isinstance(value, ConstantParameter), \
+                f"{value} : constant parameters can only be compared with in conditions"
+            if isinstance(value, Parameter):
+                other = self.parameters.setdefault(value.name, value)
+                assert other is value, f"{value} : two different parameters have this name"
+        for constant in get_constants(x):
+            other = self.constants.setdefault(constant.name, constant)
+            assert other is constant, f"{constant} : two different parameters have this name"
+        for child in x.children:
+            self.find_parameters(child, seen)
+
+    def find_constants(self, x: Expression[Any]) -> None:
+        """
+        Records the constant parameters of every operator of the plan, which
+        the optimizer may have moved around.
+        """
+        if id(x) in self._constants:
+            return
+        names = tuple(constant.name for constant in get_constants(x))
+        self._constants[id(x)] = names
+        for child in x.children:
+            self.find_constants(child)
+
+    def get_operator(self, x: Expression[Relation], values: dict[str, Any]) -> tuple[Callable[..., Any], str]:
+        """
+        Returns the operator of a node of the plan and its name, bound to the
+        values of its constant parameters if it has any.
+        """
+        assert isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation))
+        names = self._constants[id(x)]
+        if len(names) == 0:
+            return x.f, x.operator_name
+        # only the conditions of these operators can hold constant parameters
+        assert isinstance(x.f, (Selection, ThetaJoin, SemiJoin))
+        key = tuple(values[name] for name in names)
+        bound = self._bound.get(id(x))
+        if bound is None or bound[0] != key:
+            bound = self._bound[id(x)] = key, bind_operator(x.f, values)
+        f = bound[1]
+        return f, f.name
+
+    def bind(self, **bindings: Any) -> Expression[Relation]:
+        """
+        Returns a fresh expression tree of the plan with the relations and
+        constants bound to its parameters by name, which can be evaluated with
+        get() or by any executor.
+        """
+        names = self.parameters.keys() | self.constants.keys()
+        missing = names - bindings.keys()
+        assert len(missing) == 0, f"unbound parameters: {', '.join(sorted(missing))}"
+        unknown = bindings.keys() - names
+        assert len(unknown) == 0, f"unknown parameters: {', '.join(sorted(unknown))}"
+
+        leaves: dict[str, Expression[Relation]] = {}
+        for name, parameter in self.parameters.items():
+            relation = bindings[name]
+            assert isinstance(relation, Relation), f"{name} must be bound to a relation"
+            assert relation.attributes == parameter.attributes, \
+                f"{name} : expected attributes {Relation(parameter.attributes, ())}, got {relation}"
+            leaves[name] = Constant(relation, name)
+        values = {name: bindings[name] for name in self.constants}
+
+        copies: dict[int, Expression[Relation]] = {}
+        def copy(x: Expression[Relation]) -> Expression[Relation]:
+            # subtrees shared in the plan stay shared in the copy
+            if id(x) in copies:
+                return copies[id(x)]
+            result: Expression[Relation]
+            if isinstance(x, Constant) and isinstance(x.value, Parameter):
+                result = leaves[x.value.name]
+            elif isinstance(x, PrefixUnaryOperation):
+                f, name = self.get_operator(x, values)
+                result = PrefixUnaryOperation(f, name, copy(x.right_child))
+            elif isinstance(x, InfixBinaryOperation):
+                f, name = self.get_operator(x, values)
+                result = InfixBinaryOperation(f, name, copy(x.left_child), copy(x.right_child))
+            else:
+                result = x
+            copies[id(x)] = result
+            return result
+        return copy(self.expression)
+
+    def execute(self, **bindings: Any) -> Relation:
+        """
+        Evaluates the plan with the relations and constants bound to its
+        parameters by name, e.g. plan.execute(PERSON=..., STUDENT=...).
+        """
+        return self.bind(**bindings).get()
+
+
+def prepare(expression: Expression[Relation], optimized: bool = True) -> PreparedPlan:
+    """
+    Checks, and optimizes, an expression over parameters once, returning a
+    plan that can be executed with any relations and constants bound to them.
+    """
+    return PreparedPlan(expression, optimized)
@@ -1,16 +1,17 @@
 from expression import InfixBinaryOperator
+from .columnar import ColumnarRelation, columnar_product
+from .factorized import FactorizedRelation
 from .relation import Relation
 
 
 @InfixBinaryOperator.decorate(name="\u00d7")
 def product(left_relation: Relation, right_relation: Relation) -> Relation:
-    attributes = left_relation.attributes + right_relation.attributes
-    elements = [
-        left_element + right_element
-        for left_element in left_relation.elements
-        for right_element in right_relation.elements
-    ]
-    return Relation(attributes=attributes, elements=elements)
+    if isinstance(left_relation, ColumnarRelation) and isinstance(right_relation, ColumnarRelation):
+        return columnar_product(left_relation, right_relation)
+
+    # the elements are only concatenated once they are needed, so that the
+    # product can be counted, projected and filtered on each side first
+    return FactorizedRelation.of(left_relation, right_relation)
 
 prod = product
 times = product
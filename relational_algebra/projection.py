@@ -1,36 +1,48 @@
 from typing import Union
 
 from expression import PrefixUnaryOperator
-from .relation import Relation
+from .columnar import ColumnarRelation
+from .factorized import FactorizedRelation
+from .relation import LazyRelation, Relation
 
 
-class Project:
-    def __getitem__(
-            self,
-            idx: Union[int, tuple[int, ...]],
-    ) -> PrefixUnaryOperator[Relation, Relation]:
-        indices = list(idx) if isinstance(idx, tuple) else [idx]
+class Projection:
+    indices: tuple[int, ...]
+    name: str
+
+    def __init__(self, indices: tuple[int, ...]):
         assert all(i > 0 for i in indices)
         assert len(set(indices)) == len(indices) # all indices are distinct
+        self.indices = indices
+        self.name = f"\u03c0[{','.join(f'#{i}' for i in indices)}]"
 
-        name = f"\u03c0[{','.join(f'#{i}' for i in indices)}]"
+    def __call__(self, relation: Relation) -> Relation:
+        call_name = f"{self.name} {relation}"
 
-        def _project(relation: Relation) -> Relation:
-            call_name = f"{name} {relation}"
+        A = relation.num_attributes
+        for i in self.indices:
+            assert 0 < i <= A, \
+                f"{call_name} : index #{i} out of bounds (max {A})"
 
-            A = relation.num_attributes
-            for i in indices:
-                assert 0 < i <= A, \
-                    f"{call_name} : index #{i} out of bounds (max {A})"
+        if isinstance(relation, (ColumnarRelation, FactorizedRelation)):
+            return relation.project_columns([i-1 for i in self.indices])
 
-            attributes = tuple(relation.attributes[i-1] for i in indices)
-            elements = [
-                tuple(element[i-1] for i in indices)
-                for element in relation.elements
-            ]
-            return Relation(attributes=attributes, elements=elements)
+        attributes = tuple(relation.attributes[i-1] for i in self.indices)
+        indices = self.indices
+        return LazyRelation(attributes=attributes, generate=lambda: (
+            tuple(element[i-1] for i in indices)
+            for element in relation
+        ))
 
-        return PrefixUnaryOperator(_project, name=name)
+
+class Project:
+    def __getitem__(
+            self,
+            idx: Union[int, tuple[int, ...]],
+    ) -> PrefixUnaryOperator[Relation, Relation]:
+        indices = idx if isinstance(idx, tuple) else (idx,)
+        projection = Projection(indices)
+        return PrefixUnaryOperator(projection, name=projection.name)
 
 project = Project()
 proj = project
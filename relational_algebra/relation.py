@@ -1,26 +1,88 @@
-from typing import Any, Callable, Iterable, TypeAlias
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Iterable, Iterator, TypeAlias
+from weakref import WeakValueDictionary
+
+if TYPE_CHECKING:
+    from .indexes import Index
+    from .statistics import ColumnStatistics
 
 
 class Attribute:
+    """
+    A set of type names.
+
+    Attributes are interned, so there is exactly one attribute per set of
+    types: equal attributes are the same object, and their hash and name are
+    computed once. An attribute is forgotten once nothing refers to it.
+    """
+    __slots__ = ("types", "_hash", "_name", "__weakref__")
+    _interned: ClassVar["WeakValueDictionary[frozenset[str], Attribute]"] = WeakValueDictionary()
+
     types: frozenset[str]
+    _hash: int
+    _name: str
+
+    def __new__(cls, *types: str) -> "Attribute":
+        return cls._intern(frozenset(types))
 
-    def __init__(self, *types: str):
-        self.types = frozenset(types)
+    @classmethod
+    def _intern(cls, key: frozenset[str]) -> "Attribute":
+        attribute = cls._interned.get(key)
+        if attribute is None:
+            attribute = super().__new__(cls)
+            attribute.types = key
+            attribute._hash = hash(key)
+            attribute._name = "|".join(key)
+            # another thread may have interned the same types in the meantime
+            attribute = cls._interned.setdefault(key, attribute)
+        return attribute
 
     def __str__(self) -> str:
-        return "|".join(self.types)
+        return self._name
 
     def __len__(self) -> int:
         return len(self.types)
 
     def __and__(self, other: "Attribute") -> "Attribute":
-        return Attribute(*(self.types & other.types))
+        return Attribute._intern(self.types & other.types)
 
     def __or__(self, other: "Attribute") -> "Attribute":
-        return Attribute(*(self.types | other.types))
+        return Attribute._intern(self.types | other.types)
 
     def __eq__(self, other: Any) -> bool:
-        return isinstance(other, Attribute) and self.types == other.types
+        return self is other
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # unpickling interns the types again in the receiving process
+        return Attribute, tuple(self.types)
+
+
+Schema: TypeAlias = tuple[Attribute, ...]
+
+# how many schemas to remember, since tuples cannot be referred to weakly
+SCHEMA_CAPACITY = 10_000
+SCHEMAS: dict[Schema, Schema] = {}
+
+def intern_schema(attributes: Schema) -> Schema:
+    """
+    Returns the tuple shared by the relations with these attributes, so that
+    relations with the same schema can usually be told apart by identity.
+    The attributes are checked the first time they are seen.
+    Once there are too many schemas, they are all forgotten, after which
+    equal schemas may be different tuples until they are interned again.
+    """
+    attributes = tuple(attributes)
+    schema = SCHEMAS.get(attributes)
+    if schema is None:
+        assert len(attributes) > 0
+        assert all(len(a) > 0 for a in attributes)
+        if len(SCHEMAS) >= SCHEMA_CAPACITY:
+            SCHEMAS.clear()
+        schema = SCHEMAS.setdefault(attributes, attributes)
+    return schema
 
 
 Element: TypeAlias = tuple[Any, ...]
@@ -28,23 +90,42 @@ Element: TypeAlias = tuple[Any, ...]
 class Relation:
     attributes: tuple[Attribute, ...]
     elements: tuple[Element, ...]
+    indexes: list["Index"]
+    statistics: dict[int, "ColumnStatistics"]
 
     def __init__(
             self,
             attributes: tuple[Attribute, ...],
             elements: Iterable[Element],
     ):
-        assert len(attributes) > 0
-        assert all(len(a) > 0 for a in attributes)
-        self.attributes = attributes
+        self.attributes = intern_schema(attributes)
 
         for element in elements:
             assert len(element) == len(attributes)
         self.elements = tuple(elements)
+        self.indexes = []
+        self.statistics = {}
+
+    @staticmethod
+    def unchecked(attributes: tuple[Attribute, ...], elements: tuple[Element, ...]) -> "Relation":
+        """
+        Builds a relation from elements that are already known to have one
+        value per attribute, such as rows read with a known schema, without
+        checking or copying them one by one.
+        """
+        relation = Relation.__new__(Relation)
+        relation.attributes = intern_schema(attributes)
+        relation.elements = elements
+        relation.indexes = []
+        relation.statistics = {}
+        return relation
 
     def __str__(self) -> str:
         return f"( {' , '.join(str(a) for a in self.attributes)} )"
 
+    def __iter__(self) -> Iterator[Element]:
+        return iter(self.elements)
+
     def __repr__(self) -> str:
         if self.num_elements == 0:
             return str(self)
@@ -68,6 +149,10 @@ class Relation:
     def num_elements(self) -> int:
         return len(self.elements)
 
+    @property
+    def is_materialized(self) -> bool:
+        return True
+
     def __eq__(self, other: Any) -> bool:
         return (
             isinstance(other, Relation)
@@ -75,20 +160,83 @@ class Relation:
             and sorted(self.elements) == sorted(other.elements)
         )
 
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        # a pickled schema is a new tuple, so it is interned again
+        self.__dict__.update(state)
+        self.attributes = intern_schema(self.attributes)
+
     def replace_attribute(self, index: int, attribute: Attribute) -> "Relation":
         """
         Returns a relation where the attribute at index i is replaced with a.
         Generally useful for changing the type of a column.
         """
         attributes = (*self.attributes[:index], attribute, *self.attributes[index+1:])
-        return Relation(attributes=attributes, elements=self.elements)
+        relation = Relation(attributes=attributes, elements=self.elements)
+        # the elements are unchanged, so the indexes and statistics still apply
+        relation.indexes = self.indexes
+        relation.statistics = self.statistics
+        return relation
 
     def filter_elements(self, condition: Callable[[Element], bool]) -> "Relation":
         """
         Filters the elements in this relation set by the given predicate.
+        The elements are only filtered as they are pulled from the result.
         """
-        elements = list(filter(condition, self.elements))
-        return Relation(attributes=self.attributes, elements=elements)
+        return LazyRelation(
+            attributes=self.attributes,
+            generate=lambda: filter(condition, self),
+        )
+
+
+class LazyRelation(Relation):
+    """
+    A relation whose elements are produced on demand by a generator function.
+
+    Iterating over a lazy relation streams its elements straight from the
+    generator without keeping them, so a chain of lazy relations passes each
+    element through every operator before pulling the next one.
+    Accessing elements instead materializes them once and keeps them, after
+    which iteration reads from the materialized elements.
+    """
+    generate: Callable[[], Iterator[Element]]
+
+    def __init__(
+            self,
+            attributes: tuple[Attribute, ...],
+            generate: Callable[[], Iterator[Element]],
+    ):
+        self.attributes = intern_schema(attributes)
+        self.generate = generate
+        self.indexes = []
+        self.statistics = {}
+
+    @cached_property
+    def elements(self) -> tuple[Element, ...]: # type: ignore
+        return tuple(self.generate())
+
+    def __iter__(self) -> Iterator[Element]:
+        if self.is_materialized:
+            return iter(self.elements)
+        return self.generate()
+
+    @property
+    def is_materialized(self) -> bool:
+        return "elements" in self.__dict__
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # the generator cannot be pickled, so pickle the materialized elements
+        relation = Relation(attributes=self.attributes, elements=self.elements)
+        relation.indexes = self.indexes
+        relation.statistics = self.statistics
+        reduced = relation.__reduce__()
+        assert isinstance(reduced, tuple)
+        return reduced
+
+    def replace_attribute(self, index: int, attribute: Attribute) -> Relation:
+        if self.is_materialized:
+            return super().replace_attribute(index, attribute)
+        attributes = (*self.attributes[:index], attribute, *self.attributes[index+1:])
+        return LazyRelation(attributes=attributes, generate=self.__iter__)
 
 
 class ConstantRelation(Relation):
@@ -107,6 +255,47 @@ class ConstantRelation(Relation):
         return repr(self.value)
 
 
+class Parameter(Relation):
+    """
+    A placeholder for a base relation of a prepared plan, with the attributes
+    of the relations that will be bound to it.
+    Its own elements, if any, are a sample of those relations, which the
+    optimizer plans for but which never reach a result.
+    """
+    name: str
+
+    def __init__(
+            self,
+            name: str,
+            attributes: tuple[Attribute, ...],
+            elements: Iterable[Element] = (),
+    ):
+        super().__init__(attributes=attributes, elements=elements)
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class ConstantParameter(ConstantRelation):
+    """
+    A placeholder for a constant in the conditions of a prepared plan, whose
+    value is bound when the plan is executed.
+    Its own value, if any, is a sample that the optimizer plans for.
+    """
+    name: str
+
+    def __init__(self, name: str, attribute: Attribute, value: Any = None):
+        super().__init__(attribute, value)
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return self.name
+
+
 def record_id(relation_name: str) -> Attribute:
     return Attribute(f"{relation_name}.rid")
 
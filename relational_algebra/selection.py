@@ -1,8 +1,130 @@
-from typing import Union
+from functools import cached_property
+from typing import Any, Callable, Union
 
 from expression import PrefixUnaryOperator
-from .filter import Condition, get_condition_name, resolve_argument
-from .relation import Relation
+from expression.compare import equals
+from .columnar import ColumnarRelation
+from .factorized import FactorizedRelation
+from .filter import (
+    ColumnTypes,
+    Condition,
+    compile_filter,
+    get_condition_name,
+    order_by_selectivity,
+    resolve_argument,
+)
+from .indexes import search_indexes
+from .join import ThetaJoin
+from .relation import Element, Relation
+
+
+class Selection:
+    conditions: tuple[Condition, ...]
+    name: str
+
+    def __init__(self, conditions: tuple[Condition, ...]):
+        self.conditions = conditions
+        self.name = f"\u03c3[{','.join(get_condition_name(c) for c in conditions)}]"
+
+    @cached_property
+    def predicate(self) -> Callable[[Element], bool]:
+        return compile_filter(self.conditions)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the compiled predicate cannot be pickled, but can be compiled again
+        state = self.__dict__.copy()
+        state.pop("predicate", None)
+        return state
+
+    def __call__(self, relation: Relation) -> Relation:
+        call_name = f"{self.name} {relation}"
+
+        types = ColumnTypes(right_attributes=relation.attributes)
+        for k, condition in enumerate(self.conditions):
+            condition_name = f"{call_name} condition #{k+1} ({get_condition_name(condition)})"
+            l = condition.left_child.get()
+            r = condition.right_child.get()
+            assert isinstance(l, int) or isinstance(r, int)
+
+            try:
+                resolve_argument(l, right_relation=relation)
+                resolve_argument(r, right_relation=relation)
+            except Exception as e:
+                e.args = (f"{condition_name}:", *e.args)
+                raise
+
+            if condition.operator_name == "=":
+                la, ra = types.get(l), types.get(r)
+                a = types.unify(l, r)
+                assert len(a) > 0, \
+                    f"{condition_name}: incompatible types {la} versus {ra}"
+
+        # the types are known before any element is looked at, so the
+        # elements are filtered once, with every condition
+        relation = types.narrow(relation)
+        if isinstance(relation, FactorizedRelation) and not relation.is_materialized:
+            return self.select_factors(relation)
+
+        if isinstance(relation, ColumnarRelation):
+            # in the order of the compiled predicate, so that the same
+            # conditions are reached as by the row engine
+            for condition in order_by_selectivity(self.conditions):
+                l = condition.left_child.get()
+                r = condition.right_child.get()
+                relation = relation.filter_condition(condition.f, l, r)
+            return relation
+
+        positions = search_indexes(relation, self.conditions)
+        if positions is not None:
+            # only the elements found in the index can satisfy the conditions
+            elements = relation.elements
+            relation = Relation(
+                attributes=relation.attributes,
+                elements=[elements[i] for i in positions],
+            )
+        return relation.filter_elements(self.predicate)
+
+    def select_factors(self, relation: FactorizedRelation) -> Relation:
+        """
+        Filters each factor of a product on the conditions that only look at
+        that factor, and joins neighbouring factors on the conditions that
+        only look at the two of them, so that the product is not built only
+        to be filtered. The remaining conditions filter the product.
+        """
+        local: dict[int, list[Condition]] = {}
+        rest: list[Condition] = []
+        for condition in self.conditions:
+            factors = relation.get_factors(condition)
+            if len(factors) == 1:
+                (factor,) = factors
+                local.setdefault(factor, []).append(relation.localize(condition, factor))
+            else:
+                rest.append(condition)
+        relation = relation.replace_factors({
+            factor: Selection(tuple(conditions))(relation.factors[factor])
+            for factor, conditions in local.items()
+        })
+
+        while True:
+            # only neighbours are joined, which keeps the elements in order
+            pairs: dict[int, list[Condition]] = {}
+            for condition in rest:
+                factors = relation.get_factors(condition)
+                if len(factors) == 2 and max(factors) - min(factors) == 1:
+                    pairs.setdefault(max(factors), []).append(condition)
+            if len(pairs) == 0:
+                break
+            # joins on equalities first, since they are hash joins
+            factor = max(pairs, key=lambda f: any(c.f is equals.f for c in pairs[f]))
+            conditions = pairs[factor]
+            theta_join = ThetaJoin(tuple(relation.localize(c, factor) for c in conditions))
+            joined = theta_join(relation.factors[factor-1], relation.factors[factor])
+            relation = relation.merge_factors(factor, joined)
+            rest = [c for c in rest if all(c is not d for d in conditions)]
+
+        if len(rest) == 0:
+            return relation
+        return relation.filter_elements(compile_filter(rest))
 
 
 class Select:
@@ -10,56 +132,9 @@ class Select:
             self,
             cond: Union[Condition, tuple[Condition, ...]],
     ) -> PrefixUnaryOperator[Relation, Relation]:
-        conditions = list(cond) if isinstance(cond, tuple) else [cond]
-        name = f"\u03c3[{','.join(get_condition_name(c) for c in conditions)}]"
-
-        def _select(relation: Relation) -> Relation:
-            call_name = f"{name} {relation}"
-
-            converged: bool = False
-            while not converged:
-                """
-                If the condition is of the form A = B, then we know that the
-                only remaining values in attributes A and B belong to the type
-                intersection A & B.
-
-                Later, if there is another condition B = C, then we can also
-                transitively deduce that A = C. At the moment, this is handled
-                rather naively by simply running type deduction in a loop until
-                convergence.
-                """
-                converged = True
-                for k, condition in enumerate(conditions):
-                    condition_name = f"{call_name} condition #{k+1} ({get_condition_name(condition)})"
-                    l = condition.left_child.get()
-                    r = condition.right_child.get()
-                    assert isinstance(l, int) or isinstance(r, int)
-
-                    try:
-                        lhs, la = resolve_argument(l, right_relation=relation)
-                        rhs, ra = resolve_argument(r, right_relation=relation)
-                    except Exception as e:
-                        e.args = (f"{condition_name}:", *e.args)
-                        raise
-
-                    if condition.operator_name == "=":
-                        a = la & ra
-                        assert len(a) > 0, \
-                            f"{condition_name}: incompatible types {la} versus {ra}"
-                        if len(a) < len(la) and isinstance(l, int):
-                            converged = False
-                            relation = relation.replace_attribute(index=l-1, attribute=a)
-                        if len(a) < len(ra) and isinstance(r, int):
-                            converged = False
-                            relation = relation.replace_attribute(index=r-1, attribute=a)
-
-                    relation = relation.filter_elements(
-                        lambda element: condition.f(lhs((), element), rhs((), element))
-                    )
-
-            return relation
-
-        return PrefixUnaryOperator(_select, name=name)
+        conditions = cond if isinstance(cond, tuple) else (cond,)
+        selection = Selection(conditions)
+        return PrefixUnaryOperator(selection, name=selection.name)
 
 select = Select()
 sigma = select
@@ -0,0 +1,146 @@
+from functools import cached_property
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator, Union
+
+from expression import InfixBinaryOperator
+from .filter import FLIPPED, Condition, get_condition_name
+from .indexes import get_hash_index, get_sorted_index, search_sorted
+from .join import Bound, ThetaJoin
+from .relation import Element, LazyRelation, Relation
+
+
+# whether a left element matches any element on the right
+Match = Callable[[Element], bool]
+
+
+class SemiJoin:
+    """
+    Keeps the elements on the left that match at least one element on the
+    right (⋉), or, for an anti-join, that match none of them (▷), without
+    ever concatenating the pairs.
+
+    The conditions are the same as those of a join, and are sorted into hash
+    keys, band bounds and residuals in the same way. Each left element stops
+    looking at the first match, and the left elements keep their order and
+    their duplicates.
+    Like a join, a semi-join narrows the types of the left columns compared
+    for equality, while an anti-join keeps the left types as they are, since
+    the elements it keeps matched nothing.
+    """
+    conditions: tuple[Condition, ...]
+    anti: bool
+    name: str
+
+    def __init__(self, conditions: tuple[Condition, ...], anti: bool = False):
+        self.conditions = conditions
+        self.anti = anti
+        symbol = "\u25b7" if anti else "\u22c9"
+        self.name = f"{symbol}[{','.join(get_condition_name(c) for c in conditions)}]"
+
+    @cached_property
+    def theta_join(self) -> ThetaJoin:
+        # plans and compiles the conditions like a join, which keeps them
+        theta_join = ThetaJoin(self.conditions)
+        theta_join.name = self.name # so that errors name the semi-join
+        return theta_join
+
+    def get_match(
+            self,
+            right_relation: Relation,
+            keys: list[tuple[int, int]],
+            bounds: list[Bound],
+            residuals: list[Condition],
+    ) -> Match:
+        """
+        Looks up the right elements that each left element could match in a
+        hash table or an index on the keys, or in the band of a sorted column.
+        """
+        right_elements = right_relation.elements
+        predicate = self.theta_join.get_predicate(residuals)
+
+        if len(keys) > 0:
+            for k, (l, r) in enumerate(keys):
+                hash_index = get_hash_index(right_relation, r+1)
+                if hash_index is not None:
+                    # probe the existing index with the left elements
+                    others = [*keys[:k], *keys[k+1:]]
+                    return lambda left_element: any(
+                        all(left_element[i] == right_elements[p][j] for i, j in others)
+                        and predicate(left_element, right_elements[p])
+                        for p in hash_index.lookup(left_element[l])
+                    )
+            left_key: Callable[[Element], Any] = itemgetter(*(l for l, _ in keys))
+            right_key: Callable[[Element], Any] = itemgetter(*(r for _, r in keys))
+            if len(residuals) == 0:
+                found = {right_key(right_element) for right_element in right_elements}
+                return lambda left_element: left_key(left_element) in found
+            table: dict[Any, list[Element]] = {}
+            for right_element in right_elements:
+                table.setdefault(right_key(right_element), []).append(right_element)
+            return lambda left_element: any(
+                predicate(left_element, right_element)
+                for right_element in table.get(left_key(left_element), ())
+            )
+
+        if len(bounds) > 0 and len({r for _, _, r in bounds}) == 1:
+            # look up the band of right elements of each left element
+            index = bounds[0][2]
+            sorted_index = get_sorted_index(right_relation, index+1)
+            try:
+                order = sorted_index.order if sorted_index is not None else sorted(
+                    range(len(right_elements)), key=lambda i: right_elements[i][index],
+                )
+            except TypeError:
+                pass # the column values cannot be sorted
+            else:
+                sorted_keys = (
+                    sorted_index.keys if sorted_index is not None
+                    else [right_elements[i][index] for i in order]
+                )
+                probes = [(FLIPPED[op], l) for l, op, _ in bounds]
+                def match(left_element: Element) -> bool:
+                    lo, hi = search_sorted(sorted_keys, ((op, left_element[i]) for op, i in probes))
+                    if len(residuals) == 0:
+                        return lo < hi
+                    return any(predicate(left_element, right_elements[i]) for i in order[lo:hi])
+                return match
+
+        # otherwise every condition is checked against every right element
+        everything = self.theta_join.get_predicate(self.conditions)
+        return lambda left_element: any(
+            everything(left_element, right_element)
+            for right_element in right_elements
+        )
+
+    def __call__(self, left_relation: Relation, right_relation: Relation) -> Relation:
+        narrowed, right_relation, keys, bounds, residuals = self.theta_join.plan(left_relation, right_relation)
+        anti = self.anti
+
+        def generate() -> Iterator[Element]:
+            # the right side is looked at once, the left elements stream through
+            match = self.get_match(right_relation, keys, bounds, residuals)
+            left_elements: Iterable[Element] = (
+                left_relation.elements if left_relation.is_materialized else left_relation
+            )
+            return (element for element in left_elements if match(element) != anti)
+
+        attributes = left_relation.attributes if anti else narrowed.attributes
+        return LazyRelation(attributes=attributes, generate=generate)
+
+
+class SemiJoins:
+    anti: bool
+
+    def __init__(self, anti: bool = False):
+        self.anti = anti
+
+    def __getitem__(
+            self,
+            cond: Union[Condition, tuple[Condition, ...]],
+    ) -> InfixBinaryOperator[Relation, Relation, Relation]:
+        conditions = cond if isinstance(cond, tuple) else (cond,)
+        semi_join = SemiJoin(conditions, anti=self.anti)
+        return InfixBinaryOperator(semi_join, name=semi_join.name)
+
+semijoin = SemiJoins()
+antijoin = SemiJoins(anti=True)
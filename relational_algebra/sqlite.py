@@ -0,0 +1,256 @@
+import sqlite3
+from typing import Any, Callable, Optional
+
+from expression import Constant, Expression, InfixBinaryOperation, PrefixUnaryOperation
+from .cache import Identity
+from .filter import OPERATORS, Condition, ConditionArgument
+from .optimize import (
+    get_projection,
+    get_selection,
+    get_semijoin,
+    get_theta_join,
+    is_difference,
+    is_elimination,
+    is_product,
+    is_union,
+)
+from .relation import Attribute, ConstantRelation, LazyRelation, Relation
+
+
+# the values SQLite stores and returns unchanged, unlike bool or tuple
+SQL_TYPES = (type(None), int, float, str, bytes)
+
+# "=" and "≠" use IS so that None equals None, like it does in Python
+SQL_OPERATORS = {"==": "IS", "!=": "IS NOT", "<": "<", ">": ">", "<=": "<=", ">=": ">="}
+
+
+def check_value(value: Any) -> Any:
+    assert isinstance(value, SQL_TYPES) and not isinstance(value, bool), \
+        f"SQLite cannot hold {value!r} of type {type(value).__name__}"
+    return value
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def get_columns(n: int) -> str:
+    return ", ".join(f"c{i+1}" for i in range(n))
+
+
+class TableRelation(LazyRelation):
+    """
+    A relation held in a table of a SQLite database, which SQLiteExecutor
+    reads in place. Evaluating it in Python reads the whole table.
+    """
+    connection: sqlite3.Connection
+    table: str
+    columns: tuple[str, ...]
+
+    def __init__(
+            self,
+            connection: sqlite3.Connection,
+            table: str,
+            attributes: tuple[Attribute, ...],
+            columns: tuple[str, ...],
+    ):
+        assert len(columns) == len(attributes), f"{table}: expected {len(attributes)} columns"
+        query = f"SELECT {', '.join(map(quote, columns))} FROM {quote(table)}"
+        super().__init__(attributes=attributes, generate=lambda: connection.execute(query))
+        self.connection = connection
+        self.table = table
+        self.columns = columns
+
+
+class Query:
+    """
+    The SQL for one expression, built as a common table expression per
+    subtree, with the parameters and functions that it uses.
+    """
+    ctes: list[str]
+    parameters: list[Any]
+    functions: dict[str, Callable[[Any, Any], bool]]
+    names: dict[int, tuple[str, Relation]]
+
+    def __init__(self):
+        self.ctes = []
+        self.parameters = []
+        self.functions = {}
+        self.names = {}
+
+    def add(self, num_attributes: int, sql: str) -> str:
+        name = f"q{len(self.ctes)}"
+        self.ctes.append(f"{name}({get_columns(num_attributes)}) AS ({sql})")
+        return name
+
+    def operand(self, argument: ConditionArgument) -> str:
+        if isinstance(argument, ConstantRelation):
+            self.parameters.append(check_value(argument.value))
+            return "?"
+        if argument < 0:
+            return f"l.c{-argument}"
+        return f"r.c{argument}"
+
+    def condition(self, condition: Condition) -> str:
+        lhs = self.operand(condition.left_child.get())
+        rhs = self.operand(condition.right_child.get())
+        op = OPERATORS.get(condition.f)
+        if op is None:
+            # any other comparison runs as a function registered with SQLite
+            name = f"pyra_f{len(self.functions)}"
+            self.functions[name] = condition.f
+            return f"{name}({lhs}, {rhs})"
+        return f"{lhs} {SQL_OPERATORS[op]} {rhs}"
+
+    def where(self, conditions: tuple[Condition, ...]) -> str:
+        return " AND ".join(f"({self.condition(c)})" for c in conditions)
+
+    @property
+    def sql(self) -> str:
+        return f"WITH {', '.join(self.ctes)} SELECT * FROM q{len(self.ctes) - 1}"
+
+
+class SQLiteExecutor:
+    """
+    Evaluates expressions inside SQLite, by compiling each of them into a
+    single SQL statement.
+
+    Base relations are loaded into temporary tables the first time they are
+    used, with an index for every index they have, and stay there for later
+    queries. Relations from tables already in the database, from table, are
+    read in place. Selections, projections, products, joins, semi-joins,
+    unions, differences and eliminations become SQL, while any other operator is
+    evaluated in Python and its result loaded like a base relation.
+    Custom comparisons are registered with SQLite as functions.
+
+    The result has the same elements and attributes as evaluating the
+    expression in Python, though not necessarily in the same order. Values
+    must be None, int, float, str or bytes.
+    """
+    connection: sqlite3.Connection
+    tables: dict[Identity, str]
+
+    def __init__(self, database: str = ":memory:"):
+        self.connection = sqlite3.connect(database)
+        self.tables = {}
+
+    def __enter__(self) -> "SQLiteExecutor":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def table(self, name: str, attributes: Optional[tuple[Attribute, ...]] = None) -> TableRelation:
+        """
+        Returns a relation for a table in the database, with an attribute per
+        column named after it by default.
+        """
+        columns = tuple(row[1] for row in self.connection.execute(f"PRAGMA table_info({quote(name)})"))
+        assert len(columns) > 0, f"no table {name}"
+        if attributes is None:
+            attributes = tuple(Attribute(column) for column in columns)
+        return TableRelation(self.connection, name, attributes, columns)
+
+    def load(self, relation: Relation) -> str:
+        """
+        Loads the relation into a temporary table, unless it already is.
+        """
+        key = Identity(relation)
+        if key not in self.tables:
+            name = f"pyra_t{len(self.tables)}"
+            A = relation.num_attributes
+            self.connection.execute(f"CREATE TEMP TABLE {name}({get_columns(A)})")
+            self.connection.executemany(
+                f"INSERT INTO {name} VALUES ({', '.join('?' * A)})",
+                (tuple(map(check_value, element)) for element in relation),
+            )
+            for index in relation.indexes:
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name}_c{index.column} ON {name}(c{index.column})"
+                )
+            self.tables[key] = name
+        return self.tables[key]
+
+    def base(self, relation: Relation) -> str:
+        if isinstance(relation, TableRelation) and relation.connection is self.connection:
+            columns = ", ".join(map(quote, relation.columns))
+            return f"SELECT {columns} FROM {quote(relation.table)}"
+        return f"SELECT * FROM {self.load(relation)}"
+
+    def build(self, x: Expression[Relation], query: Query) -> tuple[str, Relation]:
+        """
+        Adds the subtree to the query, returning the name of its table
+        expression and its result on empty relations, which has the same
+        attributes as its actual result.
+        """
+        if id(x) in query.names:
+            return query.names[id(x)]
+
+        children = [self.build(child, query) for child in x.children]
+        names = [name for name, _ in children]
+        empty = [relation for _, relation in children]
+        sql: Optional[str] = None
+        if isinstance(x, Constant):
+            result = Relation(x.value.attributes, ())
+            sql = self.base(x.value)
+        else:
+            assert isinstance(x, (PrefixUnaryOperation, InfixBinaryOperation))
+            # the Python operators check the expression and infer its types
+            result = x.f(*empty)
+            selection = get_selection(x)
+            projection = get_projection(x)
+            theta_join = get_theta_join(x)
+            semi_join = get_semijoin(x)
+            if selection is not None:
+                sql = f"SELECT * FROM {names[0]} AS r WHERE {query.where(selection.conditions)}"
+            elif projection is not None:
+                columns = ", ".join(f"c{i}" for i in projection.indices)
+                sql = f"SELECT {columns} FROM {names[0]}"
+            elif is_elimination(x):
+                sql = f"SELECT DISTINCT * FROM {names[0]}"
+            elif is_product(x):
+                sql = f"SELECT l.*, r.* FROM {names[0]} AS l, {names[1]} AS r"
+            elif theta_join is not None:
+                sql = f"SELECT l.*, r.* FROM {names[0]} AS l JOIN {names[1]} AS r ON {query.where(theta_join.conditions)}"
+            elif semi_join is not None:
+                # the distinct right elements are materialized once, with an
+                # index that SQLite builds itself, rather than scanned per element
+                exists = "NOT EXISTS" if semi_join.anti else "EXISTS"
+                right = f"SELECT DISTINCT * FROM {names[1]}"
+                match = f"SELECT 1 FROM ({right}) AS r WHERE {query.where(semi_join.conditions)}"
+                sql = f"SELECT l.* FROM {names[0]} AS l WHERE {exists} ({match})"
+            elif is_union(x):
+                sql = f"SELECT * FROM {names[0]} UNION ALL SELECT * FROM {names[1]}"
+            elif is_difference(x):
+                # an anti-join, which SQLite runs with an index on the right
+                # side, unlike NOT EXISTS; each left element matches at most
+                # one distinct right element, flagged so that None can match
+                same = " AND ".join(f"r.c{i+1} IS l.c{i+1}" for i in range(result.num_attributes))
+                right = f"SELECT DISTINCT *, 1 AS found FROM {names[1]}"
+                sql = f"SELECT l.* FROM {names[0]} AS l LEFT JOIN ({right}) AS r ON {same} WHERE r.found IS NULL"
+        if sql is None:
+            # evaluated in Python, and loaded like a base relation
+            relation = x.get()
+            result = Relation(relation.attributes, ())
+            sql = self.base(relation)
+
+        name = query.add(result.num_attributes, sql)
+        query.names[id(x)] = (name, result)
+        return name, result
+
+    def compile(self, x: Expression[Relation]) -> Query:
+        """
+        Compiles the expression into a query, loading its base relations.
+        """
+        query = Query()
+        self.build(x, query)
+        return query
+
+    def evaluate(self, x: Expression[Relation]) -> Relation:
+        query = self.compile(x)
+        _, result = query.names[id(x)]
+        for name, f in query.functions.items():
+            self.connection.create_function(name, 2, f, deterministic=True)
+        elements = self.connection.execute(query.sql, query.parameters)
+        return Relation.unchecked(result.attributes, tuple(elements))
@@ -0,0 +1,213 @@
+from bisect import bisect_right
+from collections import Counter
+from math import prod
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from .columnar import ColumnarRelation
+from .filter import OPERATORS, Condition, get_converse, get_selectivity
+from .relation import ConstantRelation, Relation
+
+
+# how many of the most common values to keep, and how many histogram buckets
+MOST_COMMON = 10
+BUCKETS = 10
+
+
+class ColumnStatistics:
+    """
+    Summarizes the values in one column of a relation: how many there are,
+    how many are distinct, the most common ones with their counts, and the
+    bounds of an equi-depth histogram, which split the sorted values into
+    buckets holding equally many values.
+    minimum, maximum and the histogram are missing if the values cannot be
+    sorted, and the distinct values cannot be counted if they cannot be hashed.
+    """
+    count: int
+    distinct: int
+    most_common: dict[Any, int]
+    minimum: Optional[Any]
+    maximum: Optional[Any]
+    bounds: list[Any]
+
+    def __init__(self, values: Sequence[Any]):
+        self.count = len(values)
+        try:
+            counts = Counter(values)
+            self.distinct = len(counts)
+            self.most_common = dict(counts.most_common(MOST_COMMON))
+        except TypeError:
+            self.distinct = self.count
+            self.most_common = {}
+
+        self.minimum = self.maximum = None
+        self.bounds = []
+        try:
+            ordered = sorted(values)
+        except TypeError:
+            return
+        if len(ordered) > 0:
+            self.minimum = ordered[0]
+            self.maximum = ordered[-1]
+            n = len(ordered) - 1
+            self.bounds = [ordered[n * i // BUCKETS] for i in range(BUCKETS+1)]
+
+    def equal_fraction(self, value: Any) -> float:
+        """
+        Estimates the fraction of the values that are equal to the given one.
+        """
+        if self.count == 0:
+            return 0.0
+        if value in self.most_common:
+            return self.most_common[value] / self.count
+        if self.minimum is not None and (value < self.minimum or value > self.maximum):
+            return 0.0
+        # spread the values outside the most common ones evenly
+        rest = self.count - sum(self.most_common.values())
+        rest_distinct = self.distinct - len(self.most_common)
+        return rest / self.count / rest_distinct if rest_distinct > 0 else 0.0
+
+    def below_fraction(self, value: Any) -> Optional[float]:
+        """
+        Estimates the fraction of the values that are less than the given one,
+        interpolating within its histogram bucket.
+        """
+        if len(self.bounds) == 0:
+            return None
+        if value <= self.bounds[0]:
+            return 0.0
+        if value > self.bounds[-1]:
+            return 1.0
+        bucket = min(bisect_right(self.bounds, value) - 1, BUCKETS - 1)
+        lo, hi = self.bounds[bucket], self.bounds[bucket+1]
+        within = 0.5
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (value, lo, hi)) and hi > lo:
+            within = (value - lo) / (hi - lo)
+        return (bucket + within) / BUCKETS
+
+    def compare_fraction(self, op: str, value: Any) -> Optional[float]:
+        """
+        Estimates the fraction of the values v for which "v op value" holds,
+        where op is a Python comparison operator. Returns None if the values
+        cannot be compared with the given one.
+        """
+        try:
+            equal = self.equal_fraction(value)
+            if op == "==":
+                return equal
+            if op == "!=":
+                return 1.0 - equal
+            below = self.below_fraction(value)
+        except TypeError:
+            return None
+        if below is None:
+            return None
+        below_or_equal = min(1.0, below + equal)
+        return {
+            "<": below,
+            "<=": below_or_equal,
+            ">": 1.0 - below_or_equal,
+            ">=": 1.0 - below,
+        }[op]
+
+
+def equal_pair_fraction(left: ColumnStatistics, right: ColumnStatistics) -> float:
+    """
+    Estimates the fraction of the pairs of values from two columns that are
+    equal. Common values shared by both columns are matched exactly, and the
+    rest are assumed to be drawn from the larger of the two sets of distinct
+    values.
+    """
+    if left.count == 0 or right.count == 0:
+        return 0.0
+    matched = 0.0
+    left_rest = right_rest = 1.0
+    shared = 0
+    for value, n in left.most_common.items():
+        m = right.most_common.get(value)
+        if m is not None:
+            matched += (n / left.count) * (m / right.count)
+            left_rest -= n / left.count
+            right_rest -= m / right.count
+            shared += 1
+    distinct = max(left.distinct - shared, right.distinct - shared, 1)
+    return matched + max(0.0, left_rest) * max(0.0, right_rest) / distinct
+
+
+def get_column_values(relation: Relation, column: int) -> Sequence[Any]:
+    if isinstance(relation, ColumnarRelation):
+        return relation.decode(column-1).tolist()
+    return [element[column-1] for element in relation.elements]
+
+def get_statistics(relation: Relation, column: int) -> ColumnStatistics:
+    """
+    Returns the statistics of a column (numbered from 1, like #1) of the
+    relation, building them on first use and keeping them on the relation.
+    """
+    A = relation.num_attributes
+    assert 0 < column <= A, f"index #{column} out of bounds (max {A})"
+    if column not in relation.statistics:
+        relation.statistics[column] = ColumnStatistics(get_column_values(relation, column))
+    return relation.statistics[column]
+
+
+# finds the statistics of the column a condition argument refers to, if known
+StatisticsLookup = Callable[[int], Optional[ColumnStatistics]]
+
+def estimate_selectivity(condition: Condition, lookup: StatisticsLookup) -> float:
+    """
+    Estimates the fraction of elements (or pairs of elements, in a join) that
+    satisfy the condition, from the statistics of the columns it compares.
+    Falls back on a rough guess for custom comparisons and unknown columns.
+    """
+    l = condition.left_child.get()
+    r = condition.right_child.get()
+    if isinstance(l, ConstantRelation) and isinstance(r, int):
+        converse = get_converse(condition)
+        if converse is not None:
+            condition = converse
+            l, r = r, l
+
+    op = OPERATORS.get(condition.f)
+    estimate: Optional[float] = None
+    if op is not None and isinstance(l, int):
+        left_statistics = lookup(l)
+        if left_statistics is None:
+            pass
+        elif isinstance(r, ConstantRelation):
+            estimate = left_statistics.compare_fraction(op, r.value)
+        elif op in ("==", "!="):
+            right_statistics = lookup(r)
+            if right_statistics is not None:
+                estimate = equal_pair_fraction(left_statistics, right_statistics)
+                if op == "!=":
+                    estimate = 1.0 - estimate
+    return get_selectivity(condition) if estimate is None else estimate
+
+def estimate_conditions(conditions: Iterable[Condition], lookup: StatisticsLookup) -> float:
+    """
+    Estimates the fraction kept by all of the conditions, assuming that they
+    are independent.
+    """
+    return prod(estimate_selectivity(condition, lookup) for condition in conditions)
+
+
+def estimate_selection(relation: Relation, conditions: Iterable[Condition]) -> float:
+    """
+    Estimates the number of elements of the relation that a selection on the
+    conditions keeps, from the statistics of the relation.
+    """
+    def lookup(argument: int) -> Optional[ColumnStatistics]:
+        return get_statistics(relation, argument) if argument > 0 else None
+    return relation.num_elements * estimate_conditions(conditions, lookup)
+
+def estimate_join(left_relation: Relation, right_relation: Relation, conditions: Iterable[Condition]) -> float:
+    """
+    Estimates the number of elements in the join of the relations on the
+    conditions, from the statistics of both relations.
+    """
+    def lookup(argument: int) -> Optional[ColumnStatistics]:
+        if argument < 0:
+            return get_statistics(left_relation, -argument)
+        return get_statistics(right_relation, argument)
+    pairs = left_relation.num_elements * right_relation.num_elements
+    return pairs * estimate_conditions(conditions, lookup)
@@ -0,0 +1,241 @@
+import json
+import mmap
+import pickle
+import struct
+from typing import Any, Optional, Sequence, Union, overload
+
+from .columnar import HAS_NUMPY, Column, ColumnarRelation, Dictionary, is_strings, np
+from .relation import Attribute, Relation, intern_schema
+
+
+# A file starts with MAGIC, followed by the length of a JSON header and the
+# header itself. The data of each column follows, aligned to ALIGNMENT bytes,
+# at the offset given by the header relative to the end of the header.
+MAGIC = b"PyRA\x00\x00\x00\x01"
+ALIGNMENT = 64
+
+# a column either holds fixed-width numbers, codes into a sorted dictionary
+# of strings, or pickled Python values for anything else
+FIXED_KINDS = "biuf"
+
+
+def align(n: int) -> int:
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def save(relation: Relation, path: str) -> None:
+    """
+    Writes the relation to a file that load maps back into memory.
+
+    Numbers are stored as fixed-width little-endian arrays, strings as codes
+    into a sorted dictionary of the distinct strings, and columns of other
+    values are pickled. Columns of strings that are already encoded are
+    written as they are. Requires numpy.
+    """
+    columnar = ColumnarRelation.from_relation(relation)
+    segments: list[tuple[int, bytes]] = []
+    size = 0
+    def add(data: Any) -> int:
+        nonlocal size
+        offset = align(size)
+        data = bytes(memoryview(data))
+        segments.append((offset, data))
+        size = offset + len(data)
+        return offset
+
+    def add_dictionary(strings: Dictionary, codes: Column) -> dict[str, Any]:
+        codes = codes.astype("<i4" if len(strings) < 2**31 else "<i8")
+        encoded = [s.encode() for s in strings.tolist()]
+        bounds = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(e) for e in encoded], out=bounds[1:])
+        return {
+            "kind": "dictionary",
+            "dtype": codes.dtype.str,
+            "offset": add(codes),
+            "count": len(encoded),
+            "bounds": add(bounds),
+            "strings": add(b"".join(encoded)),
+        }
+
+    columns: list[dict[str, Any]] = []
+    for i, column in enumerate(columnar.columns):
+        dictionary = columnar.dictionaries[i]
+        if dictionary is not None and not is_strings(dictionary):
+            column, dictionary = columnar.decode(i), None
+        if dictionary is not None:
+            columns.append(add_dictionary(dictionary.astype(str), column))
+        elif column.dtype.kind in FIXED_KINDS:
+            dtype = column.dtype.newbyteorder("<")
+            array = np.ascontiguousarray(column, dtype=dtype)
+            columns.append({"kind": "fixed", "dtype": dtype.str, "offset": add(array)})
+        elif is_strings(column):
+            strings, codes = np.unique(column.astype(str), return_inverse=True)
+            columns.append(add_dictionary(strings, codes))
+        else:
+            data = pickle.dumps(column.tolist(), protocol=pickle.HIGHEST_PROTOCOL)
+            columns.append({"kind": "pickle", "offset": add(data), "size": len(data)})
+
+    header = json.dumps({
+        "num_elements": columnar.num_elements,
+        "attributes": [sorted(a.types) for a in columnar.attributes],
+        "columns": columns,
+    }).encode()
+    start = align(len(MAGIC) + 8 + len(header))
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<Q", len(header)))
+        file.write(header)
+        for offset, data in segments:
+            file.seek(start + offset)
+            file.write(data)
+        file.truncate(start + size)
+
+
+class MappedColumns(Sequence[Column]):
+    """
+    The columns of a mapped file, each of which is only read when it is first
+    used. Numeric columns and the codes of strings are views of the mapped
+    pages, without any copy, and only the dictionaries of the strings are
+    decoded.
+    """
+    buffer: "mmap.mmap"
+    start: int
+    num_elements: int
+    metadata: list[dict[str, Any]]
+    _columns: dict[int, Column]
+    _dictionaries: dict[int, Optional[Dictionary]]
+
+    def __init__(self, buffer: "mmap.mmap", start: int, num_elements: int, metadata: list[dict[str, Any]]):
+        self.buffer = buffer
+        self.start = start
+        self.num_elements = num_elements
+        self.metadata = metadata
+        self._columns = {}
+        self._dictionaries = {}
+
+    def __len__(self) -> int:
+        return len(self.metadata)
+
+    @overload
+    def __getitem__(self, i: int) -> Column: ...
+    @overload
+    def __getitem__(self, i: slice) -> Sequence[Column]: ...
+    def __getitem__(self, i: Union[int, slice]) -> Union[Column, Sequence[Column]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i %= len(self)
+        if i not in self._columns:
+            self._columns[i] = self.read(self.metadata[i])
+        return self._columns[i]
+
+    def view(self, dtype: str, offset: int, count: int) -> Column:
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.start + offset)
+
+    def dictionary(self, i: int) -> Optional[Dictionary]:
+        """
+        Returns the sorted strings that the codes of the column at the given
+        index refer to, or None if the column does not hold strings.
+        """
+        if i not in self._dictionaries:
+            metadata = self.metadata[i]
+            dictionary: Optional[Dictionary] = None
+            if metadata["kind"] == "dictionary":
+                count = metadata["count"]
+                bounds = self.view("<i8", metadata["bounds"], count + 1).tolist()
+                offset = self.start + metadata["strings"]
+                data = self.buffer[offset:offset + bounds[-1]]
+                dictionary = np.array([data[lo:hi].decode() for lo, hi in zip(bounds, bounds[1:])], dtype=str)
+            self._dictionaries[i] = dictionary
+        return self._dictionaries[i]
+
+    def read(self, metadata: dict[str, Any]) -> Column:
+        n = self.num_elements
+        if metadata["kind"] in ("fixed", "dictionary"):
+            return self.view(metadata["dtype"], metadata["offset"], n)
+        offset = self.start + metadata["offset"]
+        values = pickle.loads(self.buffer[offset:offset + metadata["size"]])
+        return np.fromiter(values, dtype=object, count=len(values))
+
+
+class MappedDictionaries(Sequence[Optional[Dictionary]]):
+    """
+    The dictionaries of the columns of a mapped file, each of which is only
+    decoded when it is first used.
+    """
+    columns: MappedColumns
+
+    def __init__(self, columns: MappedColumns):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    @overload
+    def __getitem__(self, i: int) -> Optional[Dictionary]: ...
+    @overload
+    def __getitem__(self, i: slice) -> Sequence[Optional[Dictionary]]: ...
+    def __getitem__(self, i: Union[int, slice]) -> Union[Optional[Dictionary], Sequence[Optional[Dictionary]]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(len(self))[i]]
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return self.columns.dictionary(i % len(self))
+
+
+class MappedRelation(ColumnarRelation):
+    """
+    A columnar relation backed by a file written by save, which is mapped
+    into memory instead of read, so that loading it costs next to nothing and
+    processes that load the same file share its pages.
+    Every columnar operator reads its columns directly, and columns of
+    strings stay encoded as they are in the file.
+    """
+    path: str
+    _num_elements: int
+
+    def __init__(self, path: str, attributes: tuple[Attribute, ...], columns: MappedColumns):
+        assert len(columns) == len(attributes)
+        self.path = path
+        self.attributes = intern_schema(attributes)
+        self.columns = columns
+        self.dictionaries = MappedDictionaries(columns)
+        self._num_elements = columns.num_elements
+        self.indexes = []
+        self.statistics = {}
+
+    @property
+    def num_elements(self) -> int:
+        return self._num_elements
+
+    def replace_attribute(self, index: int, attribute: Attribute) -> "MappedRelation":
+        attributes = (*self.attributes[:index], attribute, *self.attributes[index+1:])
+        assert isinstance(self.columns, MappedColumns)
+        relation = MappedRelation(self.path, attributes, self.columns)
+        relation.statistics = self.statistics
+        return relation
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # other processes map the same file rather than receive a copy of it
+        return load, (self.path, self.attributes)
+
+
+def load(path: str, attributes: Optional[tuple[Attribute, ...]] = None) -> MappedRelation:
+    """
+    Maps a file written by save into memory as a relation, optionally with
+    different attributes of the same types.
+    """
+    assert HAS_NUMPY, "loading a relation requires numpy"
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    assert buffer[:len(MAGIC)] == MAGIC, f"{path} is not a relation file"
+    (length,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+    header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + length])
+    start = align(len(MAGIC) + 8 + length)
+    columns = MappedColumns(buffer, start, header["num_elements"], header["columns"])
+    if attributes is None:
+        attributes = tuple(Attribute(*types) for types in header["attributes"])
+    return MappedRelation(path, attributes, columns)
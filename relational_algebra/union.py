@@ -1,5 +1,7 @@
+from itertools import chain
+
 from expression import InfixBinaryOperator
-from .relation import Relation
+from .relation import LazyRelation, Relation
 
 
 @InfixBinaryOperator.decorate(name="\u222a")
@@ -11,10 +13,15 @@ def union(left_relation: Relation, right_relation: Relation) -> Relation:
     assert lA == rA, \
         f"{name} : relations have different arities ({lA} versus {rA})"
 
-    attributes = tuple(la | ra for la, ra in zip(left_relation.attributes, right_relation.attributes))
-    elements = left_relation.elements + right_relation.elements
+    if left_relation.attributes is right_relation.attributes:
+        attributes = left_relation.attributes
+    else:
+        attributes = tuple(la | ra for la, ra in zip(left_relation.attributes, right_relation.attributes))
 
-    return Relation(attributes=attributes, elements=elements)
+    return LazyRelation(
+        attributes=attributes,
+        generate=lambda: chain(left_relation, right_relation),
+    )
 
 U = union
 u = union